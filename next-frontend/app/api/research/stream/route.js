@@ -21,7 +21,11 @@ export async function POST(req) {
 
     if (!fastapiRes.ok) {
       const errorText = await fastapiRes.text();
-      return new NextResponse(errorText, { status: fastapiRes.status });
+      const retryAfter = fastapiRes.headers.get('retry-after');
+      return new NextResponse(errorText, {
+        status: fastapiRes.status,
+        headers: retryAfter ? { 'Retry-After': retryAfter } : {},
+      });
     }
 
     // Create a readable stream from the FastAPI response
@@ -49,6 +53,7 @@ export async function POST(req) {
         'Content-Type': 'text/plain',
         'Cache-Control': 'no-cache',
         'Connection': 'keep-alive',
+        'X-Queue-Position': fastapiRes.headers.get('x-queue-position') || '0',
       },
     });
   } catch (error) {
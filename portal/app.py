@@ -279,43 +279,92 @@ def register_students_page():
     except Exception as e:
         st.error(f"Error: {e}")
 
+def index_writer_request(method, url, attempts=20):
+    """Call a knowledge base update endpoint, retrying while it lands on a server worker that does not write the index"""
+    import time
+    for _ in range(attempts - 1):
+        response = requests.request(method, url)
+        if response.status_code != 503:
+            return response
+        # Each retry is a new connection, which may be accepted by another worker
+        time.sleep(0.05)
+    return requests.request(method, url)
+
 def update_knowledge_base_page():
     st.subheader("📚 Updating Knowledge Base")
-    uploaded = st.session_state.get("uploaded_files_session", [])
-    edited = st.session_state.get("edited_files_session", [])
-    deleted = st.session_state.get("deleted_files_session", [])
-    st.write(f"**New Uploads**: {uploaded}")
-    st.write(f"**Edited Metadata**: {edited}")
-    st.write(f"**Deleted Files**: {deleted}")
-    progress_bar = st.progress(0)
+    # The server compares the documents directory against its manifest of indexed files,
+    # so changes made in earlier sessions or copied in by other means are included
+    try:
+        response = index_writer_request("GET", "http://localhost:8000/update_knowledge_base/changes")
+        changes = response.json() if response.status_code == 200 else None
+        if changes is None:
+            st.error(f"Error scanning documents: {response.text}")
+    except Exception as e:
+        st.error(f"Error connecting to FastAPI server: {e}")
+        changes = None
+    if changes is not None:
+        st.write(f"**New Uploads**: {changes['new_files']}")
+        st.write(f"**Changed Files**: {changes['updated_files']}")
+        st.write(f"**Deleted Files**: {changes['deleted_files']}")
     if st.button("Run Update Now", key="run_update_btn"):
         try:
-            import time
-            with st.spinner("Updating knowledge base..."):
-                progress_bar.progress(10)
-                response = requests.post(
-                    "http://localhost:8000/update_knowledge_base",
-                    json={
-                        "new_files": uploaded,
-                        "updated_files": edited,
-                        "deleted_files": deleted
-                    }
-                )
-                progress_bar.progress(90)
-                time.sleep(0.2)
-                        
-                if response.status_code == 200:
-                    st.success("✅ Knowledge base updated successfully!")
-                    st.session_state.uploaded_files_session = []
-                    st.session_state.edited_files_session = []
-                    st.session_state.deleted_files_session = []
-                    progress_bar.progress(100)
-                else:
-                    st.error(f"Error updating knowledge base: {response.text}")
-                    progress_bar.progress(0)
+            response = index_writer_request("POST", "http://localhost:8000/update_knowledge_base/scan")
+            if response.status_code == 202:
+                st.session_state.ingestion_job_id = response.json()["job_id"]
+                st.session_state.uploaded_files_session = []
+                st.session_state.edited_files_session = []
+                st.session_state.deleted_files_session = []
+            elif response.status_code == 200:
+                st.info("Knowledge base is already up to date.")
+            else:
+                st.error(f"Error updating knowledge base: {response.text}")
         except Exception as e:
             st.error(f"Error connecting to FastAPI server: {e}")
-            progress_bar.progress(0)
+
+    job_id = st.session_state.get("ingestion_job_id")
+    if job_id:
+        show_ingestion_progress(job_id)
+
+def show_ingestion_progress(job_id):
+    """Poll the server for a background update job and show per-stage and per-file progress"""
+    import time
+    job_url = f"http://localhost:8000/update_knowledge_base/jobs/{job_id}"
+    if st.button("Cancel Update", key="cancel_update_btn"):
+        try:
+            index_writer_request("POST", f"{job_url}/cancel")
+        except Exception as e:
+            st.error(f"Error connecting to FastAPI server: {e}")
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    files_table = st.empty()
+    while True:
+        try:
+            response = index_writer_request("GET", job_url)
+        except Exception as e:
+            st.error(f"Error connecting to FastAPI server: {e}")
+            return
+        if response.status_code != 200:
+            st.error(f"Error fetching update status: {response.text}")
+            st.session_state.ingestion_job_id = None
+            return
+        job = response.json()
+        progress_bar.progress(int(job["progress"] * 100))
+        stage = job["stage"] or "waiting"
+        if job["stage"] == "ingesting" and job["chunks_total"]:
+            stage += f" ({job['chunks_embedded']}/{job['chunks_total']} chunks)"
+        status_text.write(f"**Status:** {job['status']} — {stage}")
+        files_table.table([{"File": file, "State": state} for file, state in job["files"].items()])
+        if job["status"] == "completed":
+            st.success("✅ Knowledge base updated successfully!")
+            break
+        if job["status"] == "cancelled":
+            st.warning("Knowledge base update cancelled.")
+            break
+        if job["status"] == "failed":
+            st.error(f"Error updating knowledge base: {job['error']}")
+            break
+        time.sleep(0.5)
+    st.session_state.ingestion_job_id = None
 
 if st.session_state.page == "Home":
     homepage()
@@ -0,0 +1,138 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _file_key(file_name: str) -> str:
+    """Cited documents are tracked by file_name metadata, which has no .pdf extension"""
+    return file_name[:-4] if file_name.endswith(".pdf") else file_name
+
+class CachedAnswer:
+    """A generated RAG answer with the scope and documents it was produced from"""
+
+    def __init__(self, vector: np.ndarray, department: str, semester: str, version: int,
+                 answer: str, sources: List[dict]):
+        self.vector = vector
+        self.department = department
+        self.semester = semester
+        self.version = version
+        self.answer = answer
+        self.sources = sources
+        self.files = {_file_key(source["filename"]) for source in sources}
+        self.created_at = time.monotonic()
+        self.hits = 0
+
+class SemanticAnswerCache:
+    """Answers to earlier questions, reused for questions with nearly the same embedding.
+
+    Entries are scoped by department, semester and knowledge base version. Changing a document
+    drops the entries that cited it; the survivors are carried over to the next index version.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl: float = 86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._scopes: Dict[Tuple[str, str], List[int]] = {}
+        self._matrices: Dict[Tuple[str, str], np.ndarray] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        # Bumped whenever documents change, so answers generated across a change are not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        scope = (entry.department, entry.semester)
+        self._scopes[scope].remove(entry_id)
+        self._matrices.pop(scope, None)
+
+    def lookup(self, vector, department: str, semester: str, version: int) -> Optional[CachedAnswer]:
+        """Best cached answer in scope whose question is at least threshold-similar, or None"""
+        vector = self._normalize(vector)
+        scope = (department, semester)
+        with self._lock:
+            ids = self._scopes.get(scope)
+            if not ids:
+                self.misses += 1
+                return None
+            matrix = self._matrices.get(scope)
+            if matrix is None:
+                matrix = self._matrices[scope] = np.stack([self._entries[entry_id].vector for entry_id in ids])
+            similarities = matrix @ vector
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.threshold:
+                    break
+                entry_id = ids[position]
+                entry = self._entries[entry_id]
+                if time.monotonic() - entry.created_at > self.ttl:
+                    continue
+                if entry.version != version:
+                    continue
+                self._entries.move_to_end(entry_id)
+                entry.hits += 1
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def store(self, vector, department: str, semester: str, version: int, generation: int,
+              answer: str, sources: List[dict]) -> bool:
+        """Cache an answer unless the documents changed while it was being generated"""
+        with self._lock:
+            if generation != self.generation:
+                return False
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = CachedAnswer(self._normalize(vector), department, semester, version, answer, sources)
+            self._entries[entry_id] = entry
+            scope = (department, semester)
+            self._scopes.setdefault(scope, []).append(entry_id)
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def invalidate_files(self, file_names: Iterable[str]):
+        """Drop every answer that cited one of these documents"""
+        files = {_file_key(file_name) for file_name in file_names}
+        if not files:
+            return
+        with self._lock:
+            self.generation += 1
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry.files & files]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+        if stale:
+            logger.info(f"Answer cache: dropped {len(stale)} answers citing {len(files)} changed documents")
+
+    def set_version(self, old_version: int, new_version: int):
+        """Carry answers from old_version over to a newly saved index version"""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.version == old_version:
+                    entry.version = new_version
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidated": self.invalidations,
+        }
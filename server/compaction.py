@@ -0,0 +1,145 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+from .config import SEGMENT_MAX_DELTAS, SEGMENT_REBUILD_RATIO, TOMBSTONE_RATIO
+from .index_engine import build_index, describe_index, reconstruct_all, target_spec
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_FILE_TEMPLATE = "segment-{name}.faiss"
+TOMBSTONE_FILE_TEMPLATE = "tombstones-{version:06d}.npy"
+# Merged segments are written under a temporary name until they are swapped into the store
+PENDING_SUFFIX = ".tmp"
+
+class Segment:
+    """One immutable index file of the knowledge base, mapped read-only and shared by snapshots"""
+
+    def __init__(self, file_name: str, index):
+        self.file_name = file_name
+        self.index = index
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+def new_segment_file() -> str:
+    """Unique segment file name, so a merge never collides with a concurrent save"""
+    return SEGMENT_FILE_TEMPLATE.format(name=uuid.uuid4().hex)
+
+def plan_compaction(segments: List[Segment], tombstones: int) -> Optional[Tuple[List[Segment], bool]]:
+    """(segments to merge, whether the merge is a full rebuild), or None if nothing needs merging.
+
+    The first segment is the base, trained as the configured index type; later ones are small
+    flat deltas. The base is rebuilt with the deltas folded in once they reach
+    SEGMENT_REBUILD_RATIO of its size, once TOMBSTONE_RATIO of stored vectors are deleted, or
+    when the corpus size calls for another index type. Otherwise deltas are only merged with
+    each other once there are more than SEGMENT_MAX_DELTAS of them.
+    """
+    if not segments:
+        return None
+    base, deltas = segments[0], segments[1:]
+    stored = sum(segment.ntotal for segment in segments)
+    live = stored - tombstones
+    delta_total = sum(segment.ntotal for segment in deltas)
+    if (
+        (deltas and delta_total >= SEGMENT_REBUILD_RATIO * base.ntotal)
+        or (tombstones and tombstones >= TOMBSTONE_RATIO * stored)
+        or (live > 0 and describe_index(base.index) != target_spec(live, base.index.d))
+    ):
+        return segments, True
+    if len(deltas) > SEGMENT_MAX_DELTAS:
+        return deltas, False
+    return None
+
+def merge_segments(path: str, segments: List[Segment], tombstones: Iterable[int], full: bool
+                   ) -> Tuple[Optional[str], Set[int]]:
+    """Write the live vectors of segments as one new segment; returns (file name, tombstones applied).
+
+    Segments are read from a private copy of their files, never the mapped indexes shared with
+    queries. A full merge is trained as the index type for the merged size, a partial one stays
+    flat. The file is left under a temporary name for the caller to swap in; the name is None
+    when every vector was deleted.
+    """
+    tombstones = np.fromiter(tombstones, dtype=np.int64)
+    dim = segments[0].index.d
+    kept_ids, kept_vectors, applied = [], [], set()
+    for segment in segments:
+        ids, vectors = reconstruct_all(faiss.read_index(os.path.join(path, segment.file_name)))
+        deleted = np.isin(ids, tombstones)
+        applied.update(int(chunk_id) for chunk_id in ids[deleted])
+        kept_ids.append(ids[~deleted])
+        kept_vectors.append(vectors[~deleted])
+    ids = np.concatenate(kept_ids)
+    if len(ids) == 0:
+        return None, applied
+    spec = target_spec(len(ids), dim) if full else "Flat"
+    index = build_index(np.concatenate(kept_vectors), spec, ids, dim=dim)
+    file_name = new_segment_file()
+    faiss.write_index(index, os.path.join(path, file_name + PENDING_SUFFIX))
+    logger.info(f"Merged {len(segments)} segments into {spec} segment {file_name} "
+                f"({len(ids)} vectors, {len(applied)} deletions applied)")
+    return file_name, applied
+
+class Compactor:
+    """Runs segment compaction on a background task whenever it is requested.
+
+    request() may be called from any thread. Requests that arrive while a compaction is
+    running coalesce into one follow-up run, which checks again whether anything is left
+    to merge.
+    """
+
+    def __init__(self, compact_fn: Callable[[], bool], executor=None):
+        self.compact_fn = compact_fn
+        self.executor = executor
+        self.compactions = 0
+        self.duration = Histogram([0.1, 0.5, 1, 5, 10, 30, 60, 300])
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._requested: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._loop = asyncio.get_event_loop()
+        self._requested = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    def request(self):
+        """Ask for a compaction pass; safe to call from executor threads"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._requested.set)
+
+    async def _run(self):
+        while True:
+            await self._requested.wait()
+            self._requested.clear()
+            started = time.perf_counter()
+            try:
+                merged = await self._loop.run_in_executor(self.executor, self.compact_fn)
+            except Exception as e:
+                logger.error(f"Segment compaction failed: {e}")
+                continue
+            if merged:
+                self.compactions += 1
+                self.duration.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "compactions": self.compactions,
+            "pending": bool(self._requested and self._requested.is_set()),
+            "duration_seconds": self.duration.snapshot(),
+        }
@@ -9,16 +9,119 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DOCUMENTS_DIR = os.path.join(BASE_DIR, "documents")
 FAISS_INDEX_PATH = "faiss_index"
 EMBED_CACHE_PATH = "embed_cache"
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float32")  # float16 halves the cache size
+DOCUMENT_MANIFEST_FILE = "documents.json"  # size/mtime/hash of every indexed document, kept in FAISS_INDEX_PATH
+DOCUMENTS_WATCH = os.getenv("DOCUMENTS_WATCH", "false").lower() == "true"  # poll DOCUMENTS_DIR and ingest changes
+DOCUMENTS_WATCH_INTERVAL = float(os.getenv("DOCUMENTS_WATCH_INTERVAL", "30"))  # seconds between polls
+DOCUMENTS_SETTLE_SECONDS = 5  # files modified more recently may still be copying and wait for the next poll
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "5"))  # seconds between index version checks in workers that do not write it
 
 # Document Processing
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 128
 BATCH_SIZE = 16
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))  # PDF parsing processes
+INGEST_BATCH_SIZE = 256  # chunks embedded and added to the index per pipeline step
+INGEST_QUEUE_SIZE = 4  # parsed batches buffered ahead of the embedding stage
+INGEST_CHECKPOINT_CHUNKS = 5000  # save the index after this many new chunks
+EMBED_TOKEN_BUDGET = int(os.getenv("EMBED_TOKEN_BUDGET", "4096"))  # padded tokens per embedding forward pass
+EMBED_MAX_BATCH_SIZE = 128
+EMBED_AUTO_TUNE = os.getenv("EMBED_AUTO_TUNE", "false").lower() == "true"  # measure the best budget on first ingest
+QUERY_CACHE_MAX_MB = int(os.getenv("QUERY_CACHE_MAX_MB", "16"))  # memory cap of the question -> embedding cache
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))  # seconds
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "16"))  # most questions embedded in one forward pass
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))  # how long a question waits for others to join
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine needed to reuse an answer
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+
+# Query Classification
+QUERY_EXEMPLARS_PATH = os.path.join(BASE_DIR, "server", "query_exemplars.json")  # labelled GENERAL/RAG queries
+QUERY_EVAL_PATH = os.path.join(BASE_DIR, "server", "query_eval.jsonl")  # held-out set for python -m server.query_classifier
+# Cosine margin between the GENERAL and RAG centroids below which Ollama classifies instead.
+# Unset by default, so Ollama classifies every query keywords do not settle; set it from
+# python -m server.query_classifier run against the exemplars and embedding model in use
+QUERY_CLASSIFIER_MIN_MARGIN = float(os.getenv("QUERY_CLASSIFIER_MIN_MARGIN")) if os.getenv("QUERY_CLASSIFIER_MIN_MARGIN") else None
+
+# Vector Index Configuration
+# auto picks Flat -> IVF-Flat -> IVF-SQ8 as the corpus grows; flat, ivf_flat, hnsw, ivf_sq8, ivf_pq force a type
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto").lower()
+IVF_THRESHOLD = int(os.getenv("IVF_THRESHOLD", "50000"))  # chunks before auto switches from Flat to IVF-Flat
+SQ8_THRESHOLD = int(os.getenv("SQ8_THRESHOLD", "1000000"))  # chunks before auto switches to IVF-SQ8
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+PQ_SUBVECTOR_DIM = 8  # IVF-PQ uses one sub-quantizer per 8 dimensions (48 for MiniLM's 384)
+# Updates are saved as small delta segments and tombstones; a background compactor merges them
+SEGMENT_MAX_DELTAS = int(os.getenv("SEGMENT_MAX_DELTAS", "8"))  # delta segments before they are merged together
+SEGMENT_REBUILD_RATIO = float(os.getenv("SEGMENT_REBUILD_RATIO", "0.25"))  # delta size vs base that triggers a rebuild
+TOMBSTONE_RATIO = float(os.getenv("TOMBSTONE_RATIO", "0.2"))  # share of deleted vectors that triggers a rebuild
+
+# Thread Pool Configuration
+# Chat-path work and ingestion run on separate pools; torch threads are shared by both embedding pools
+CPU_COUNT = os.cpu_count() or 4
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", str(max(1, CPU_COUNT // 2))))
+QUERY_EMBED_THREADS = int(os.getenv("QUERY_EMBED_THREADS", "1"))  # the query batcher already coalesces questions
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "1"))  # cross-encoder scoring, off the query embedding pool
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", str(max(2, CPU_COUNT // 2))))
+SEARCH_OMP_THREADS = 1  # FAISS OpenMP threads per search thread
+INGEST_THREADS = int(os.getenv("INGEST_THREADS", "1"))  # document embedding and index updates
+INGEST_OMP_THREADS = int(os.getenv("INGEST_OMP_THREADS", str(max(1, CPU_COUNT // 2))))  # FAISS training/adds
+COMPACTION_THREADS = 1  # segment merges, kept off the ingestion pool so they never hold up an update
+
+# Hybrid Retrieval Configuration
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # fuse BM25 keyword hits with dense results
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")  # rrf (reciprocal rank fusion) or weighted
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "0.5"))  # dense share of the fused score
+HYBRID_CANDIDATES = 20  # candidates taken from each retriever before fusion
+RRF_K = 60
+
+# Reranking Configuration
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))  # chunks retrieved for the cross-encoder to reorder
+RERANK_TIME_BUDGET = float(os.getenv("RERANK_TIME_BUDGET", "0.25"))  # seconds before falling back to dense order
+RERANK_CACHE_SIZE = 10000  # cached (question, chunk) scores
 
 # Models
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Embedding runtime: torch (full precision), onnx, or onnx_int8 (dynamically quantized ONNX, fastest on CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_EXPORT_PATH = "onnx_models"
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")  # avx2, avx512, avx512_vnni or arm64
+# ONNX backends fall back to torch when any parity sentence's cosine similarity drops below this
+EMBEDDING_PARITY_MIN_SIMILARITY = float(os.getenv("EMBEDDING_PARITY_MIN_SIMILARITY", "0.98"))
 MODEL_NAME = "llama3.2:latest"
 
+# Ollama Client Configuration
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Comma-separated Ollama servers calls are balanced over; defaults to OLLAMA_BASE_URL alone
+OLLAMA_BACKENDS = [url.strip() for url in os.getenv("OLLAMA_BACKENDS", OLLAMA_BASE_URL).split(",") if url.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))  # seconds between /api/tags probes
+OLLAMA_PROBE_FAILURES = 3  # consecutive failed probes before a backend is taken out of rotation
+OLLAMA_BREAKER_FAILURES = 3  # consecutive failures that take a backend out of rotation
+OLLAMA_BREAKER_COOLDOWN = 30  # seconds before a failed backend gets a trial call
+OLLAMA_TIMEOUT = 600  # seconds for a whole non-streaming call
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))  # seconds a stream may go without a chunk
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_CONNECT_RETRIES = 2  # retries when Ollama refuses the connection, with exponential backoff
+OLLAMA_RETRY_BACKOFF = 0.5  # seconds before the first retry
+OLLAMA_POOL_SIZE = 20  # pooled keep-alive connections shared by chat, classification and research
+OLLAMA_POOL_SIZE_PER_HOST = 10
+
+# LLM Admission Control
+# Calls Ollama runs at once; the sum of OLLAMA_NUM_PARALLEL over OLLAMA_BACKENDS
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "4"))
+LLM_PRIORITIES = ["classification", "chat", "research"]  # a freed slot goes to the first waiting workload
+LLM_CONCURRENCY = {
+    "classification": int(os.getenv("LLM_CLASSIFICATION_CONCURRENCY", "2")),
+    "chat": int(os.getenv("LLM_CHAT_CONCURRENCY", "3")),
+    "research": int(os.getenv("LLM_RESEARCH_CONCURRENCY", "1")),
+}
+LLM_QUEUE_LIMITS = {"classification": 64, "chat": 32, "research": 4}  # queued calls beyond these get 429
+LLM_MAX_WAIT = {"classification": 5, "chat": 30, "research": 120}  # seconds; longer expected waits get 503
+
 # Research Agent Configuration
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 RESEARCH_MODE_ENABLED = os.getenv("RESEARCH_MODE_ENABLED", "true").lower() == "true"
@@ -37,6 +140,22 @@ RESEARCH_PLAN_TEMPERATURE = 0.3
 RESEARCH_SYNTHESIS_TEMPERATURE = 0.4
 GPU_LAYERS = 50
 
+# Per-call Ollama options
+CHAT_OPTIONS = {"temperature": CHAT_TEMPERATURE, "num_ctx": CHAT_CONTEXT_SIZE, "num_gpu": GPU_LAYERS}
+RESEARCH_PLAN_OPTIONS = {
+    "temperature": RESEARCH_PLAN_TEMPERATURE, "num_ctx": RESEARCH_PLAN_CONTEXT_SIZE, "num_gpu": GPU_LAYERS
+}
+RESEARCH_SYNTHESIS_OPTIONS = {
+    "temperature": RESEARCH_SYNTHESIS_TEMPERATURE, "num_ctx": RESEARCH_CONTEXT_SIZE, "num_gpu": GPU_LAYERS
+}
+# Model per workload; a backend only gets calls for models it has pulled
+LLM_MODELS = {
+    "classification": os.getenv("CLASSIFICATION_MODEL", MODEL_NAME),
+    "chat": os.getenv("CHAT_MODEL", MODEL_NAME),
+    "research": os.getenv("RESEARCH_MODEL", MODEL_NAME),
+}
+CLASSIFICATION_OPTIONS = {"temperature": 0.1, "num_predict": 5, "top_k": 1, "top_p": 0.1, "num_ctx": 512}
+
 # Prompts
 SYSTEM_PROMPT = """
 You are Uni-Q, an expert, friendly assistant for university students and faculty. Your primary responsibility 
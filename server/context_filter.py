@@ -0,0 +1,150 @@
+import logging
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _as_list(value) -> List[str]:
+    """Normalize a departments/semesters metadata value to a list of names"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [item.strip() for item in value if item and item.strip()]
+
+class EligibleTier:
+    """Chunks carrying all of some department/semester tags, with the FAISS selector over them.
+
+    Built once per student context and reused by every query until the filter changes, so a
+    query never copies or intersects the corpus-sized id sets.
+    """
+
+    def __init__(self, tags: Dict[str, str], ids: FrozenSet[int]):
+        self.tags = tags
+        self.ids = ids
+        self._selector = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def selector(self):
+        """IDSelectorBatch over the tier's ids, built on first use"""
+        if self._selector is None:
+            self._selector = faiss.IDSelectorBatch(np.fromiter(self.ids, dtype=np.int64, count=len(self.ids)))
+        return self._selector
+
+class ContextFilterIndex:
+    """Maps departments and semesters to the ids of the chunks tagged with them,
+    so retrieval can restrict the vector search to chunks a student is eligible for."""
+
+    def __init__(self):
+        self.by_department: Dict[str, Set[int]] = {}
+        self.by_semester: Dict[str, Set[int]] = {}
+        # Id sets this filter may change in place; the rest are shared with copies
+        self._owned: Set[Tuple[str, str]] = set()
+        # (department, semester) -> tiers; cleared whenever a chunk is registered or dropped
+        self._tiers: Dict[Tuple[Optional[str], Optional[str]], List[EligibleTier]] = {}
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "ContextFilterIndex":
+        """Build the filter from the stored metadata of every chunk in the store's version (chunk text is not read)"""
+        context_filter = cls()
+        if vectorstore is None:
+            return context_filter
+        for chunk_id, metadata in vectorstore.chunks.iter_metadata():
+            if vectorstore.has_chunk(chunk_id):
+                context_filter.add(chunk_id, metadata)
+        logger.info(f"Built context filter over {vectorstore.ntotal} chunks "
+                    f"({len(context_filter.by_department)} departments, {len(context_filter.by_semester)} semesters)")
+        return context_filter
+
+    def copy(self) -> "ContextFilterIndex":
+        """Copy for updating a new snapshot while queries read this one.
+
+        The id sets are shared, not copied, so a copy costs one entry per department and
+        semester; whichever side then changes a set first replaces it with its own copy.
+        """
+        clone = ContextFilterIndex()
+        clone.by_department = dict(self.by_department)
+        clone.by_semester = dict(self.by_semester)
+        self._owned.clear()
+        return clone
+
+    def _writable(self, kind: str, key: str) -> Set[int]:
+        """The id set of a department or semester, copied first if it is shared"""
+        index = self.by_department if kind == "department" else self.by_semester
+        ids = index.get(key)
+        if ids is None or (kind, key) not in self._owned:
+            ids = index[key] = set(ids or ())
+            self._owned.add((kind, key))
+        return ids
+
+    def add(self, chunk_id: int, metadata: dict):
+        """Register a chunk under its departments and semesters"""
+        self._tiers.clear()
+        for department in _as_list(metadata.get("departments")):
+            self._writable("department", department).add(chunk_id)
+        for semester in _as_list(metadata.get("semesters")):
+            self._writable("semester", semester).add(chunk_id)
+
+    def remove(self, chunk_id: int, metadata: dict):
+        """Unregister a chunk from its departments and semesters"""
+        self._tiers.clear()
+        for department in _as_list(metadata.get("departments")):
+            if chunk_id in self.by_department.get(department, ()):
+                self._writable("department", department).discard(chunk_id)
+        for semester in _as_list(metadata.get("semesters")):
+            if chunk_id in self.by_semester.get(semester, ()):
+                self._writable("semester", semester).discard(chunk_id)
+
+    def discard(self, chunk_ids):
+        """Unregister chunks without needing their metadata"""
+        chunk_ids = set(chunk_ids)
+        self._tiers.clear()
+        for kind, index in (("department", self.by_department), ("semester", self.by_semester)):
+            for key, ids in list(index.items()):
+                if not ids.isdisjoint(chunk_ids):
+                    self._writable(kind, key).difference_update(chunk_ids)
+
+    def eligibility_tiers(self, student_context: dict) -> List[EligibleTier]:
+        """Eligible chunks in priority order: department and semester, department only, semester only"""
+        department = student_context.get('department')
+        semester = student_context.get('semester')
+        tiers = self._tiers.get((department, semester))
+        if tiers is None:
+            department_ids = frozenset(self.by_department.get(department, ()))
+            semester_ids = frozenset(self.by_semester.get(semester, ()))
+            tiers = [
+                EligibleTier({"department": department, "semester": semester}, department_ids & semester_ids),
+                EligibleTier({"department": department}, department_ids),
+                EligibleTier({"semester": semester}, semester_ids),
+            ]
+            self._tiers[(department, semester)] = tiers
+        return tiers
+
+    def search(self, vectorstore, query: str, query_vector, student_context: dict, k: int = 3) -> List:
+        """Return up to k documents best matching the query, searching only eligible chunks.
+
+        Tiers are searched in order and later tiers only fill the remaining slots,
+        mirroring the department (+3) / semester (+2) preference of filter_documents_by_context.
+        A later tier contains the chunks already taken, so it is asked for that many more
+        results and they are skipped, rather than subtracted from the tier.
+        """
+        seen: Set[int] = set()
+        ids = []
+        for tier in self.eligibility_tiers(student_context):
+            remaining = k - len(ids)
+            if remaining <= 0:
+                break
+            if len(tier) <= len(seen & tier.ids):
+                continue
+            for chunk_id, _ in vectorstore.hybrid_search(query, query_vector, remaining + len(seen), eligible=tier):
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                ids.append(chunk_id)
+                if len(ids) == k:
+                    break
+        return vectorstore.get_documents(ids)
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HASH_BYTES = 16
+READ_BLOCK = 1 << 20
+
+def file_hash(path: str) -> str:
+    """Content hash of a file, read in blocks so large PDFs are never held in memory"""
+    digest = hashlib.blake2b(digest_size=HASH_BYTES)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DocumentManifest:
+    """Size, mtime and content hash of every PDF and metadata CSV the knowledge base was built from.
+
+    scan() compares the documents directory against it and returns the exact new, changed
+    and deleted files. A file is only hashed when its size or mtime differs from the record,
+    so a scan of an unchanged directory costs one stat per file. Entries are recorded once
+    ingestion has published a file, so files that failed are found again by the next scan.
+    """
+
+    def __init__(self, path: str, documents_dir: str):
+        self.path = path
+        self.documents_dir = documents_dir
+        self.files: Dict[str, dict] = {}
+        self.exists = os.path.exists(path)
+        self._lock = threading.Lock()
+        if self.exists:
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)["files"]
+            logger.info(f"Document manifest: {len(self.files)} files")
+
+    def _paths(self, file: str) -> Dict[str, str]:
+        return {
+            "pdf": os.path.join(self.documents_dir, file),
+            "metadata": os.path.join(self.documents_dir, file.replace('.pdf', '.csv')),
+        }
+
+    def observe(self, file: str) -> Optional[dict]:
+        """Current state of a PDF and its metadata CSV, or None if either is missing.
+
+        Hashes are carried over from the record while size and mtime are unchanged.
+        """
+        recorded = self.files.get(file) or {}
+        entry = {}
+        for kind, path in self._paths(file).items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            known = recorded.get(kind)
+            if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                entry[kind] = known
+            else:
+                entry[kind] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash(path)}
+        return entry
+
+    def observe_files(self, files: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """observe() for several files, taken before ingestion so a file edited meanwhile is seen as changed"""
+        with self._lock:
+            return {file: self.observe(file) for file in files}
+
+    def metadata_only(self, file: str, current: Optional[dict]) -> bool:
+        """Whether only the metadata CSV of an indexed file changed, with the PDF content as recorded"""
+        recorded = self.files.get(file)
+        if not recorded or not current or "pdf" not in recorded:
+            return False
+        return (current["pdf"]["hash"] == recorded["pdf"]["hash"]
+                and current["metadata"]["hash"] != recorded.get("metadata", {}).get("hash"))
+
+    def scan(self, min_age: float = 0) -> Dict[str, List[str]]:
+        """new_files / updated_files / deleted_files needed to bring the knowledge base in line with the directory.
+
+        Files modified less than min_age seconds ago are left for a later scan, since they may
+        still be being copied in. Records whose hashes still match are refreshed in place.
+        """
+        changes = {"new_files": [], "updated_files": [], "deleted_files": []}
+        now = time.time()
+        started = time.perf_counter()
+        present = set()
+        with self._lock:
+            refreshed = False
+            for file in sorted(os.listdir(self.documents_dir)):
+                if not file.endswith(".pdf"):
+                    continue
+                present.add(file)
+                paths = self._paths(file).values()
+                if not all(os.path.exists(path) for path in paths):
+                    continue
+                if any(now - os.path.getmtime(path) < min_age for path in paths):
+                    continue
+                recorded = self.files.get(file)
+                current = self.observe(file)
+                if current is None:
+                    continue
+                if recorded is None:
+                    changes["new_files"].append(file)
+                elif any(current[kind]["hash"] != recorded.get(kind, {}).get("hash") for kind in current):
+                    changes["updated_files"].append(file)
+                elif current != recorded:
+                    # Touched or copied without changing content
+                    self.files[file] = current
+                    refreshed = True
+            changes["deleted_files"] = sorted(file for file in self.files if file not in present)
+            if refreshed:
+                self._save()
+        logger.info(f"Scanned {len(present)} documents in {time.perf_counter() - started:.2f}s: "
+                    f"{len(changes['new_files'])} new, {len(changes['updated_files'])} changed, "
+                    f"{len(changes['deleted_files'])} deleted")
+        return changes
+
+    def update(self, indexed: Dict[str, dict], removed: Iterable[str]):
+        """Record files that were published to the index and forget removed ones"""
+        removed = list(removed)
+        if not indexed and not removed:
+            return
+        with self._lock:
+            self.files.update(indexed)
+            for file in removed:
+                self.files.pop(file, None)
+            self._save()
+
+    def adopt(self, indexed_names: Iterable[str]):
+        """Seed a missing manifest from an existing index instead of re-ingesting every document.
+
+        Files whose chunks are already indexed are recorded as they are now; indexed names
+        with no file on disk are recorded empty so the next scan reports them as deleted.
+        """
+        with self._lock:
+            for name in indexed_names:
+                if not name:
+                    continue
+                file = f"{name}.pdf"
+                self.files[file] = self.observe(file) or {}
+            self._save()
+        logger.info(f"Document manifest adopted {len(self.files)} indexed files")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+class DocumentWatcher:
+    """Polls the documents directory and queues an update whenever the manifest scan finds changes.
+
+    Polling keeps this dependency-free and works on network shares where filesystem events are
+    not delivered; an unchanged directory costs one stat per file per poll. Scans are skipped
+    while an update is queued or running, since its files are not recorded yet.
+    """
+
+    def __init__(self, manifest: DocumentManifest, submit: Callable[[Dict[str, List[str]]], None],
+                 busy: Callable[[], bool], interval: float, settle: float, executor=None):
+        self.manifest = manifest
+        self.submit = submit
+        self.busy = busy
+        self.interval = interval
+        self.settle = settle
+        self.executor = executor
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.busy():
+                continue
+            try:
+                changes = await loop.run_in_executor(self.executor, self.manifest.scan, self.settle)
+            except Exception as e:
+                logger.error(f"Documents scan failed: {e}")
+                continue
+            if any(changes.values()) and not self.busy():
+                self.submit(changes)
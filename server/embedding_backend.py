@@ -0,0 +1,121 @@
+import os
+import logging
+
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx_int8")
+
+# Sentences the ONNX backend is checked against torch on
+PARITY_SENTENCES = [
+    "What is the syllabus for Data Structures in semester 3?",
+    "Explain the difference between TCP and UDP.",
+    "When is the last date to pay the examination fee?",
+    "Module 2 covers normalization, functional dependencies and BCNF.",
+    "hello",
+    "The attendance requirement for appearing in the university examination is 75 percent, "
+    "and students below it must apply for condonation through the department.",
+]
+
+def _quantized_file_name(quantization: str) -> str:
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+def export_onnx_model(model_name: str, export_dir: str, quantization: str = None) -> str:
+    """Export model_name to ONNX under export_dir (plus a dynamic int8 copy); returns the model dir"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    model_dir = os.path.join(export_dir, model_name.replace("/", "_"))
+    onnx_path = os.path.join(model_dir, "onnx", "model.onnx")
+    if not os.path.exists(onnx_path):
+        logger.info(f"Exporting {model_name} to ONNX at {model_dir}")
+        SentenceTransformer(model_name, device="cpu", backend="onnx").save(model_dir)
+    if quantization and not os.path.exists(os.path.join(model_dir, _quantized_file_name(quantization))):
+        logger.info(f"Quantizing {model_name} ONNX graph to int8 ({quantization})")
+        model = SentenceTransformer(model_dir, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(model, quantization, model_dir)
+    return model_dir
+
+def load_embeddings(model_name: str, backend: str = "torch", device: str = "cpu", batch_size: int = 16,
+                    export_dir: str = "onnx_models", quantization: str = "avx2") -> HuggingFaceEmbeddings:
+    """HuggingFaceEmbeddings for model_name running on the selected backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    encode_kwargs = {"normalize_embeddings": True, "batch_size": batch_size}
+    if backend == "torch":
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device, "trust_remote_code": False},
+            encode_kwargs=encode_kwargs
+        )
+
+    quantize = quantization if backend == "onnx_int8" else None
+    model_dir = export_onnx_model(model_name, export_dir, quantize)
+    file_name = _quantized_file_name(quantize) if quantize else "onnx/model.onnx"
+    return HuggingFaceEmbeddings(
+        model_name=model_dir,
+        model_kwargs={
+            "device": "cpu",
+            "trust_remote_code": False,
+            "backend": "onnx",
+            "model_kwargs": {"file_name": file_name}
+        },
+        encode_kwargs=encode_kwargs
+    )
+
+def sentence_transformer(embeddings: HuggingFaceEmbeddings):
+    """The SentenceTransformer behind embeddings, for callers that plan their own encode() batches"""
+    from sentence_transformers import SentenceTransformer
+
+    # langchain-huggingface keeps the model in a private attribute (public "client" before 0.1)
+    model = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None)
+    if not isinstance(model, SentenceTransformer):
+        raise TypeError(f"{type(embeddings).__name__} does not expose its SentenceTransformer")
+    return model
+
+def parity_check(reference: HuggingFaceEmbeddings, candidate: HuggingFaceEmbeddings,
+                 texts=PARITY_SENTENCES) -> float:
+    """Lowest cosine similarity between the two models' vectors for the same texts"""
+    expected = np.asarray(reference.embed_documents(list(texts)), dtype=np.float32)
+    actual = np.asarray(candidate.embed_documents(list(texts)), dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    similarities = np.sum(expected * actual, axis=1)
+    logger.info(f"Embedding parity: mean cosine {similarities.mean():.4f}, min {similarities.min():.4f}")
+    return float(similarities.min())
+
+def load_checked_embeddings(model_name: str, backend: str, device: str, batch_size: int, export_dir: str,
+                            quantization: str, min_similarity: float = None):
+    """Load the selected backend, falling back to torch if it fails to load or drifts from it.
+
+    Returns (embeddings, backend actually in use). min_similarity=None skips the parity check.
+    """
+    if backend == "torch":
+        return load_embeddings(model_name, "torch", device, batch_size), "torch"
+    try:
+        embeddings = load_embeddings(model_name, backend, device, batch_size, export_dir, quantization)
+    except Exception as e:
+        logger.error(f"Could not load {backend} embedding backend, using torch: {e}")
+        return load_embeddings(model_name, "torch", device, batch_size), "torch"
+
+    if min_similarity is not None:
+        reference = load_embeddings(model_name, "torch", "cpu", batch_size)
+        similarity = parity_check(reference, embeddings)
+        if similarity < min_similarity:
+            logger.error(f"{backend} embeddings drift from torch (min cosine {similarity:.4f} < "
+                         f"{min_similarity}), using torch")
+            return reference, "torch"
+    logger.info(f"Using {backend} embedding backend for {model_name}")
+    return embeddings, backend
+
+if __name__ == "__main__":
+    # python -m server.embedding_backend onnx_int8 -- report parity of a backend against torch
+    import sys
+    from .config import EMBEDDING_MODEL, ONNX_EXPORT_PATH, ONNX_QUANTIZATION
+
+    logging.basicConfig(level=logging.INFO)
+    backend = sys.argv[1] if len(sys.argv) > 1 else "onnx_int8"
+    reference = load_embeddings(EMBEDDING_MODEL, "torch")
+    candidate = load_embeddings(EMBEDDING_MODEL, backend, export_dir=ONNX_EXPORT_PATH, quantization=ONNX_QUANTIZATION)
+    print(f"{backend} vs torch: min cosine similarity {parity_check(reference, candidate):.4f}")
@@ -0,0 +1,102 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 16
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.bin"
+FORMAT_FILE = "format"  # "<dim> <dtype>", fixed when the cache is created
+
+class EmbeddingCache:
+    """Content-addressed cache of chunk embeddings.
+
+    Each chunk is keyed by a hash of its text, the embedding model and the chunk settings, so
+    unchanged chunks hit the cache no matter which batch or file they arrive in, and edited
+    chunks miss it. Vectors are appended to a raw float32/float16 array file and keys to a
+    parallel fixed-width key file; both are memory-mapped for lookups.
+    """
+
+    def __init__(self, cache_path: str, model_name: str, chunk_size: int, chunk_overlap: int, dtype: str = "float32"):
+        self.directory = os.path.join(cache_path, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.salt = f"{model_name}|{chunk_size}|{chunk_overlap}|".encode("utf-8")
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self._rows: Dict[bytes, int] = None
+        self._vectors = None
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> bytes:
+        """Cache key for one chunk"""
+        return hashlib.blake2b(self.salt + text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+    def _load(self):
+        """Map the key and vector files and index keys by row"""
+        self._rows = {}
+        keys_path = os.path.join(self.directory, KEYS_FILE)
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        if not os.path.exists(keys_path) or not os.path.exists(vectors_path):
+            return
+        with open(os.path.join(self.directory, FORMAT_FILE), "r") as f:
+            dim, dtype = f.read().split()
+        self.dim, self.dtype = int(dim), np.dtype(dtype)
+        row_bytes = self.dim * self.dtype.itemsize
+        count = min(os.path.getsize(keys_path) // KEY_BYTES, os.path.getsize(vectors_path) // row_bytes)
+        # A crash between the two appends can leave one file longer; drop the incomplete tail
+        for path, size in ((keys_path, count * KEY_BYTES), (vectors_path, count * row_bytes)):
+            if os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        keys = np.memmap(keys_path, dtype=f"V{KEY_BYTES}", mode="r") if count else []
+        self._rows = {bytes(keys[row]): row for row in range(count)}
+        self._map_vectors(count)
+        logger.info(f"Embedding cache: {count} vectors in {self.directory}")
+
+    def _map_vectors(self, count: int):
+        """(Re)map the first count rows of the vector file"""
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r", shape=(count, self.dim)) if count else None
+
+    def _append(self, keys: List[bytes], vectors: np.ndarray):
+        """Append new rows to the vector file, then the key file"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(os.path.join(self.directory, FORMAT_FILE), "w") as f:
+                f.write(f"{self.dim} {self.dtype.name}")
+        start = len(self._rows)
+        with open(os.path.join(self.directory, VECTORS_FILE), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        with open(os.path.join(self.directory, KEYS_FILE), "ab") as f:
+            f.write(b"".join(keys))
+        for offset, key in enumerate(keys):
+            self._rows[key] = start + offset
+        self._map_vectors(len(self._rows))
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """Embeddings for texts in order, calling embed_fn only for chunks not in the cache"""
+        with self._lock:
+            if self._rows is None:
+                self._load()
+
+            keys = [self.key(text) for text in texts]
+            missing: Dict[bytes, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+
+            logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} to embed")
+            if missing:
+                new_vectors = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+                self._append(list(missing.keys()), new_vectors)
+
+            if not texts:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+            return np.asarray(self._vectors[rows], dtype=np.float32)
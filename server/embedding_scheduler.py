@@ -0,0 +1,113 @@
+import time
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Token budgets tried by auto-tune (padded tokens per forward pass)
+AUTO_TUNE_BUDGETS = [512, 1024, 2048, 4096, 8192, 16384]
+AUTO_TUNE_SAMPLE = 128
+
+def normalize_text(text: str) -> str:
+    """The preprocessing HuggingFaceEmbeddings applies before encode(), so both give the same vectors"""
+    return text.replace("\n", " ")
+
+class EmbeddingScheduler:
+    """Length-bucketed batching for document embedding.
+
+    Chunks are sorted by token length and packed into batches whose padded size
+    (longest chunk x batch size) stays within a token budget, so short chunks are not padded
+    to the length of long ones. Results are returned in the original order. With auto_tune,
+    the first large enough call measures throughput for several budgets on a sample of its own
+    chunks and keeps the fastest for this CPU.
+
+    Batches go straight to the SentenceTransformer's encode(), one forward pass each; going
+    through embed_documents() would split them again by its own fixed batch size.
+    """
+
+    def __init__(self, model, encode_kwargs: Optional[dict] = None, token_budget: int = 4096,
+                 max_batch_size: int = 128, auto_tune: bool = False):
+        self.model = model
+        # The batch size of each encode() call comes from the plan
+        self.encode_kwargs = {key: value for key, value in (encode_kwargs or {}).items() if key != "batch_size"}
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.auto_tune_pending = auto_tune
+        self._tune_lock = threading.Lock()
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Token count per text (characters / 4 when no tokenizer is available)"""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [max(len(text) // 4, 1) for text in texts]
+        max_length = getattr(self.model, "max_seq_length", 512)
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def plan_batches(self, lengths: List[int], token_budget: Optional[int] = None) -> List[List[int]]:
+        """Group text indices into batches by padded token budget, shortest texts first"""
+        token_budget = token_budget or self.token_budget
+        batches = []
+        current: List[int] = []
+        for index in np.argsort(lengths, kind="stable"):
+            # Sorted ascending, so this text is the longest in the batch so far
+            padded = lengths[index] * (len(current) + 1)
+            if current and (padded > token_budget or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+            current.append(int(index))
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed one planned batch in a single forward pass"""
+        vectors = self.model.encode(batch, batch_size=len(batch), show_progress_bar=False, **self.encode_kwargs)
+        return np.asarray(vectors).tolist()
+
+    def _embed_with_budget(self, texts: List[str], lengths: List[int], token_budget: int) -> List[List[float]]:
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for batch in self.plan_batches(lengths, token_budget):
+            for index, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[index] = vector
+        return vectors
+
+    def auto_tune(self, texts: List[str], lengths: List[int]):
+        """Pick the token budget with the best tokens/sec on a sample of texts"""
+        sample = list(range(0, len(texts), max(len(texts) // AUTO_TUNE_SAMPLE, 1)))[:AUTO_TUNE_SAMPLE]
+        sample_texts = [texts[i] for i in sample]
+        sample_lengths = [lengths[i] for i in sample]
+        total_tokens = sum(sample_lengths)
+        # Warm up once so the first candidate does not pay model initialization
+        self._embed_with_budget(sample_texts[:8], sample_lengths[:8], self.token_budget)
+
+        best_budget, best_rate = self.token_budget, 0.0
+        for budget in AUTO_TUNE_BUDGETS:
+            start = time.perf_counter()
+            self._embed_with_budget(sample_texts, sample_lengths, budget)
+            rate = total_tokens / max(time.perf_counter() - start, 1e-9)
+            logger.info(f"Embedding auto-tune: budget {budget} -> {rate:.0f} tokens/sec")
+            if rate > best_rate:
+                best_budget, best_rate = budget, rate
+        self.token_budget = best_budget
+        logger.info(f"Embedding auto-tune selected a token budget of {best_budget}")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in length-bucketed batches, returning vectors in input order"""
+        if not texts:
+            return []
+        texts = [normalize_text(text) for text in texts]
+        lengths = self.token_lengths(texts)
+        if self.auto_tune_pending and len(texts) >= AUTO_TUNE_SAMPLE:
+            with self._tune_lock:
+                if self.auto_tune_pending:
+                    self.auto_tune(texts, lengths)
+                    self.auto_tune_pending = False
+        start = time.perf_counter()
+        vectors = self._embed_with_budget(texts, lengths, self.token_budget)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Embedded {len(texts)} chunks ({sum(lengths)} tokens) in {elapsed:.2f}s")
+        return vectors
@@ -0,0 +1,97 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+def _set_omp_threads(threads: int):
+    """OpenMP thread count is per calling thread, so each pool thread sets its own for FAISS"""
+    try:
+        import faiss
+        faiss.omp_set_num_threads(threads)
+    except ImportError:
+        pass
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """Thread pool that reports its queue depth, busy threads and queue wait"""
+
+    def __init__(self, name: str, max_workers: int, omp_threads: int = None):
+        super().__init__(
+            max_workers=max_workers,
+            thread_name_prefix=name,
+            initializer=_set_omp_threads if omp_threads else None,
+            initargs=(omp_threads,) if omp_threads else ()
+        )
+        self.name = name
+        self.size = max_workers
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.queue_wait = Histogram([0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5])
+        self._counts_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted = time.perf_counter()
+        with self._counts_lock:
+            self.queued += 1
+
+        def run():
+            self.queue_wait.observe(time.perf_counter() - submitted)
+            with self._counts_lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._counts_lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        return super().submit(run)
+
+    def stats(self) -> dict:
+        return {
+            "threads": self.size,
+            "queue_depth": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+        }
+
+def configure_torch_threads(threads: int):
+    """Cap torch intra-op threads (process-wide) so embedding calls do not oversubscribe the CPU"""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    # For runtimes that read OpenMP settings when they start (e.g. onnxruntime)
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    logger.info(f"Torch intra-op threads: {threads}")
+
+def create_executors(query_embed_threads: int, search_threads: int, ingest_threads: int,
+                     search_omp_threads: int = 1, ingest_omp_threads: int = None,
+                     compaction_threads: int = 1, rerank_threads: int = 1) -> Dict[str, InstrumentedExecutor]:
+    """Separate pools so a large ingestion cannot starve live chat retrieval.
+
+    Search threads run single queries, where FAISS gains nothing from OpenMP, so they get one
+    OpenMP thread each and parallelism comes from the pool; ingestion threads keep more for
+    index training and bulk adds.
+    """
+    return {
+        # Question embedding (model inference on the chat path, batched by the query batcher)
+        "query_embedding": InstrumentedExecutor("query-embed", query_embed_threads),
+        # Cross-encoder reranking, so a slow rerank never holds up the next question's embedding
+        "rerank": InstrumentedExecutor("rerank", rerank_threads),
+        # FAISS / BM25 search and chunk lookups
+        "search": InstrumentedExecutor("search", search_threads, omp_threads=search_omp_threads),
+        # Document embedding, index updates and saves
+        "ingest": InstrumentedExecutor("ingest", ingest_threads, omp_threads=ingest_omp_threads),
+        # Background merges of index segments
+        "compaction": InstrumentedExecutor("compaction", compaction_threads, omp_threads=ingest_omp_threads),
+    }
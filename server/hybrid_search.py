@@ -0,0 +1,79 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Words that match nearly every chunk; dropping them keeps postings lists short
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "was", "what", "when", "where", "which", "who",
+    "why", "with", "you", "about", "tell", "explain", "give", "please", "there", "this", "that",
+}
+
+# Same word definition as the FTS5 unicode61 tokenizer: runs of letters and digits
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def query_terms(text: str) -> List[str]:
+    """Distinct lowercase query terms, without stopwords"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        token = token.strip("_")
+        if token and token not in STOPWORDS and token not in terms:
+            terms.append(token)
+    return terms
+
+def fts_query(text: str) -> Optional[str]:
+    """FTS5 MATCH expression for a free-text question (None when nothing is searchable).
+
+    Terms are OR-ed so BM25 ranks chunks by how many rare terms they contain, and adjacent
+    terms are also added as a phrase so "IPO cycle" outranks chunks that merely mention both words.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return None
+    clauses = [f'"{term}"' for term in terms]
+    if len(terms) > 1:
+        clauses.append('"' + " ".join(terms) + '"')
+    return " OR ".join(clauses)
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], weights: Sequence[float] = None,
+                           k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: score(id) = sum of weight / (k + rank), best first"""
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] += weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def _min_max(scores: Dict[int, float]) -> Dict[int, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {chunk_id: 1.0 for chunk_id in scores}
+    return {chunk_id: (score - low) / (high - low) for chunk_id, score in scores.items()}
+
+def weighted_fusion(dense: Sequence[Tuple[int, float]], lexical: Sequence[Tuple[int, float]],
+                    dense_weight: float = 0.5) -> List[Tuple[int, float]]:
+    """Fuse (id, L2 distance) and (id, BM25 score) lists by a weighted sum of min-max normalized scores"""
+    dense_scores = _min_max({chunk_id: -distance for chunk_id, distance in dense})
+    lexical_scores = _min_max(dict(lexical))
+    scores: Dict[int, float] = defaultdict(float)
+    for chunk_id, score in dense_scores.items():
+        scores[chunk_id] += dense_weight * score
+    for chunk_id, score in lexical_scores.items():
+        scores[chunk_id] += (1.0 - dense_weight) * score
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def fuse(dense: Sequence[Tuple[int, float]], lexical: Sequence[Tuple[int, float]], method: str = "rrf",
+         dense_weight: float = 0.5, rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """Combine dense and lexical results with the configured fusion method"""
+    if not lexical:
+        return [(chunk_id, -distance) for chunk_id, distance in dense]
+    if method == "weighted":
+        return weighted_fusion(dense, lexical, dense_weight)
+    return reciprocal_rank_fusion(
+        [[chunk_id for chunk_id, _ in dense], [chunk_id for chunk_id, _ in lexical]],
+        [dense_weight, 1.0 - dense_weight],
+        rrf_k
+    )
@@ -0,0 +1,157 @@
+import math
+import logging
+from typing import Iterable, Tuple
+
+import faiss
+import numpy as np
+from faiss.contrib.inspect_tools import get_invlist
+
+from .config import (
+    INDEX_TYPE, IVF_THRESHOLD, SQ8_THRESHOLD, IVF_NPROBE, HNSW_M,
+    HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, PQ_SUBVECTOR_DIM
+)
+
+logger = logging.getLogger(__name__)
+
+# FAISS needs roughly 39 training points per IVF list
+MIN_POINTS_PER_LIST = 39
+MIN_NLIST = 64
+
+def ivf_nlist(ntotal: int) -> int:
+    """Number of IVF lists for a corpus size, rounded to a power of two so it only changes when the corpus ~4x's"""
+    nlist = 2 ** round(math.log2(max(4 * math.sqrt(max(ntotal, 1)), 1)))
+    return max(nlist, MIN_NLIST)
+
+def target_spec(ntotal: int, dim: int, index_type: str = INDEX_TYPE) -> str:
+    """FAISS index_factory string the index should have for the given corpus size"""
+    if index_type == "flat" or ntotal == 0:
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}"
+
+    nlist = ivf_nlist(ntotal)
+    if ntotal < nlist * MIN_POINTS_PER_LIST:
+        # Not enough vectors to train IVF yet
+        return "Flat"
+
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{max(dim // PQ_SUBVECTOR_DIM, 1)}"
+
+    # auto
+    if ntotal >= SQ8_THRESHOLD:
+        return f"IVF{nlist},SQ8"
+    if ntotal >= IVF_THRESHOLD:
+        return f"IVF{nlist},Flat"
+    return "Flat"
+
+def _base_index(index):
+    """The downcast index underneath an optional IndexIDMap2 wrapper"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def describe_index(index) -> str:
+    """Inverse of target_spec for an existing index"""
+    index = _base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return f"HNSW{index.hnsw.nb_neighbors(1)}"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return f"IVF{index.nlist},Flat"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return f"IVF{index.nlist},SQ8"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return f"IVF{index.nlist},PQ{index.pq.M}"
+    if isinstance(index, faiss.IndexFlat):
+        return "Flat"
+    return type(index).__name__
+
+def configure_index(index):
+    """Apply the configured search-time parameters (nprobe / efSearch) to an index"""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = IVF_NPROBE
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+def search_parameters(index, selector=None):
+    """Per-query search parameters matching the index type, optionally restricted to an IDSelector"""
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=IVF_NPROBE)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=HNSW_EF_SEARCH)
+    return faiss.SearchParameters(sel=selector)
+
+def build_index(vectors: np.ndarray, spec: str, ids: np.ndarray = None, dim: int = None):
+    """Create, train and fill an index of the given factory spec, keyed by chunk ids.
+
+    IVF indexes store ids natively; Flat and HNSW are wrapped in IndexIDMap2.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dim = dim or vectors.shape[1]
+    if ids is None:
+        ids = np.arange(len(vectors), dtype=np.int64)
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not isinstance(base, faiss.IndexIVF):
+        index = faiss.IndexIDMap2(index)
+    if not index.is_trained:
+        logger.info(f"Training {spec} index on {len(vectors)} vectors")
+        index.train(vectors)
+    if len(vectors):
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    return configure_index(index)
+
+def empty_index(dim: int):
+    """An empty flat index, the in-memory delta that new chunks are added to until the next save"""
+    return build_index(np.zeros((0, dim), dtype=np.float32), "Flat", dim=dim)
+
+def index_ids(index) -> np.ndarray:
+    """Every chunk id stored in an index"""
+    wrapper = faiss.downcast_index(index)
+    if isinstance(wrapper, faiss.IndexIDMap2):
+        return faiss.vector_to_array(wrapper.id_map).astype(np.int64)
+    ivf = faiss.extract_index_ivf(index)
+    lists = [get_invlist(ivf.invlists, list_no)[0] for list_no in range(ivf.nlist)]
+    return np.concatenate(lists).astype(np.int64) if lists else np.zeros(0, dtype=np.int64)
+
+def reconstruct_all(index) -> Tuple[np.ndarray, np.ndarray]:
+    """Read every (id, vector) pair back out of an index"""
+    if index.ntotal == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, index.d), dtype=np.float32)
+    wrapper = faiss.downcast_index(index)
+    if isinstance(wrapper, faiss.IndexIDMap2):
+        return index_ids(index), wrapper.index.reconstruct_n(0, index.ntotal)
+    # IVF indexes need a (hashtable, since ids are not sequential) direct map to reconstruct
+    ivf = faiss.extract_index_ivf(index)
+    ids = index_ids(index)
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        return ids, index.reconstruct_batch(ids)
+    finally:
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+def remove_ids(index, ids: Iterable[int]):
+    """Remove chunk ids from an index.
+
+    HNSW cannot remove vectors, so it is reset and refilled with the remaining vectors.
+    """
+    ids = np.fromiter(set(ids), dtype=np.int64)
+    if len(ids) == 0:
+        return index
+    if not isinstance(_base_index(index), faiss.IndexHNSW):
+        index.remove_ids(faiss.IDSelectorBatch(ids))
+        return index
+    all_ids, vectors = reconstruct_all(index)
+    keep = ~np.isin(all_ids, ids)
+    index.reset()
+    index.add_with_ids(vectors[keep], all_ids[keep])
+    return index
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from .index_lock import IndexLock
+from .vector_store import saved_version
+
+logger = logging.getLogger(__name__)
+
+class IndexFollower:
+    """Keeps a worker that does not write the index on the latest version the writer published.
+
+    Every interval it reads the manifest version; when the writer has saved a different one,
+    reload(False) maps it read-only on the executor and swaps it in, so all workers share one
+    copy of the segments in the page cache. Each round also tries the writer lock: once the
+    writer exits, the worker that gets it reloads with reload(True), which may repair the
+    store, and then on_elected() starts the writer's background work on the event loop.
+    """
+
+    def __init__(self, path: str, lock: IndexLock, current_version: Callable[[], int],
+                 reload: Callable[[bool], None], on_elected: Callable[[], None], interval: float, executor=None):
+        self.path = path
+        self.lock = lock
+        self.current_version = current_version
+        self.reload = reload
+        self.on_elected = on_elected
+        self.interval = interval
+        self.executor = executor
+        self.reloads = 0
+        self.elected = False
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self.lock.try_acquire():
+                    await loop.run_in_executor(self.executor, self.reload, True)
+                    self.elected = True
+                    logger.info("Index writer exited; this worker now writes the index")
+                    self.on_elected()
+                    return
+                version = await loop.run_in_executor(self.executor, saved_version, self.path)
+                if version is not None and version != self.current_version():
+                    await loop.run_in_executor(self.executor, self.reload, False)
+                    self.reloads += 1
+            except Exception as e:
+                logger.error(f"Index reload failed: {e}")
+
+    def stats(self) -> dict:
+        return {"reloads": self.reloads, "elected": self.elected}
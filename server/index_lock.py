@@ -0,0 +1,69 @@
+import os
+import logging
+from typing import IO, Optional
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = "writer.lock"
+
+class IndexLock:
+    """Exclusive lock on the index directory that elects its one writer.
+
+    Ingestion, the compactor and the document watcher write segments and manifests, so only
+    the process holding this lock runs them. Other uvicorn workers on the same directory map
+    the versions it publishes read-only and keep trying the lock, so one of them takes over
+    if the writer exits. The OS drops the lock when its process dies, so a crash never leaves
+    a stale lock behind.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.join(path, LOCK_FILE)
+        self._file: Optional[IO] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lock without waiting; False if another process holds it"""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_file = open(self.path, "a+")
+        try:
+            _lock(lock_file)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        logger.info(f"Holding index lock {self.path}")
+        return True
+
+    def release(self):
+        if self._file is not None:
+            _unlock(self._file)
+            self._file.close()
+            self._file = None
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(lock_file: IO):
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(lock_file: IO):
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(lock_file: IO):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(lock_file: IO):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from .config import CHUNK_SIZE, CHUNK_OVERLAP
+from .utils import read_metadata_csv
+
+logger = logging.getLogger(__name__)
+
+def process_pdf_optimized(file_path: str):
+    """Process PDF file and split into chunks"""
+    loader = PyMuPDFLoader(file_path)
+    pages = loader.load()
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return text_splitter.split_documents(pages), len(pages)
+
+def parse_file(pdf_path: str, metadata_path: str) -> Tuple[List, int]:
+    """Parse and chunk one PDF and attach its CSV metadata; runs in a worker process"""
+    metadata = read_metadata_csv(metadata_path)
+    documents, page_count = process_pdf_optimized(pdf_path)
+    for doc in documents:
+        doc.metadata.update(metadata)
+    return documents, page_count
+
+async def parse_files(files: List[str], documents_dir: str, executor: Executor,
+                      max_in_flight: int = 4) -> AsyncIterator[Tuple[str, Optional[List]]]:
+    """Parse PDFs across the worker pool, yielding (file, chunks) as each file finishes.
+
+    At most max_in_flight files are parsed or waiting to be consumed at once, so a slow consumer
+    holds back parsing instead of letting parsed chunks pile up. Files that are missing or fail
+    to parse are yielded with None.
+    """
+    loop = asyncio.get_event_loop()
+    queue = list(files)
+    tasks = {}
+    missing: List[str] = []
+    start = time.perf_counter()
+    total_pages = 0
+    parsed_files = 0
+
+    def submit_next():
+        while queue and len(tasks) < max_in_flight:
+            file = queue.pop(0)
+            pdf_path = os.path.join(documents_dir, file)
+            metadata_path = os.path.join(documents_dir, file.replace('.pdf', '.csv'))
+            if not os.path.exists(pdf_path) or not os.path.exists(metadata_path):
+                logger.warning(f"File or metadata missing: {file}")
+                missing.append(file)
+                continue
+            tasks[loop.run_in_executor(executor, parse_file, pdf_path, metadata_path)] = file
+
+    submit_next()
+    while tasks or missing:
+        while missing:
+            yield missing.pop(0), None
+        if not tasks:
+            submit_next()
+            continue
+        done, _ = await asyncio.wait(set(tasks), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            file = tasks.pop(task)
+            try:
+                documents, page_count = task.result()
+            except Exception as e:
+                logger.error(f"Error parsing {file}: {e}")
+                documents, page_count = None, 0
+            total_pages += page_count
+            parsed_files += documents is not None
+            submit_next()
+            yield file, documents
+
+    elapsed = time.perf_counter() - start
+    if total_pages:
+        logger.info(f"Parsed {total_pages} pages from {parsed_files} files in {elapsed:.1f}s "
+                    f"({total_pages / max(elapsed, 1e-6):.1f} pages/sec)")
+
+async def stream_chunk_batches(files: List[str], documents_dir: str, executor: Executor, batch_size: int,
+                               max_buffered_batches: int, max_in_flight: int = 4,
+                               on_parsed: Callable[[str, Optional[List]], None] = None
+                               ) -> AsyncIterator[Tuple[str, List, bool]]:
+    """Stream (file, chunk batch, is last batch of file) through a bounded queue.
+
+    Parsing keeps running while the consumer embeds and indexes, but never more than
+    max_buffered_batches batches ahead of it, so memory stays flat however large the upload is.
+    A file that parses to no chunks still yields one, empty, last batch, so the consumer drops
+    its earlier chunks.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered_batches)
+    done = object()
+    errors: List[Exception] = []
+
+    async def produce():
+        try:
+            async for file, documents in parse_files(files, documents_dir, executor, max_in_flight):
+                if on_parsed:
+                    on_parsed(file, documents)
+                if documents is None:
+                    continue
+                if not documents:
+                    await queue.put((file, [], True))
+                    continue
+                for batch_start in range(0, len(documents), batch_size):
+                    last = batch_start + batch_size >= len(documents)
+                    await queue.put((file, documents[batch_start:batch_start + batch_size], last))
+        except Exception as e:
+            errors.append(e)
+        await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        producer.cancel()
@@ -0,0 +1,184 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stages of an ingestion job and their share of the overall progress bar
+STAGES = OrderedDict([
+    ("removing", 0.05),
+    ("retagging", 0.05),  # metadata-only edits, patched in place
+    ("ingesting", 0.85),  # parse -> chunk -> embed -> index, streamed
+    ("saving", 0.05),
+])
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation has been requested"""
+
+class IngestionJob:
+    """State and progress of one knowledge base update"""
+
+    def __init__(self, file_lists):
+        self.id = uuid.uuid4().hex
+        self.file_lists = file_lists
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.files: Dict[str, str] = {}
+        for file in file_lists.deleted_files:
+            self.files[file] = "queued"
+        for file in file_lists.new_files + file_lists.updated_files:
+            self.files[file] = "queued"
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # threading.Event so embedding/indexing code running on executor threads can check it
+        self._cancel_requested = threading.Event()
+
+    def set_stage(self, stage: str):
+        self.check_cancelled()
+        self.stage = stage
+        logger.info(f"Ingestion job {self.id}: {stage}")
+
+    def set_file(self, file: str, state: str):
+        self.files[file] = state
+
+    def cancel(self):
+        self._cancel_requested.set()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested"""
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+
+    def stage_fraction(self) -> float:
+        """How far the current stage has got, where it can be measured"""
+        if self.stage == "ingesting":
+            # Chunk totals are only known once files are parsed, so scale by parse progress
+            to_parse = self.file_lists.new_files + self.file_lists.updated_files
+            if not to_parse:
+                return 1.0
+            parsed = sum(1 for file in to_parse if self.files.get(file) not in ("queued", "parsing"))
+            parsed_fraction = parsed / len(to_parse)
+            embedded_fraction = self.chunks_embedded / self.chunks_total if self.chunks_total else 1.0
+            return 0.3 * parsed_fraction + 0.7 * parsed_fraction * embedded_fraction
+        return 0.0
+
+    @property
+    def progress(self) -> float:
+        if self.status == "completed":
+            return 1.0
+        if self.stage is None:
+            return 0.0
+        done = 0.0
+        for stage, weight in STAGES.items():
+            if stage == self.stage:
+                return done + weight * self.stage_fraction()
+            done += weight
+        return done
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "files": self.files,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobQueue:
+    """Runs ingestion jobs one at a time on a background task"""
+
+    def __init__(self, handler: Callable[[IngestionJob], Awaitable[None]], max_history: int = 50):
+        self.handler = handler
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            for job in self.jobs.values():
+                if job.status in ("queued", "running"):
+                    job.cancel()
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    def submit(self, file_lists) -> IngestionJob:
+        job = IngestionJob(file_lists)
+        self.jobs[job.id] = job
+        # Forget the oldest finished jobs
+        while len(self.jobs) > self.max_history:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            del self.jobs[oldest_id]
+        self._queue.put_nowait(job)
+        logger.info(f"Queued ingestion job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def busy(self) -> bool:
+        """Whether any job is queued or running"""
+        return any(job.status in ("queued", "running") for job in self.jobs.values())
+
+    def list(self) -> List[IngestionJob]:
+        return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[IngestionJob]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                await self.handler(job)
+                job.status = "completed"
+            except JobCancelled:
+                job.status = "cancelled"
+                logger.info(f"Ingestion job {job.id} cancelled during {job.stage}")
+            except asyncio.CancelledError:
+                job.status = "cancelled"
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"Ingestion job {job.id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
@@ -0,0 +1,178 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Sequence
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class LLMOverloaded(Exception):
+    """An LLM call was shed: its queue is full (429) or it would wait too long (503)"""
+
+    def __init__(self, workload: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"{workload} queue {reason}, retry in {retry_after}s")
+        self.workload = workload
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+class LLMScheduler:
+    """Admission control and priority queueing in front of every Ollama call.
+
+    Each workload (classification, chat, research) has its own concurrency limit and a
+    bounded queue, and all of them share max_concurrent slots on the one Ollama server.
+    A freed slot goes to the highest-priority workload that is waiting and under its limit,
+    so one long research synthesis can hold at most its own slots and never queue ahead of
+    chat. Calls are rejected up front when their queue is full or when the expected wait,
+    from the recent hold time of that workload, exceeds its max_wait.
+    """
+
+    def __init__(self, max_concurrent: int, priorities: Sequence[str], limits: Dict[str, int],
+                 queue_limits: Dict[str, int], max_wait: Dict[str, float]):
+        self.max_concurrent = max_concurrent
+        self.priorities = list(priorities)
+        self.limits = limits
+        self.queue_limits = queue_limits
+        self.max_wait = max_wait
+        self.running = 0
+        self._running: Dict[str, int] = {workload: 0 for workload in self.priorities}
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {workload: deque() for workload in self.priorities}
+        self._hold_time: Dict[str, float] = {workload: 0.0 for workload in self.priorities}
+        self._admitted = {workload: 0 for workload in self.priorities}
+        self._rejected = {workload: 0 for workload in self.priorities}
+        self._wait_seconds = {workload: Histogram(WAIT_BUCKETS) for workload in self.priorities}
+
+    def position(self, workload: str) -> int:
+        """Calls that would be served before a new call of this workload"""
+        rank = self.priorities.index(workload)
+        return sum(len(self._waiting[other]) for other in self.priorities[:rank + 1])
+
+    def expected_wait(self, workload: str) -> float:
+        """Rough seconds until a new call of this workload gets a slot"""
+        ahead = len(self._waiting[workload]) + 1
+        if self._running[workload] < self.limits[workload] and self.running < self.max_concurrent and ahead == 1:
+            return 0.0
+        return ahead * self._hold_time[workload] / max(1, self.limits[workload])
+
+    def admit(self, workload: str) -> int:
+        """Check a call can be queued, before a response is started; returns its queue position.
+
+        Raises LLMOverloaded so endpoints can answer 429/503 straight away instead of
+        streaming an error after a 200.
+        """
+        if len(self._waiting[workload]) >= self.queue_limits[workload]:
+            self._rejected[workload] += 1
+            raise LLMOverloaded(workload, 429, self._retry_after(workload), "is full")
+        wait = self.expected_wait(workload)
+        if wait > self.max_wait[workload]:
+            self._rejected[workload] += 1
+            raise LLMOverloaded(workload, 503, self._retry_after(workload), f"wait of {wait:.0f}s is too long")
+        return self.position(workload)
+
+    def _retry_after(self, workload: str) -> int:
+        return max(1, round(self._hold_time[workload] or 1))
+
+    @asynccontextmanager
+    async def slot(self, workload: str):
+        """Hold one Ollama slot for the duration of the block, waiting in priority order"""
+        self.admit(workload)
+        queued = time.perf_counter()
+        if self._can_run(workload) and not self._has_waiters_before(workload):
+            self._start(workload)
+        else:
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiting[workload].append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.max_wait[workload])
+            except asyncio.TimeoutError:
+                self._abandon(workload, waiter)
+                self._rejected[workload] += 1
+                raise LLMOverloaded(workload, 503, self._retry_after(workload), "wait timed out")
+            except asyncio.CancelledError:
+                self._abandon(workload, waiter)
+                raise
+        started = time.perf_counter()
+        self._wait_seconds[workload].observe(started - queued)
+        self._admitted[workload] += 1
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - started
+            # Moving average of hold time, for expected waits and Retry-After
+            previous = self._hold_time[workload]
+            self._hold_time[workload] = held if not previous else 0.8 * previous + 0.2 * held
+            self._running[workload] -= 1
+            self.running -= 1
+            self._dispatch()
+
+    def _can_run(self, workload: str) -> bool:
+        return self.running < self.max_concurrent and self._running[workload] < self.limits[workload]
+
+    def _has_waiters_before(self, workload: str) -> bool:
+        """Whether a queued call of this or a higher priority could take a free slot first.
+
+        Waiters held back only by their own workload's limit do not count: they cannot use
+        the slot, so a lower-priority call may take it.
+        """
+        rank = self.priorities.index(workload)
+        return any(self._waiting[other] and self._can_run(other) for other in self.priorities[:rank + 1])
+
+    def _start(self, workload: str):
+        self._running[workload] += 1
+        self.running += 1
+
+    def _abandon(self, workload: str, waiter: asyncio.Future):
+        """Give back a slot granted to a waiter that gave up, or drop it from the queue"""
+        if waiter.done() and not waiter.cancelled():
+            self._running[workload] -= 1
+            self.running -= 1
+            self._dispatch()
+        else:
+            waiter.cancel()
+            try:
+                self._waiting[workload].remove(waiter)
+            except ValueError:
+                pass
+
+    def _dispatch(self):
+        """Grant free slots to waiters, highest priority first.
+
+        A workload at its own limit is skipped, not waited on, so its queue never holds up
+        lower-priority workloads while global slots are free.
+        """
+        for workload in self.priorities:
+            queue = self._waiting[workload]
+            while queue and self._can_run(workload):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                self._start(workload)
+                waiter.set_result(None)
+            if self.running >= self.max_concurrent:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "workloads": {
+                workload: {
+                    "running": self._running[workload],
+                    "limit": self.limits[workload],
+                    "queued": len(self._waiting[workload]),
+                    "queue_limit": self.queue_limits[workload],
+                    "admitted": self._admitted[workload],
+                    "rejected": self._rejected[workload],
+                    "hold_seconds": round(self._hold_time[workload], 3),
+                    "wait_seconds": self._wait_seconds[workload].snapshot(),
+                }
+                for workload in self.priorities
+            }
+        }
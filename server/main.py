@@ -1,11 +1,10 @@
 import os
+import time
 import logging
-import threading
 import asyncio
-import aiohttp
-import httpx
-import shutil
-import json
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -15,16 +14,32 @@ from .models import FileLists
 from .config import *
 from .utils import *
 from .research_agent import ResearchAgent
+from .ollama_client import OllamaClient, create_session
+from .ollama_pool import OllamaPool
+from .llm_scheduler import LLMOverloaded, LLMScheduler
+from .vector_store import VectorStore
+from .index_lock import IndexLock
+from .index_follower import IndexFollower
+from .compaction import Compactor, merge_segments
+from .document_manifest import DocumentManifest, DocumentWatcher
+from .embedding_cache import EmbeddingCache
+from .embedding_scheduler import EmbeddingScheduler
+from .embedding_backend import load_checked_embeddings, sentence_transformer
+from .reranker import CrossEncoderReranker
+from .query_cache import QueryEmbeddingCache
+from .answer_cache import SemanticAnswerCache
+from .query_classifier import QueryClassifier
+from .query_batcher import QueryEmbeddingBatcher
+from .executors import configure_torch_threads, create_executors
+from .metrics import OverlapStats
+from .ingestion import stream_chunk_batches
+from .jobs import JobQueue
 from .routes.research import router as research_router
 from .routes.auth import router as auth_router
 from .database import init_database
 from .auth import verify_token
 
 # Import LangChain components
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
 
@@ -64,61 +79,244 @@ async def load_models():
     # Initialize database
     init_database()
     
+    # One worker per index directory is elected to write it; the others serve the versions it publishes
+    app.state.index_lock = IndexLock(FAISS_INDEX_PATH)
+    app.state.index_writer = app.state.index_lock.try_acquire()
+    
     try:
         import torch
         device = "cuda" if torch.cuda.is_available() else "cpu"
     except ImportError:
         device = "cpu"
     
-    # Initialize embeddings
-    app.state.embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={"device": device, "trust_remote_code": False},
-        encode_kwargs={"normalize_embeddings": True, "batch_size": BATCH_SIZE}
+    # Dedicated pools for chat-path embedding, search and ingestion, sized against torch threads
+    configure_torch_threads(TORCH_THREADS)
+    app.state.executors = create_executors(
+        QUERY_EMBED_THREADS, SEARCH_THREADS, INGEST_THREADS,
+        search_omp_threads=SEARCH_OMP_THREADS,
+        ingest_omp_threads=INGEST_OMP_THREADS,
+        compaction_threads=COMPACTION_THREADS,
+        rerank_threads=RERANK_THREADS
+    )
+    
+    # Initialize embeddings on the configured backend (ONNX backends are checked against torch)
+    app.state.embeddings, app.state.embedding_backend = load_checked_embeddings(
+        EMBEDDING_MODEL,
+        EMBEDDING_BACKEND if device == "cpu" else "torch",
+        device,
+        BATCH_SIZE,
+        ONNX_EXPORT_PATH,
+        ONNX_QUANTIZATION,
+        min_similarity=EMBEDDING_PARITY_MIN_SIMILARITY
+    )
+    
+    # Repeat questions reuse their embedding instead of running the model
+    app.state.query_cache = QueryEmbeddingCache(
+        app.state.embeddings.embed_query,
+        max_bytes=QUERY_CACHE_MAX_MB * 1024 * 1024,
+        ttl=QUERY_CACHE_TTL
+    )
+    
+    # Concurrent questions are embedded together in one forward pass
+    app.state.query_batcher = QueryEmbeddingBatcher(
+        app.state.embeddings.embed_documents,
+        max_batch_size=QUERY_BATCH_SIZE,
+        max_wait_ms=QUERY_BATCH_WAIT_MS,
+        executor=app.state.executors["query_embedding"]
+    )
+    app.state.query_batcher.start()
+    
+    # Finished RAG answers, replayed for near-identical questions
+    app.state.answer_cache = SemanticAnswerCache(
+        threshold=ANSWER_CACHE_SIMILARITY,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl=ANSWER_CACHE_TTL
+    )
+    
+    # GENERAL/RAG routing from the question embedding; Ollama only decides close calls
+    app.state.query_classifier = QueryClassifier.from_file(
+        QUERY_EXEMPLARS_PATH, app.state.embeddings.embed_documents, QUERY_CLASSIFIER_MIN_MARGIN
+    )
+    
+    # How much retrieval overlapping classification saves per chat request
+    app.state.retrieval_overlap = OverlapStats()
+    
+    # Token-budget batching for document embedding
+    app.state.embed_scheduler = EmbeddingScheduler(
+        sentence_transformer(app.state.embeddings),
+        app.state.embeddings.encode_kwargs,
+        token_budget=EMBED_TOKEN_BUDGET,
+        max_batch_size=EMBED_MAX_BATCH_SIZE,
+        auto_tune=EMBED_AUTO_TUNE
     )
     
+    # Optional cross-encoder rerank of retrieved chunks
+    app.state.reranker = None
+    if RERANK_ENABLED:
+        try:
+            reranker = CrossEncoderReranker(RERANK_MODEL, RERANK_TIME_BUDGET, RERANK_CACHE_SIZE)
+            reranker.warm_up()
+            app.state.reranker = reranker
+        except Exception as e:
+            logger.error(f"Could not load reranker {RERANK_MODEL}, using dense order: {e}")
+    
+    # Per-chunk embedding cache shared by all ingestion runs
+    app.state.embed_cache = EmbeddingCache(
+        EMBED_CACHE_PATH,
+        EMBEDDING_MODEL if app.state.embedding_backend == "torch" else f"{EMBEDDING_MODEL}-{app.state.embedding_backend}",
+        CHUNK_SIZE,
+        CHUNK_OVERLAP,
+        dtype=EMBED_CACHE_DTYPE
+    )
+    
+    # Worker processes for PDF parsing and chunking
+    app.state.ingest_pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS)
+    
+    # Knowledge base updates run as background jobs so requests never wait on ingestion
+    app.state.ingestion_jobs = JobQueue(run_ingestion_job)
+    
     # Initialize LLM with optimized settings for chat
     app.state.llm = OllamaLLM(
         model=MODEL_NAME,
+        base_url=OLLAMA_BACKENDS[0],
         temperature=CHAT_TEMPERATURE,
         num_ctx=CHAT_CONTEXT_SIZE,
         num_gpu=GPU_LAYERS,
         timeout=600
     )
     
-    # Create connection pool for Ollama
-    app.state.ollama_session = aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=600),
-        connector=aiohttp.TCPConnector(limit=20, limit_per_host=10, keepalive_timeout=60)
+    # One connection pool for Ollama, shared by chat, classification and research,
+    # with per-workload limits so research synthesis cannot starve chat
+    app.state.llm_scheduler = LLMScheduler(
+        LLM_MAX_CONCURRENT, LLM_PRIORITIES, LLM_CONCURRENCY, LLM_QUEUE_LIMITS, LLM_MAX_WAIT
+    )
+    app.state.ollama_session = create_session()
+    app.state.ollama_pool = OllamaPool(
+        OLLAMA_BACKENDS,
+        health_interval=OLLAMA_HEALTH_INTERVAL,
+        probe_timeout=OLLAMA_CONNECT_TIMEOUT,
+        breaker_failures=OLLAMA_BREAKER_FAILURES,
+        breaker_cooldown=OLLAMA_BREAKER_COOLDOWN,
+        probe_failures=OLLAMA_PROBE_FAILURES
+    )
+    app.state.ollama_pool.start(app.state.ollama_session)
+    app.state.ollama = OllamaClient(
+        app.state.ollama_session, app.state.ollama_pool, MODEL_NAME, app.state.llm_scheduler, LLM_MODELS
     )
     
     # Initialize research agent
-    app.state.research_agent = ResearchAgent(app.state.ollama_session)
+    app.state.research_agent = ResearchAgent(app.state.ollama)
+    
+    # Map the FAISS index if it exists; chunk text is read lazily from SQLite.
+    # app.state.vectorstore is the published snapshot: it is only ever replaced, never modified
+    app.state.vectorstore = VectorStore.load(
+        FAISS_INDEX_PATH, app.state.embeddings, read_only=not app.state.index_writer
+    )
     
-    # Preload FAISS index if it exists
-    if os.path.exists(FAISS_INDEX_PATH):
-        app.state.vectorstore = FAISS.load_local(FAISS_INDEX_PATH, app.state.embeddings, allow_dangerous_deserialization=True)
+    # Fork of the published snapshot that ingestion applies updates to
+    app.state.vectorstore_writer = None
+    
+    # Ingestion and the segment compactor take turns on the fork; chat never takes this lock
+    app.state.vectorstore_write_lock = threading.Lock()
+    app.state.compactor = Compactor(compact_vectorstore, app.state.executors["compaction"])
+    app.state.document_manifest = None
+    app.state.document_watcher = None
+    
+    # The writer runs ingestion, compaction and the document watcher; other workers follow
+    # its manifest version and stand by to take over if it exits
+    app.state.index_follower = None
+    if app.state.index_writer:
+        start_index_writer()
     else:
-        app.state.vectorstore = None
+        logger.info(f"Another worker writes {FAISS_INDEX_PATH}; serving the versions it publishes")
+        app.state.index_follower = IndexFollower(
+            FAISS_INDEX_PATH,
+            app.state.index_lock,
+            lambda: app.state.vectorstore.version if app.state.vectorstore else 0,
+            reload_vectorstore,
+            start_index_writer,
+            interval=INDEX_RELOAD_INTERVAL,
+            executor=app.state.executors["compaction"]
+        )
+        app.state.index_follower.start()
+
+def start_index_writer():
+    """Start the background work of the worker elected to write the index"""
+    app.state.index_writer = True
+    app.state.ingestion_jobs.start()
+    app.state.compactor.start()
+    if app.state.vectorstore is not None and app.state.vectorstore.compaction_plan() is not None:
+        app.state.compactor.request()
+    
+    # Size/mtime/hash of every indexed document, so a scan queues exactly what changed on disk
+    app.state.document_manifest = DocumentManifest(
+        os.path.join(FAISS_INDEX_PATH, DOCUMENT_MANIFEST_FILE), DOCUMENTS_DIR
+    )
+    if not app.state.document_manifest.exists and app.state.vectorstore is not None:
+        app.state.document_manifest.adopt(app.state.vectorstore.chunks.file_names())
     
-    app.state.vectorstore_lock = threading.Lock()
+    # Optional polling of the documents directory for files copied in outside the portal
+    if DOCUMENTS_WATCH:
+        app.state.document_watcher = DocumentWatcher(
+            app.state.document_manifest,
+            submit_document_changes,
+            app.state.ingestion_jobs.busy,
+            interval=DOCUMENTS_WATCH_INTERVAL,
+            settle=DOCUMENTS_SETTLE_SECONDS,
+            executor=app.state.executors["ingest"]
+        )
+        app.state.document_watcher.start()
+
+def reload_vectorstore(writable: bool):
+    """Swap in the version the index writer last saved, on a worker that follows it.
+
+    Cached answers stay with the old version: this worker cannot tell which documents changed.
+    writable=True opens it as the new writer, repairing what an interrupted writer left behind.
+    """
+    vectorstore = VectorStore.load(FAISS_INDEX_PATH, app.state.embeddings, read_only=not writable)
+    if vectorstore is not None:
+        app.state.vectorstore = vectorstore
+        logger.info(f"Reloaded index v{vectorstore.version} ({vectorstore.describe()}) "
+                    f"with {vectorstore.ntotal} chunks from {FAISS_INDEX_PATH}")
 
 @app.on_event("shutdown")
 async def cleanup():
     """Cleanup resources on shutdown"""
-    if hasattr(app.state, 'ollama_session'):
-        await app.state.ollama_session.close()
+    if getattr(app.state, 'index_follower', None):
+        await app.state.index_follower.stop()
+    if hasattr(app.state, 'ollama_pool'):
+        await app.state.ollama_pool.stop()
+    if hasattr(app.state, 'ollama'):
+        await app.state.ollama.close()
+    if hasattr(app.state, 'query_batcher'):
+        await app.state.query_batcher.stop()
+    if hasattr(app.state, 'ingestion_jobs'):
+        await app.state.ingestion_jobs.stop()
+    if hasattr(app.state, 'compactor'):
+        await app.state.compactor.stop()
+    if getattr(app.state, 'document_watcher', None):
+        await app.state.document_watcher.stop()
+    if hasattr(app.state, 'ingest_pool'):
+        app.state.ingest_pool.shutdown(wait=False, cancel_futures=True)
+    for executor in getattr(app.state, 'executors', {}).values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    if hasattr(app.state, 'index_lock'):
+        app.state.index_lock.release()
 
 # Include routes
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(research_router, prefix="/research", tags=["research"])
 
+async def embed_question(question):
+    """Question embedding from the cache, or batched with concurrent questions on a miss"""
+    return await app.state.query_cache.aembed_query(question, app.state.query_batcher.embed)
+
 async def get_relevant_documents_async(question, vectorstore):
     """Async wrapper for document retrieval"""
     loop = asyncio.get_event_loop()
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 3})
-    docs = await loop.run_in_executor(None, retriever.invoke, question)
-    return docs
+    query_vector = await embed_question(question)
+    ids = await loop.run_in_executor(app.state.executors["search"], vectorstore.hybrid_search, question, query_vector, 3)
+    return vectorstore.get_documents([chunk_id for chunk_id, _ in ids])
 
 async def get_current_student(request: Request):
     """Get current student from request with token caching"""
@@ -182,38 +380,31 @@ async def stream_llm_response(question, embeddings, llm, vectorstore):
         full_prompt = prompt.format(context=context, question=question)
         
         # Stream from Ollama using connection pool with chat-optimized settings
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": full_prompt,
-            "stream": True,
-            "options": {
-                "temperature": CHAT_TEMPERATURE,
-                "num_ctx": CHAT_CONTEXT_SIZE,
-                "num_gpu": GPU_LAYERS
-            }
-        }
-        
-        async with app.state.ollama_session.post(ollama_url, json=payload) as response:
-            async for line in response.content:
-                if line:
-                    try:
-                        data = json.loads(line.decode('utf-8'))
-                        if 'response' in data:
-                            yield data['response']
-                        if data.get('done', False):
-                            break
-                    except json.JSONDecodeError:
-                        continue
+        async for piece in app.state.ollama.stream(full_prompt, options=CHAT_OPTIONS):
+            yield piece
                         
     except Exception as e:
         yield f"Error: {str(e)}"
 
-async def stream_llm_response_with_context(question, embeddings, llm, vectorstore, student_context):
-    """Stream LLM response with student context"""
+async def stream_llm_response_with_context(question, embeddings, llm, vectorstore, student_context, query_vector=None,
+                                           retrieval=None, generation=None):
+    """Stream LLM response with student context.
+
+    retrieval is a speculative retrieval task started during classification, if any; it is
+    cancelled if the stream ends (the client went away, generation failed) before using it.
+    """
     try:
+        # Taken before retrieval: an answer generated across a document change is not cached
+        version = vectorstore.version
+        if generation is None:
+            generation = app.state.answer_cache.generation
+        answer_parts = []
+        
         # Get relevant documents with context filtering
-        docs = await get_relevant_documents_with_context(question, vectorstore, student_context)
+        if retrieval is not None:
+            docs, _ = await retrieval
+        else:
+            docs = await get_relevant_documents_with_context(question, vectorstore, student_context)
         
         # Create context from retrieved documents and track sources
         context_parts = []
@@ -247,45 +438,54 @@ async def stream_llm_response_with_context(question, embeddings, llm, vectorstor
             question=question
         )
         
-        # Stream from Ollama
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": full_prompt,
-            "stream": True,
-            "options": {
-                "temperature": CHAT_TEMPERATURE,
-                "num_ctx": CHAT_CONTEXT_SIZE,
-                "num_gpu": GPU_LAYERS
-            }
-        }
+        # Stream from Ollama; the stream raises if it ends before the answer is done
+        async for piece in app.state.ollama.stream(full_prompt, options=CHAT_OPTIONS):
+            answer_parts.append(piece)
+            yield piece
         
-        async with app.state.ollama_session.post(ollama_url, json=payload) as response:
-            async for line in response.content:
-                if line:
-                    try:
-                        data = json.loads(line.decode('utf-8'))
-                        if 'response' in data:
-                            yield data['response']
-                        if data.get('done', False):
-                            # Add source information at the end
-                            if sources:
-                                yield "\n\n**Sources:**\n"
-                                seen_files = set()
-                                for i, source in enumerate(sources, 1):
-                                    filename = source['filename']
-                                    if filename not in seen_files:
-                                        seen_files.add(filename)
-                                        pdf_url = f"/documents/{filename}"
-                                        # Extract just the filename without extension for display
-                                        display_name = filename.replace('.pdf', '')
-                                        yield f"{i}. [{display_name}]({pdf_url})\n"
-                            break
-                    except json.JSONDecodeError:
-                        continue
+        # Add source information at the end
+        if sources:
+            yield format_sources(sources)
+        store_answer(question, query_vector, student_context, version, generation,
+                     "".join(answer_parts), sources)
                         
     except Exception as e:
         yield f"Error: {str(e)}"
+    finally:
+        if retrieval is not None:
+            retrieval.cancel()
+
+def format_sources(sources):
+    """Markdown list of the distinct source documents of an answer"""
+    lines = ["\n\n**Sources:**\n"]
+    seen_files = set()
+    for i, source in enumerate(sources, 1):
+        filename = source['filename']
+        if filename not in seen_files:
+            seen_files.add(filename)
+            pdf_url = f"/documents/{filename}"
+            # Extract just the filename without extension for display
+            display_name = filename.replace('.pdf', '')
+            lines.append(f"{i}. [{display_name}]({pdf_url})\n")
+    return "".join(lines)
+
+def store_answer(question, query_vector, student_context, version, generation, answer, sources):
+    """Cache a completed RAG answer for similar questions from the same department and semester"""
+    if query_vector is None or not answer.strip() or not sources:
+        return
+    # Answers that address the student personally must not be replayed to classmates
+    for personal in (student_context.get('name'), student_context.get('roll_no')):
+        if personal and str(personal).lower() in answer.lower():
+            return
+    app.state.answer_cache.store(
+        query_vector, student_context['department'], student_context['semester'],
+        version, generation, answer, sources
+    )
+
+async def replay_cached_answer(cached):
+    """Stream a cached answer and its sources like a generated one"""
+    yield cached.answer
+    yield format_sources(cached.sources)
 
 async def stream_general_response(question, student_context):
     """Stream general response without RAG"""
@@ -299,44 +499,57 @@ async def stream_general_response(question, student_context):
         )
         
         # Stream from Ollama
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": general_prompt,
-            "stream": True,
-            "options": {
-                "temperature": CHAT_TEMPERATURE,
-                "num_ctx": CHAT_CONTEXT_SIZE,
-                "num_gpu": GPU_LAYERS
-            }
-        }
-        
-        async with app.state.ollama_session.post(ollama_url, json=payload) as response:
-            async for line in response.content:
-                if line:
-                    try:
-                        data = json.loads(line.decode('utf-8'))
-                        if 'response' in data:
-                            yield data['response']
-                        if data.get('done', False):
-                            break
-                    except json.JSONDecodeError:
-                        continue
+        async for piece in app.state.ollama.stream(general_prompt, options=CHAT_OPTIONS):
+            yield piece
                         
     except Exception as e:
         yield f"Error: {str(e)}"
 
-async def get_relevant_documents_with_context(question, vectorstore, student_context):
-    """Get relevant documents filtered by student context"""
-    # Get more documents initially
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 10})
-    all_docs = await retriever.ainvoke(question)
+async def timed(awaitable):
+    """Result of an awaitable and the seconds it took"""
+    started = time.perf_counter()
+    result = await awaitable
+    return result, time.perf_counter() - started
+
+def record_retrieval_overlap(started, classify_seconds, retrieval):
+    """Done-callback of a speculative retrieval a RAG answer uses: record the time the overlap saved"""
+    # Reading the exception also keeps a failed retrieval from logging "exception was never retrieved"
+    if retrieval.cancelled() or retrieval.exception() is not None:
+        return
+    _, retrieve_seconds = retrieval.result()
+    # Sequential would have been classify + retrieve; overlapped, both were done by now
+    elapsed = time.perf_counter() - started
+    saved = max(0.0, classify_seconds + retrieve_seconds - elapsed)
+    app.state.retrieval_overlap.record(classify_seconds, retrieve_seconds, saved)
+    logger.info(f"Chat timing: classify {classify_seconds:.3f}s, retrieve {retrieve_seconds:.3f}s, "
+                f"overlap saved {saved:.3f}s")
+
+def cancel_speculative_retrieval(retrieval):
+    """Drop a speculative retrieval whose query turned out not to need documents"""
+    retrieval.cancel()
+    # A retrieval that already failed must not log "exception was never retrieved"
+    retrieval.add_done_callback(lambda task: task.cancelled() or task.exception())
+    app.state.retrieval_overlap.cancelled += 1
+
+async def get_relevant_documents_with_context(question, vectorstore, student_context, k=3):
+    """Get relevant documents, searching only chunks eligible for the student's department/semester"""
+    loop = asyncio.get_event_loop()
+    query_vector = await embed_question(question)
     
-    # Filter documents based on student context
-    filtered_docs = filter_documents_by_context(all_docs, student_context)
+    # Retrieve a wider candidate set when the cross-encoder will pick the best k from it
+    reranker = app.state.reranker
+    candidates = max(k, RERANK_CANDIDATES) if reranker else k
     
-    # Return top 3 filtered documents
-    return filtered_docs[:3]
+    # Department/semester constraint is applied inside the dense and lexical searches
+    docs = await loop.run_in_executor(
+        app.state.executors["search"], vectorstore.context_filter.search, vectorstore, question, query_vector, student_context, candidates
+    )
+    
+    if reranker:
+        docs = await reranker.rerank_async(question, docs, app.state.executors["rerank"])
+    
+    # Keep department/semester matches ahead of partial matches
+    return filter_documents_by_context(docs, student_context)[:k]
 
 def filter_documents_by_context(docs, student_context):
     """Filter documents based on student's department and semester"""
@@ -371,112 +584,296 @@ def filter_documents_by_context(docs, student_context):
     filtered.sort(key=lambda x: x[1], reverse=True)
     return [doc for doc, score in filtered]
 
-def embed_documents_optimized(documents, embeddings_model, file_hash):
-    """Optimized document embedding with caching"""
-    cached = load_cached_embeddings(file_hash, EMBED_CACHE_PATH)
-    if cached:
-        logger.info(f"Loaded {len(cached['documents'])} cached embeddings")
-        return cached['documents'], cached['embeddings']
-    
-    texts = [doc.page_content for doc in documents if len(doc.page_content.strip()) > 50]
+def embed_documents_optimized(documents):
+    """Optimized document embedding with per-chunk caching and length-bucketed batches"""
     documents = [doc for doc in documents if len(doc.page_content.strip()) > 50]
-    logger.info(f"Embedding {len(texts)} chunks (filtered from original)...")
-    
-    embeddings_array = []
-    batch_size = 8
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        batch_embeddings = embeddings_model.embed_documents(batch)
-        embeddings_array.extend(batch_embeddings)
-    
-    save_cached_embeddings(file_hash, documents, embeddings_array, EMBED_CACHE_PATH)
-    return documents, embeddings_array
-
-def process_pdf_optimized(file_path: str):
-    """Process PDF file and split into chunks"""
-    loader = PyMuPDFLoader(file_path)
-    pages = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    return text_splitter.split_documents(pages)
+    texts = [doc.page_content for doc in documents]
+    return documents, app.state.embed_cache.embed(texts, app.state.embed_scheduler.embed)
 
-@app.post("/update_knowledge_base")
-async def update_knowledge_base(file_lists: FileLists):
-    """Update the knowledge base with new, updated, or deleted files"""
-    try:
-        logger.info("Starting knowledge base update")
-        logger.info(f"New files: {file_lists.new_files}")
-        logger.info(f"Updated files: {file_lists.updated_files}")
-        logger.info(f"Deleted files: {file_lists.deleted_files}")
+def writable_vectorstore():
+    """The ingestion-side fork of the published vector store, created on first use.
+
+    Callers hold vectorstore_write_lock, which the ingestion job and the segment compactor
+    share; chat keeps reading the published snapshot until publish_vectorstore() swaps the fork in.
+    """
+    if app.state.vectorstore_writer is None:
+        published = app.state.vectorstore
+        if published is None:
+            app.state.vectorstore_writer = VectorStore.create(FAISS_INDEX_PATH, app.state.embeddings)
+        else:
+            app.state.vectorstore_writer = published.fork()
+    return app.state.vectorstore_writer
+
+def add_documents_to_index(documents, embedding_vectors, replace_files):
+    """Add embedded chunks to the vector store, first dropping earlier chunks of replace_files"""
+    text_embeddings = list(zip([doc.page_content for doc in documents], embedding_vectors))
+    with app.state.vectorstore_write_lock:
+        vectorstore = writable_vectorstore()
+        # Replaced documents drop only their own previous chunks
+        app.state.answer_cache.invalidate_files(replace_files)
+        for file in replace_files:
+            remove_vectors_from_index(vectorstore, file)
+        vectorstore.add_embeddings(
+            text_embeddings,
+            metadatas=[doc.metadata for doc in documents]
+        )
+
+def remove_documents_from_index(file):
+    """Remove one file's chunks from the vector store"""
+    if app.state.vectorstore is None and app.state.vectorstore_writer is None:
+        return
+    app.state.answer_cache.invalidate_files([file])
+    with app.state.vectorstore_write_lock:
+        remove_vectors_from_index(writable_vectorstore(), file)
+
+def retag_documents_in_index(file):
+    """Rewrite the metadata of an indexed file's chunks from its CSV; returns the number of chunks re-tagged"""
+    metadata = read_metadata_csv(os.path.join(DOCUMENTS_DIR, file.replace('.pdf', '.csv')))
+    with app.state.vectorstore_write_lock:
+        if app.state.vectorstore is None and app.state.vectorstore_writer is None:
+            return 0
+        # Eligibility changed, so answers citing the document may now go to the wrong students
+        app.state.answer_cache.invalidate_files([file])
+        return writable_vectorstore().update_file_metadata(file.replace('.pdf', ''), metadata)
+
+def publish_vectorstore():
+    """Persist the updated fork as a new index version and swap it in for chat.
 
+    Only the new chunks and deletions are written (as a delta segment and a tombstone file);
+    merging segments is left to the background compactor. Queries already running keep the
+    snapshot they started with; new ones see the update, and other workers reload it once
+    their IndexFollower sees the new manifest version.
+    """
+    with app.state.vectorstore_write_lock:
+        vectorstore = app.state.vectorstore_writer
+        if vectorstore is None:
+            return
+        published = app.state.vectorstore
+        old_version = published.version if published else 0
+        vectorstore.save()
+        # Atomic reference swap; readers never take a lock
+        app.state.vectorstore = vectorstore
+        app.state.answer_cache.set_version(old_version, vectorstore.version)
+        vectorstore.purge_deleted()
+        app.state.vectorstore_writer = vectorstore.fork()
+    logger.info(f"Published index v{vectorstore.version} ({vectorstore.describe()}) "
+                f"with {vectorstore.ntotal} chunks from {FAISS_INDEX_PATH}")
+    if vectorstore.compaction_plan() is not None:
+        app.state.compactor.request()
+
+def compact_vectorstore() -> bool:
+    """Merge index segments if they need it; runs on the compactor's background thread.
+
+    The merge reads only immutable segment files, so ingestion keeps going meanwhile and the
+    write lock is held just to take the plan and to swap the merged segment in.
+    """
+    with app.state.vectorstore_write_lock:
+        if app.state.vectorstore is None and app.state.vectorstore_writer is None:
+            return False
+        vectorstore = writable_vectorstore()
+        plan = vectorstore.compaction_plan()
+        if plan is None:
+            return False
+        segments, full = plan
+        tombstones = vectorstore.saved_tombstones()
+    file_name, applied = merge_segments(FAISS_INDEX_PATH, segments, tombstones, full)
+    with app.state.vectorstore_write_lock:
+        writable_vectorstore().replace_segments(segments, file_name, applied)
+    publish_vectorstore()
+    return True
+
+async def run_ingestion_job(job):
+    """Apply a knowledge base update; runs on the ingestion job queue's background worker.
+
+    Chunks stream from the parser processes through a bounded queue into embedding and the
+    index in INGEST_BATCH_SIZE batches, and the index is checkpointed (saved and published to
+    chat) every INGEST_CHECKPOINT_CHUNKS chunks, so memory stays flat and a crash keeps finished
+    files. Updates go to a fork of the published store, so chat never waits on ingestion.
+    """
+    file_lists = job.file_lists
+    loop = asyncio.get_event_loop()
+    ingest_executor = app.state.executors["ingest"]
+    logger.info("Starting knowledge base update")
+    logger.info(f"New files: {file_lists.new_files}")
+    logger.info(f"Updated files: {file_lists.updated_files}")
+    logger.info(f"Deleted files: {file_lists.deleted_files}")
+
+    # Recorded in the document manifest once published; taken now so files edited mid-job rescan as changed
+    all_files = file_lists.new_files + file_lists.updated_files
+    observed = await loop.run_in_executor(ingest_executor, app.state.document_manifest.observe_files, all_files)
+
+    def on_parsed(file, documents):
+        if documents is None:
+            job.set_file(file, "failed")
+        else:
+            job.chunks_total += len(documents)
+            job.set_file(file, "parsed")
+
+    try:
         # Process deleted files
+        job.set_stage("removing")
         for file in file_lists.deleted_files:
+            job.check_cancelled()
             logger.info(f"Removing vectors and files for {file}")
-            with app.state.vectorstore_lock:
-                vectorstore = app.state.vectorstore
-                if vectorstore:
-                    remove_vectors_from_index(vectorstore, file)
+            await loop.run_in_executor(ingest_executor, remove_documents_from_index, file)
             delete_file_and_metadata(file, DOCUMENTS_DIR)
+            job.set_file(file, "removed")
 
-        # Process new and updated files
-        all_documents = []
-        all_files = file_lists.new_files + file_lists.updated_files
-        temp_files = []
-        
-        for file in all_files:
-            pdf_path = os.path.join(DOCUMENTS_DIR, file)
-            metadata_path = os.path.join(DOCUMENTS_DIR, file.replace('.pdf', '.csv'))
-            
-            if not os.path.exists(pdf_path) or not os.path.exists(metadata_path):
-                logger.warning(f"File or metadata missing: {file}")
+        # Files whose PDF is unchanged only need their chunk metadata patched, not re-embedding
+        job.set_stage("retagging")
+        manifest = app.state.document_manifest
+        for file in file_lists.updated_files:
+            job.check_cancelled()
+            if not manifest.metadata_only(file, observed.get(file)):
                 continue
-                
-            metadata = read_metadata_csv(metadata_path)
-            documents = process_pdf_optimized(pdf_path)
-            
-            for doc in documents:
-                doc.metadata.update(metadata)
-            
-            all_documents.extend(documents)
-            temp_files.append(file)
-
-        # Update FAISS index
-        if all_documents:
-            file_hash = compute_file_hash(temp_files)
-            documents, embedding_vectors = embed_documents_optimized(all_documents, app.state.embeddings, file_hash)
-            text_embeddings = list(zip([doc.page_content for doc in documents], embedding_vectors))
-            
-            with app.state.vectorstore_lock:
-                vectorstore = app.state.vectorstore
-                if vectorstore is None:
-                    vectorstore = FAISS.from_embeddings(
-                        text_embeddings,
-                        app.state.embeddings,
-                        metadatas=[doc.metadata for doc in documents]
-                    )
-                else:
-                    vectorstore.add_embeddings(
-                        text_embeddings,
-                        metadatas=[doc.metadata for doc in documents]
-                    )
+            retagged = await loop.run_in_executor(ingest_executor, retag_documents_in_index, file)
+            if retagged:
+                logger.info(f"Re-tagged {retagged} chunks of {file} without re-embedding")
+                job.set_file(file, "retagged")
+                all_files.remove(file)
+
+        # Stream new and updated files: parse -> chunk -> embed -> index
+        job.set_stage("ingesting")
+        for file in all_files:
+            job.set_file(file, "parsing")
+        # Every file replaces its earlier chunks, which also makes re-running an interrupted job safe
+        replaced = set()
+        since_checkpoint = 0
+        
+        async for file, batch, last_batch in stream_chunk_batches(
+            all_files, DOCUMENTS_DIR, app.state.ingest_pool, INGEST_BATCH_SIZE, INGEST_QUEUE_SIZE,
+            max_in_flight=INGEST_WORKERS * 2, on_parsed=on_parsed
+        ):
+            job.check_cancelled()
+            if batch:
+                documents, embedding_vectors = await loop.run_in_executor(
+                    ingest_executor, embed_documents_optimized, batch
+                )
+            else:
+                # The file has no chunks any more; indexing nothing still removes its old ones
+                documents, embedding_vectors = [], []
+            replace_files = [] if file in replaced else [file]
+            replaced.add(file)
+            job.set_file(file, "indexing")
+            await loop.run_in_executor(ingest_executor, add_documents_to_index, documents, embedding_vectors, replace_files)
+            job.chunks_embedded += len(batch)
+            if last_batch:
+                job.set_file(file, "indexed")
             
-            # Save updated FAISS index locally
-            if vectorstore:
-                if os.path.exists(FAISS_INDEX_PATH):
-                    shutil.rmtree(FAISS_INDEX_PATH)
-                vectorstore.save_local(FAISS_INDEX_PATH)
-                logger.info(f"Saved updated FAISS index to {FAISS_INDEX_PATH}")
+            since_checkpoint += len(documents)
+            if since_checkpoint >= INGEST_CHECKPOINT_CHUNKS:
+                await loop.run_in_executor(ingest_executor, publish_vectorstore)
+                since_checkpoint = 0
 
-        logger.info("Knowledge base update completed successfully")
-        return {"message": "Knowledge base updated successfully"}
+        job.stage = "saving"
+    except Exception:
+        # Cancelled (JobCancelled) or failed: roll back files that were only partly indexed
+        for file, state in list(job.files.items()):
+            if state == "indexing":
+                await loop.run_in_executor(ingest_executor, remove_documents_from_index, file)
+                job.set_file(file, "rolled back")
+        raise
+    finally:
+        # Persist and publish whatever was applied, including work done before a cancellation or error
+        await loop.run_in_executor(ingest_executor, publish_vectorstore)
+        await loop.run_in_executor(ingest_executor, record_documents, job, observed)
+    logger.info("Knowledge base update completed successfully")
 
-    except Exception as e:
-        logger.error(f"Error updating knowledge base: {e}")
-        raise HTTPException(status_code=500, detail=f"Error updating knowledge base: {e}")
+def record_documents(job, observed):
+    """Record published files in the document manifest; failed and rolled back files are left for the next scan"""
+    indexed = {
+        file: observed[file] for file, state in job.files.items()
+        if state in ("indexed", "retagged") and observed.get(file) is not None
+    }
+    removed = [file for file, state in job.files.items() if state == "removed"]
+    app.state.document_manifest.update(indexed, removed)
+
+def submit_document_changes(changes):
+    """Queue an update job for the changes found by a document manifest scan"""
+    job = app.state.ingestion_jobs.submit(FileLists(**changes))
+    logger.info(f"Documents scan queued job {job.id}: {changes}")
+    return job
+
+def require_index_writer():
+    """Refuse index updates on a worker that only follows the writer; a retry reaches another worker"""
+    if not app.state.index_writer:
+        raise HTTPException(
+            status_code=503,
+            detail="This worker does not write the knowledge base index; retry the request",
+            headers={"Retry-After": "1"}
+        )
+
+@app.post("/update_knowledge_base")
+async def update_knowledge_base(file_lists: FileLists):
+    """Queue a knowledge base update with new, updated, or deleted files"""
+    require_index_writer()
+    job = app.state.ingestion_jobs.submit(file_lists)
+    return JSONResponse(job.to_dict(), status_code=202)
+
+@app.get("/update_knowledge_base/changes")
+async def list_document_changes():
+    """New, changed and deleted documents on disk that the knowledge base does not reflect yet"""
+    require_index_writer()
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(app.state.executors["ingest"], app.state.document_manifest.scan)
+
+@app.post("/update_knowledge_base/scan")
+async def scan_documents():
+    """Queue a knowledge base update for exactly the documents that changed on disk"""
+    require_index_writer()
+    if app.state.ingestion_jobs.busy():
+        # Files of the pending job are not recorded yet and would be queued twice
+        raise HTTPException(status_code=409, detail="A knowledge base update is already queued or running")
+    loop = asyncio.get_event_loop()
+    changes = await loop.run_in_executor(app.state.executors["ingest"], app.state.document_manifest.scan)
+    if not any(changes.values()):
+        return {"status": "up to date", **changes}
+    job = submit_document_changes(changes)
+    return JSONResponse(job.to_dict(), status_code=202)
+
+@app.get("/update_knowledge_base/jobs")
+async def list_ingestion_jobs():
+    """Recent knowledge base update jobs, newest first"""
+    require_index_writer()
+    return {"jobs": [job.to_dict() for job in app.state.ingestion_jobs.list()]}
+
+@app.get("/update_knowledge_base/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Status and per-file/per-stage progress of a knowledge base update"""
+    require_index_writer()
+    job = app.state.ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/update_knowledge_base/jobs/{job_id}/cancel")
+async def cancel_ingestion_job(job_id: str):
+    """Cancel a queued or running knowledge base update; partly indexed files are rolled back"""
+    require_index_writer()
+    job = app.state.ingestion_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/stats")
+async def get_stats():
+    """Runtime cache, batching and thread pool statistics"""
+    return {
+        "query_embedding_cache": app.state.query_cache.stats(),
+        "answer_cache": app.state.answer_cache.stats(),
+        "query_embedding_batcher": app.state.query_batcher.stats(),
+        "executors": {name: executor.stats() for name, executor in app.state.executors.items()},
+        "compactor": app.state.compactor.stats(),
+        "index": {
+            "writer": app.state.index_writer,
+            "version": app.state.vectorstore.version if app.state.vectorstore else 0,
+            "follower": app.state.index_follower.stats() if app.state.index_follower else None
+        },
+        "retrieval_overlap": app.state.retrieval_overlap.snapshot(),
+        "query_classifier": app.state.query_classifier.stats(),
+        "llm_scheduler": app.state.llm_scheduler.stats(),
+        "ollama_backends": app.state.ollama_pool.stats()
+    }
 
 @app.post("/chat/stream")
 async def chat_stream(request: Request):
@@ -496,35 +893,78 @@ async def chat_stream(request: Request):
         embeddings = app.state.embeddings
         llm = app.state.llm
         
-        with app.state.vectorstore_lock:
-            vectorstore = app.state.vectorstore
-            if vectorstore is None and os.path.exists(FAISS_INDEX_PATH):
-                vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        # One read of the published snapshot; the whole request uses it even if ingestion swaps in a new one
+        vectorstore = app.state.vectorstore
+        if vectorstore is None and os.path.exists(FAISS_INDEX_PATH):
+            vectorstore = await asyncio.get_event_loop().run_in_executor(
+                app.state.executors["search"], VectorStore.load, FAISS_INDEX_PATH, embeddings
+            )
+            if vectorstore is not None and app.state.vectorstore is None:
                 app.state.vectorstore = vectorstore
         
         if vectorstore is None:
             return JSONResponse({"error": "Knowledge base is not built yet."}, status_code=500)
         
-        # --- Direct Classification (no HTTP overhead) ---
-        classification = await classify_query_direct(question, current_student)
+        # --- Semantic answer cache (skips classification, retrieval and generation) ---
+        query_vector = await embed_question(question)
+        cached = app.state.answer_cache.lookup(
+            query_vector, current_student['department'], current_student['semester'], vectorstore.version
+        )
+        if cached:
+            return StreamingResponse(replay_cached_answer(cached), media_type="text/plain")
+        
+        # --- Admission: shed load with 429/503 before classifying or streaming ---
+        position = app.state.llm_scheduler.admit("chat")
+        queue_headers = {"X-Queue-Position": str(position)}
+        
+        # --- Local classification: keywords, then the question embedding against labelled exemplars ---
+        retrieval = None
+        generation = app.state.answer_cache.generation
+        classification = local_classification(question, app.state.query_classifier, query_vector)
+        if classification is None:
+            # --- Speculative retrieval, overlapping the LLM classification round trip ---
+            started = time.perf_counter()
+            retrieval = asyncio.create_task(
+                timed(get_relevant_documents_with_context(question, vectorstore, current_student))
+            )
+            try:
+                classification = await classify_query_direct(question, current_student, query_vector)
+            except BaseException:
+                cancel_speculative_retrieval(retrieval)
+                raise
+            classify_seconds = time.perf_counter() - started
         
         # --- Route to appropriate response ---
         if classification == "GENERAL":
+            if retrieval is not None:
+                cancel_speculative_retrieval(retrieval)
             return StreamingResponse(
                 stream_general_response(question, current_student),
-                media_type="text/plain"
+                media_type="text/plain",
+                headers=queue_headers
             )
         else:
+            if retrieval is not None:
+                retrieval.add_done_callback(functools.partial(record_retrieval_overlap, started, classify_seconds))
             return StreamingResponse(
-                stream_llm_response_with_context(question, embeddings, llm, vectorstore, current_student),
-                media_type="text/plain"
+                stream_llm_response_with_context(
+                    question, embeddings, llm, vectorstore, current_student, query_vector,
+                    retrieval=retrieval,
+                    generation=generation
+                ),
+                media_type="text/plain",
+                headers=queue_headers
             )
+    except LLMOverloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code, headers=e.headers())
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
-async def classify_query_direct(question: str, student_context: dict) -> str:
+async def classify_query_direct(question: str, student_context: dict, query_vector=None) -> str:
     """Direct classification without HTTP overhead"""
-    return await classify_query_shared(question, student_context, app.state.ollama_session)
+    return await classify_query_shared(
+        question, student_context, app.state.ollama, app.state.query_classifier, query_vector
+    )
 
 @app.get("/documents/{filename}")
 async def serve_pdf(filename: str):
@@ -0,0 +1,68 @@
+import bisect
+import threading
+from typing import List, Sequence
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus-style upper bounds) with count and sum"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets: List[float] = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+            return {
+                "buckets": dict(zip(labels, self.counts)),
+                "count": self.count,
+                "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+            }
+
+class OverlapStats:
+    """Time saved by running retrieval speculatively alongside query classification"""
+
+    def __init__(self, buckets: Sequence[float] = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)):
+        self.classify = Histogram(buckets)
+        self.retrieve = Histogram(buckets)
+        self.saved = Histogram(buckets)
+        self.used = 0
+        self.cancelled = 0
+
+    def record(self, classify_seconds: float, retrieve_seconds: float, saved_seconds: float):
+        self.classify.observe(classify_seconds)
+        self.retrieve.observe(retrieve_seconds)
+        self.saved.observe(saved_seconds)
+        self.used += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "used": self.used,
+            "cancelled": self.cancelled,
+            "classify_seconds": self.classify.snapshot(),
+            "retrieve_seconds": self.retrieve.snapshot(),
+            "saved_seconds": self.saved.snapshot(),
+        }
@@ -0,0 +1,211 @@
+import json
+import asyncio
+import contextlib
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .llm_scheduler import LLMScheduler
+from .ollama_pool import OllamaBackend, OllamaPool
+from .config import (
+    MODEL_NAME, OLLAMA_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_CONNECT_RETRIES, OLLAMA_RETRY_BACKOFF, OLLAMA_POOL_SIZE, OLLAMA_POOL_SIZE_PER_HOST
+)
+
+def create_session() -> aiohttp.ClientSession:
+    """The app-lifetime keep-alive pool every Ollama call shares"""
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+        connector=aiohttp.TCPConnector(
+            limit=OLLAMA_POOL_SIZE, limit_per_host=OLLAMA_POOL_SIZE_PER_HOST, keepalive_timeout=60
+        )
+    )
+
+logger = logging.getLogger(__name__)
+
+class OllamaError(Exception):
+    """Ollama returned an error status or ended a stream early"""
+
+class OllamaStreamCut(OllamaError):
+    """The connection closed before Ollama reported the response done"""
+
+class NDJSONDecoder:
+    """Incremental newline-delimited JSON parser for chunks that split lines anywhere"""
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """Objects completed by this chunk; a trailing partial line is kept for the next one"""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        return [obj for obj in map(self._decode, lines) if obj is not None]
+
+    def flush(self) -> List[dict]:
+        """The last object, if the stream did not end with a newline"""
+        line, self._buffer = self._buffer, b""
+        obj = self._decode(line)
+        return [obj] if obj is not None else []
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[dict]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed Ollama stream line: {line[:200]!r}")
+            return None
+
+class OllamaClient:
+    """Async /api/generate client over one app-lifetime aiohttp connection pool.
+
+    Every chat, classification and research call goes through the same keep-alive pool, so
+    connections are reused instead of opened per request. Calls are spread over the servers of
+    an OllamaPool, each workload using its own model (models). Connection failures (Ollama not
+    up yet, restarting) move to another backend, with backoff once every one has failed; errors
+    after the request was sent are not retried, since generation may already have started.
+    With a scheduler, each call first waits for a slot of its workload (classification, chat
+    or research).
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, pool: OllamaPool, model: str = MODEL_NAME,
+                 scheduler: Optional[LLMScheduler] = None, models: Optional[Dict[str, str]] = None):
+        self.session = session
+        self.pool = pool
+        self.model = model
+        self.scheduler = scheduler
+        self.models = models or {}
+
+    def _slot(self, workload: str):
+        return self.scheduler.slot(workload) if self.scheduler else contextlib.nullcontext()
+
+    async def close(self):
+        """Close the pool; in-flight streams fail and release their connections"""
+        if not self.session.closed:
+            await self.session.close()
+
+    async def _post(self, path: str, payload: dict,
+                    timeout: aiohttp.ClientTimeout) -> Tuple[aiohttp.ClientResponse, OllamaBackend]:
+        """POST to the least-loaded backend with the model; raises OllamaError on a non-200 status.
+
+        The backend stays acquired until the caller releases it to the pool.
+        """
+        model = payload["model"]
+        tried: List[OllamaBackend] = []
+        for attempt in range(OLLAMA_CONNECT_RETRIES + 1):
+            backend = self.pool.acquire(model, exclude=tried)
+            if backend is None and tried:
+                # Every backend failed once: back off before trying them again
+                delay = OLLAMA_RETRY_BACKOFF * 2 ** (attempt - 1)
+                logger.warning(f"All Ollama backends for {model} failed, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                tried.clear()
+                backend = self.pool.acquire(model)
+            if backend is None:
+                raise OllamaError(f"No available Ollama backend serves {model}")
+            try:
+                response = await self.session.post(f"{backend.url}{path}", json=payload, timeout=timeout)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError) as e:
+                # The request never reached this backend, so another one can take it
+                self.pool.release(backend, failed=True)
+                tried.append(backend)
+                if attempt == OLLAMA_CONNECT_RETRIES:
+                    raise OllamaError(f"Could not connect to Ollama at {backend.url}: {e}") from e
+                logger.warning(f"Ollama connection to {backend.url} failed: {e}")
+                continue
+            except BaseException as e:
+                # Timed out or dropped after sending, or the caller was cancelled. The backend must
+                # go back either way: a trial call that is never released keeps it out for good
+                server_error = isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError))
+                self.pool.release(backend, failed=True if server_error else None)
+                raise
+            if response.status != 200:
+                try:
+                    body = await response.text()
+                finally:
+                    response.release()
+                    self.pool.release(backend, failed=response.status >= 500)
+                raise OllamaError(f"Ollama API error {response.status} from {backend.url}: {body[:200]}")
+            return response, backend
+
+    def _payload(self, prompt: str, stream: bool, options: Optional[dict], model: Optional[str],
+                 workload: str) -> dict:
+        model = model or self.models.get(workload, self.model)
+        return {"model": model, "prompt": prompt, "stream": stream, "options": options or {}}
+
+    async def generate(self, prompt: str, options: dict = None, model: str = None,
+                       timeout: float = OLLAMA_TIMEOUT, workload: str = "chat") -> str:
+        """Complete response text of a non-streaming generation"""
+        async with self._slot(workload):
+            response, backend = await self._post(
+                "/api/generate", self._payload(prompt, False, options, model, workload),
+                aiohttp.ClientTimeout(total=timeout, connect=OLLAMA_CONNECT_TIMEOUT)
+            )
+            # None (no verdict) unless the call finishes or fails: a cancelled call neither
+            # counts against the backend nor closes its breaker
+            failed = None
+            try:
+                async with response:
+                    data = await response.json(content_type=None)
+                failed = False
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                failed = True
+                raise
+            finally:
+                self.pool.release(backend, failed=failed)
+        return data.get("response", "")
+
+    async def stream(self, prompt: str, options: dict = None, model: str = None,
+                     read_timeout: float = OLLAMA_READ_TIMEOUT, workload: str = "chat") -> AsyncIterator[str]:
+        """Response text pieces as Ollama generates them.
+
+        A stream has no overall deadline, only read_timeout between chunks. Raises OllamaError
+        if the connection ends before Ollama reports done, so callers never mistake a cut-off
+        answer for a complete one. The workload slot is held until the stream is closed.
+        """
+        async with self._slot(workload):
+            response, backend = await self._post(
+                "/api/generate", self._payload(prompt, True, options, model, workload),
+                aiohttp.ClientTimeout(total=None, connect=OLLAMA_CONNECT_TIMEOUT, sock_read=read_timeout)
+            )
+            # Stays None if the consumer stops reading (client gone, task cancelled) before the end
+            failed = None
+            pieces = self._read_stream(response)
+            try:
+                async for piece in pieces:
+                    yield piece
+                failed = False
+            except (aiohttp.ClientError, asyncio.TimeoutError, OllamaStreamCut):
+                failed = True
+                raise
+            except OllamaError:
+                # Ollama reported an error in the stream, so the backend itself is answering
+                failed = False
+                raise
+            finally:
+                # Release the connection now, not when the generator is collected
+                await pieces.aclose()
+                self.pool.release(backend, failed=failed)
+
+    async def _read_stream(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        decoder = NDJSONDecoder()
+        async with response:
+            async for chunk in response.content.iter_any():
+                for data in decoder.feed(chunk):
+                    if data.get("error"):
+                        raise OllamaError(data["error"])
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        return
+            for data in decoder.flush():
+                if data.get("error"):
+                    raise OllamaError(data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    return
+        raise OllamaStreamCut("Ollama stream ended before the response was done")
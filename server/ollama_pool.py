@@ -0,0 +1,154 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Iterable, List, Optional, Set
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+def model_key(name: str) -> str:
+    """Ollama's name for a model, which defaults the tag to latest"""
+    return name if ":" in name else f"{name}:latest"
+
+class OllamaBackend:
+    """One Ollama server: its models, in-flight calls and circuit breaker state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.models: Optional[Set[str]] = None  # unknown until the first health probe
+        self.healthy = True
+        self.probe_failures = 0  # consecutive failed health probes
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.requests = 0
+        self.errors = 0
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model_key(model) in self.models
+
+    def available(self, now: float) -> bool:
+        """Closed circuit, or an open one whose cooldown is over and has no trial call out yet"""
+        if not self.healthy:
+            return False
+        if self.open_until == 0.0:
+            return True
+        return now >= self.open_until and not self.trial
+
+    def to_dict(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "circuit": "closed" if self.open_until == 0.0 else "open",
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "models": sorted(self.models) if self.models is not None else None,
+        }
+
+class OllamaPool:
+    """Ollama servers that OllamaClient spreads calls over.
+
+    Each call goes to the backend with the fewest calls in flight among those that are healthy,
+    have the call's model pulled and whose circuit is closed. A backend's circuit opens after
+    breaker_failures consecutive connection or 5xx failures and stays open for breaker_cooldown
+    seconds; then one trial call (or a passing health probe) decides whether it closes again.
+    Health probes list each backend's models, which is what routes e.g. classification to the
+    instance that has the small model. A backend is only taken out as unhealthy after
+    probe_failures probes in a row fail, so one slow /api/tags answer does not eject it (with a
+    single backend, that would fail every call until the next probe).
+    """
+
+    def __init__(self, urls: Iterable[str], health_interval: float, probe_timeout: float,
+                 breaker_failures: int, breaker_cooldown: float, probe_failures: int = 3):
+        self.backends: List[OllamaBackend] = [OllamaBackend(url) for url in urls]
+        if not self.backends:
+            raise ValueError("OllamaPool needs at least one backend URL")
+        self.health_interval = health_interval
+        self.probe_timeout = probe_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.probe_failures = probe_failures
+        self._worker: Optional[asyncio.Task] = None
+
+    def acquire(self, model: str, exclude: Iterable[OllamaBackend] = ()) -> Optional[OllamaBackend]:
+        """Least-outstanding available backend for the model, or None; release() it when the call ends"""
+        now = time.monotonic()
+        excluded = set(map(id, exclude))
+        candidates = [backend for backend in self.backends
+                      if id(backend) not in excluded and backend.serves(model) and backend.available(now)]
+        if not candidates:
+            return None
+        backend = min(candidates, key=lambda b: (b.outstanding, random.random()))
+        if backend.open_until:
+            backend.trial = True
+        backend.outstanding += 1
+        backend.requests += 1
+        return backend
+
+    def release(self, backend: OllamaBackend, failed: Optional[bool] = False):
+        """End a call; failed is None when it ended (e.g. was cancelled) without showing whether the backend works"""
+        backend.outstanding -= 1
+        if failed:
+            self._record_failure(backend)
+        elif failed is not None and (backend.trial or backend.failures):
+            self._close(backend)
+        backend.trial = False
+
+    def _record_failure(self, backend: OllamaBackend):
+        backend.errors += 1
+        backend.failures += 1
+        if backend.trial or backend.failures >= self.breaker_failures:
+            if backend.open_until == 0.0:
+                logger.warning(f"Ollama backend {backend.url} failed {backend.failures} times, "
+                               f"opening circuit for {self.breaker_cooldown:.0f}s")
+            backend.open_until = time.monotonic() + self.breaker_cooldown
+
+    def _close(self, backend: OllamaBackend):
+        if backend.open_until:
+            logger.info(f"Ollama backend {backend.url} recovered, closing circuit")
+        backend.failures = 0
+        backend.open_until = 0.0
+
+    def start(self, session: aiohttp.ClientSession):
+        self._worker = asyncio.create_task(self._run(session))
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, session: aiohttp.ClientSession):
+        while True:
+            await asyncio.gather(*(self._probe(session, backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    async def _probe(self, session: aiohttp.ClientSession, backend: OllamaBackend):
+        """Mark the backend up with its model list, or down if /api/tags does not answer"""
+        try:
+            async with session.get(f"{backend.url}/api/tags",
+                                   timeout=aiohttp.ClientTimeout(total=self.probe_timeout)) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            backend.probe_failures += 1
+            if backend.healthy and backend.probe_failures >= self.probe_failures:
+                logger.warning(f"Ollama backend {backend.url} failed {backend.probe_failures} health checks "
+                               f"in a row, taking it out of rotation: {e}")
+                backend.healthy = False
+            return
+        if not backend.healthy:
+            logger.info(f"Ollama backend {backend.url} is healthy again")
+        backend.healthy = True
+        backend.probe_failures = 0
+        backend.models = {model_key(model["name"]) for model in data.get("models", [])}
+        if backend.open_until and not backend.trial:
+            self._close(backend)
+
+    def stats(self) -> dict:
+        return {backend.url: backend.to_dict() for backend in self.backends}
@@ -0,0 +1,96 @@
+import time
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingBatcher:
+    """Coalesces concurrent query embeddings into one batched forward pass.
+
+    Requests wait at most max_wait_ms for others to join (or until max_batch_size is reached),
+    then the whole batch is embedded on the executor and each caller's future is resolved.
+    On CPU a batch of 16 costs little more than a batch of 1, so this raises peak throughput.
+    """
+
+    def __init__(self, embed_batch_fn: Callable[[List[str]], List[List[float]]], max_batch_size: int = 16,
+                 max_wait_ms: float = 5, executor=None):
+        self.embed_batch_fn = embed_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.queue_wait = Histogram([0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1])
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.batch_latency = Histogram([0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1])
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            # Fail whatever is still waiting instead of leaving callers hanging
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Query embedding batcher stopped"))
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embedding for one query, computed together with any concurrent ones"""
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait.observe(started - enqueued)
+            self.batch_size.observe(len(batch))
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.embed_batch_fn, [text for text, _, _ in batch])
+            except Exception as e:
+                logger.error(f"Query embedding batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_latency.observe(time.perf_counter() - started)
+            for (_, future, _), vector in zip(batch, vectors):
+                # The caller may have been cancelled (client disconnected) while waiting
+                if not future.done():
+                    future.set_result(np.asarray(vector, dtype=np.float32))
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "batch_latency_seconds": self.batch_latency.snapshot(),
+        }
@@ -0,0 +1,107 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry overhead of the dict slot, key string object and array header
+ENTRY_OVERHEAD_BYTES = 200
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, ignoring trailing punctuation"""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?.! ")
+
+class QueryEmbeddingCache:
+    """LRU + TTL cache of normalized question -> embedding in front of embed_query.
+
+    Bounded by an approximate memory cap rather than an entry count, since the size of
+    an entry depends on the embedding dimension. Repeat questions skip the model entirely.
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]], max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600):
+        self.embed_fn = embed_fn
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _entry_bytes(key: str, vector: np.ndarray) -> int:
+        return vector.nbytes + len(key) + ENTRY_OVERHEAD_BYTES
+
+    def get(self, question: str):
+        """Cached vector for a question, or None"""
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._pop(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def put(self, question: str, vector):
+        key = normalize_question(question)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (vector, time.monotonic())
+            self._bytes += self._entry_bytes(key, vector)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _pop(self, key: str):
+        vector, _ = self._entries.pop(key)
+        self._bytes -= self._entry_bytes(key, vector)
+
+    def embed_query(self, question: str) -> np.ndarray:
+        """Embedding for a question, from the cache when it was asked recently"""
+        vector = self.get(question)
+        if vector is not None:
+            self.hits += 1
+            return vector
+        self.misses += 1
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        self.put(question, vector)
+        return vector
+
+    async def aembed_query(self, question: str, aembed_fn: Callable[[str], Awaitable]) -> np.ndarray:
+        """embed_query for async callers, computing misses with aembed_fn (e.g. the query batcher)"""
+        vector = self.get(question)
+        if vector is not None:
+            self.hits += 1
+            return vector
+        self.misses += 1
+        vector = np.asarray(await aembed_fn(question), dtype=np.float32)
+        self.put(question, vector)
+        return vector
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,155 @@
+import json
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("GENERAL", "RAG")
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class QueryClassifier:
+    """Nearest-centroid GENERAL/RAG classifier over the question embeddings chat already computes.
+
+    Each label's centroid is the mean of its labelled exemplars' embeddings. A question goes to
+    the closer centroid when the cosine margin between the two is at least min_margin; closer
+    calls return None and are left to the LLM, as is every call while min_margin is None. Scoring is one small matrix-vector product, so it
+    adds microseconds on top of the question embedding the answer cache needs anyway.
+    """
+
+    def __init__(self, exemplars: Dict[str, Sequence[str]], embed_documents: Callable[[List[str]], List[List[float]]],
+                 min_margin: Optional[float]):
+        self.min_margin = min_margin
+        self.labels = [label for label in LABELS if exemplars.get(label)]
+        if len(self.labels) != len(LABELS):
+            raise ValueError(f"Query classifier needs exemplars for each of {LABELS}")
+        centroids = []
+        for label in self.labels:
+            vectors = _normalize(np.asarray(embed_documents(list(exemplars[label])), dtype=np.float32))
+            centroids.append(vectors.mean(axis=0))
+        self.centroids = _normalize(np.stack(centroids))
+        self.decisions = {"keyword": 0, "embedding": 0, "llm": 0}
+
+    @classmethod
+    def from_file(cls, path: str, embed_documents: Callable[[List[str]], List[List[float]]],
+                  min_margin: Optional[float]) -> "QueryClassifier":
+        """Classifier from a JSON file of {"GENERAL": [...], "RAG": [...]} exemplar queries"""
+        with open(path, "r", encoding="utf-8") as f:
+            exemplars = json.load(f)
+        classifier = cls(exemplars, embed_documents, min_margin)
+        logger.info(f"Query classifier: {sum(len(v) for v in exemplars.values())} exemplars, "
+                    f"min margin {'unset, Ollama decides' if min_margin is None else min_margin}")
+        return classifier
+
+    def predict(self, query_vector) -> Tuple[Optional[str], float]:
+        """Closest label and its cosine margin over the other; the label is None below min_margin or without one"""
+        scores = self.centroids @ _normalize(np.asarray(query_vector, dtype=np.float32))
+        best, second = np.argsort(scores)[::-1][:2]
+        margin = float(scores[best] - scores[second])
+        decided = self.min_margin is not None and margin >= self.min_margin
+        return (self.labels[best] if decided else None), margin
+
+    def stats(self) -> dict:
+        total = sum(self.decisions.values())
+        return {
+            **self.decisions,
+            "llm_fallback_rate": round(self.decisions["llm"] / total, 4) if total else 0.0,
+            "min_margin": self.min_margin,
+        }
+
+if __name__ == "__main__":
+    # python -m server.query_classifier [eval.jsonl] [--llm] [--target=0.95]
+    # Accuracy and LLM fallback rate on a labelled set, and the smallest min margin whose local
+    # decisions reach the target accuracy (the QUERY_CLASSIFIER_MIN_MARGIN to use);
+    # --llm also classifies fallbacks with Ollama
+    import sys
+    import asyncio
+    from .config import EMBEDDING_MODEL, QUERY_EXEMPLARS_PATH, QUERY_EVAL_PATH, QUERY_CLASSIFIER_MIN_MARGIN
+    from .embedding_backend import load_embeddings
+    from .utils import classify_query_shared, keyword_classification
+
+    logging.basicConfig(level=logging.INFO)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    use_llm = "--llm" in sys.argv
+    target = next((float(arg.split("=", 1)[1]) for arg in sys.argv if arg.startswith("--target=")), 0.95)
+    with open(args[0] if args else QUERY_EVAL_PATH, "r", encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    embeddings = load_embeddings(EMBEDDING_MODEL, "torch")
+    classifier = QueryClassifier.from_file(QUERY_EXEMPLARS_PATH, embeddings.embed_documents, QUERY_CLASSIFIER_MIN_MARGIN)
+
+    started = time.perf_counter()
+    vectors = [embeddings.embed_query(case["query"]) for case in cases]
+    embed_ms = (time.perf_counter() - started) * 1000 / len(cases)
+    started = time.perf_counter()
+    keyword_labels = [keyword_classification(case["query"]) for case in cases]
+    predictions = [classifier.predict(vector) for vector in vectors]
+    score_ms = (time.perf_counter() - started) * 1000 / len(cases)
+
+    def report() -> Tuple[int, int, List[int]]:
+        """Correct local decisions, LLM fallbacks and the indexes of the fallback queries"""
+        correct, fallback, undecided = 0, 0, []
+        for i, (case, keyword, (label, _)) in enumerate(zip(cases, keyword_labels, predictions)):
+            local = keyword or label
+            if local is None:
+                fallback += 1
+                undecided.append(i)
+            elif local == case["label"]:
+                correct += 1
+        return correct, fallback, undecided
+
+    print(f"{len(cases)} queries; embedding {embed_ms:.2f} ms/query, keyword + centroid scoring {score_ms:.3f} ms/query")
+    print(f"{'min margin':>10} {'local acc':>10} {'fallback':>9}")
+    suggested = None
+    margins = {round(0.01 * step, 2) for step in range(11)}
+    if QUERY_CLASSIFIER_MIN_MARGIN is not None:
+        margins.add(QUERY_CLASSIFIER_MIN_MARGIN)
+    for min_margin in sorted(margins):
+        classifier.min_margin = min_margin
+        predictions = [classifier.predict(vector) for vector in vectors]
+        correct, fallback, _ = report()
+        decided = len(cases) - fallback
+        accuracy = correct / decided if decided else 0.0
+        if suggested is None and decided and accuracy >= target:
+            suggested = min_margin
+        marker = " *" if min_margin == QUERY_CLASSIFIER_MIN_MARGIN else ""
+        print(f"{min_margin:>10.2f} {accuracy:>10.1%} {fallback / len(cases):>9.1%}{marker}")
+    if suggested is None:
+        print(f"No min margin up to 0.10 reaches {target:.0%} local accuracy; add exemplars")
+    else:
+        print(f"Smallest min margin with {target:.0%} local accuracy: {suggested:.2f} "
+              f"(QUERY_CLASSIFIER_MIN_MARGIN is {QUERY_CLASSIFIER_MIN_MARGIN})")
+
+    # Mistakes at the configured margin, or at the suggested one while none is set
+    classifier.min_margin = QUERY_CLASSIFIER_MIN_MARGIN if QUERY_CLASSIFIER_MIN_MARGIN is not None else suggested
+    predictions = [classifier.predict(vector) for vector in vectors]
+    correct, fallback, undecided = report()
+    for i, case in enumerate(cases):
+        label = keyword_labels[i] or predictions[i][0]
+        if label is not None and label != case["label"]:
+            print(f"  wrong: {case['query']!r} -> {label} (expected {case['label']}, margin {predictions[i][1]:.3f})")
+
+    if use_llm and undecided:
+        from .ollama_client import OllamaClient, create_session
+        from .ollama_pool import OllamaPool
+        from .config import (MODEL_NAME, OLLAMA_BACKENDS, OLLAMA_HEALTH_INTERVAL, OLLAMA_CONNECT_TIMEOUT,
+                             OLLAMA_BREAKER_FAILURES, OLLAMA_BREAKER_COOLDOWN, OLLAMA_PROBE_FAILURES, LLM_MODELS)
+
+        async def classify_fallbacks() -> List[str]:
+            session = create_session()
+            pool = OllamaPool(OLLAMA_BACKENDS, OLLAMA_HEALTH_INTERVAL, OLLAMA_CONNECT_TIMEOUT,
+                              OLLAMA_BREAKER_FAILURES, OLLAMA_BREAKER_COOLDOWN, OLLAMA_PROBE_FAILURES)
+            ollama = OllamaClient(session, pool, MODEL_NAME, models=LLM_MODELS)
+            try:
+                return [await classify_query_shared(cases[i]["query"], {}, ollama) for i in undecided]
+            finally:
+                await ollama.close()
+
+        llm_labels = asyncio.run(classify_fallbacks())
+        correct += sum(label == cases[i]["label"] for i, label in zip(undecided, llm_labels))
+        print(f"End-to-end accuracy with LLM fallback: {correct / len(cases):.1%}")
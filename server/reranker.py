@@ -0,0 +1,98 @@
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CrossEncoderReranker:
+    """Reorders retrieved chunks by cross-encoder relevance to the question.
+
+    All uncached (question, chunk) pairs are scored in one batched CPU call. Scores are cached
+    per (question hash, chunk id); chunk ids are never reused, so entries cannot go stale.
+    If scoring does not finish within the time budget the dense order is kept.
+    """
+
+    def __init__(self, model_name: str, time_budget: float = 0.25, cache_size: int = 10000, max_length: int = 512):
+        self.model_name = model_name
+        self.time_budget = time_budget
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self._model = None
+        self._scores: "OrderedDict[Tuple[bytes, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.timeouts = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+            logger.info(f"Loaded reranker {self.model_name}")
+        return self._model
+
+    def warm_up(self):
+        """Load the model and run one pair so the first request is not spent loading weights"""
+        self.model.predict([("warm up", "warm up")], show_progress_bar=False)
+
+    @staticmethod
+    def query_key(question: str) -> bytes:
+        return hashlib.blake2b(" ".join(question.lower().split()).encode("utf-8"), digest_size=16).digest()
+
+    def _cached(self, key) -> float:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def _store(self, scores: dict):
+        with self._lock:
+            self._scores.update(scores)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def score(self, question: str, docs: List) -> List[float]:
+        """Relevance score for each doc, computing uncached pairs in a single batch"""
+        query_key = self.query_key(question)
+        keys = [(query_key, doc.id or doc.page_content) for doc in docs]
+        scores = [self._cached(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            start = time.perf_counter()
+            pairs = [(question, docs[i].page_content) for i in missing]
+            new_scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            self._store({keys[i]: float(score) for i, score in zip(missing, new_scores)})
+            for i, score in zip(missing, new_scores):
+                scores[i] = float(score)
+            logger.info(f"Reranked {len(pairs)} pairs in {time.perf_counter() - start:.3f}s "
+                        f"({len(docs) - len(pairs)} cached)")
+        return scores
+
+    def rerank(self, question: str, docs: List) -> List:
+        """Docs sorted by descending cross-encoder score"""
+        if len(docs) < 2:
+            return docs
+        scores = self.score(question, docs)
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order]
+
+    async def rerank_async(self, question: str, docs: List, executor=None) -> List:
+        """Rerank on an executor, returning docs unchanged if the time budget is exceeded"""
+        if len(docs) < 2:
+            return docs
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(executor, self.rerank, question, docs)
+        try:
+            # shield: a late result still fills the score cache for the next identical question
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.time_budget)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Rerank exceeded {self.time_budget}s budget, keeping dense order")
+            return docs
+        except Exception as e:
+            logger.error(f"Rerank failed, keeping dense order: {e}")
+            return docs
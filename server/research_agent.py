@@ -5,18 +5,18 @@ import re
 from typing import List, Dict, Any
 from tavily import TavilyClient
 from .models import WebSearchResult
+from .llm_scheduler import LLMOverloaded
 from .config import (
     TAVILY_API_KEY, MAX_SEARCH_RESULTS, RESEARCH_PLAN_PROMPT, RESEARCH_SYNTHESIS_PROMPT,
-    RESEARCH_PLAN_CONTEXT_SIZE, RESEARCH_CONTEXT_SIZE, RESEARCH_PLAN_TEMPERATURE, 
-    RESEARCH_SYNTHESIS_TEMPERATURE, GPU_LAYERS, MODEL_NAME
+    RESEARCH_PLAN_OPTIONS, RESEARCH_SYNTHESIS_OPTIONS
 )
 from .utils import clean_web_content, calculate_relevance_score, extract_domain
 
 logger = logging.getLogger(__name__)
 
 class ResearchAgent:
-    def __init__(self, ollama_session):
-        self.ollama_session = ollama_session
+    def __init__(self, ollama):
+        self.ollama = ollama
         self.tavily_client = TavilyClient(api_key=TAVILY_API_KEY) if TAVILY_API_KEY else None
 
     async def search_web_async(self, query: str, max_results: int = None) -> List[WebSearchResult]:
@@ -63,65 +63,17 @@ class ResearchAgent:
         try:
             prompt = RESEARCH_PLAN_PROMPT.format(query=query)
             
-            # Use Ollama directly for plan generation with research-optimized settings
-            ollama_url = "http://localhost:11434/api/generate"
-            payload = {
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": RESEARCH_PLAN_TEMPERATURE,
-                    "num_ctx": RESEARCH_PLAN_CONTEXT_SIZE,
-                    "num_gpu": GPU_LAYERS
-                }
-            }
-            
-            async with self.ollama_session.post(ollama_url, json=payload) as response:
-                if response.status != 200:
-                    raise Exception(f"Ollama API error: {response.status}")
-                
-                data = await response.json()
-                response_text = data.get('response', '')
-                
-                # Try to parse JSON from response
-                try:
-                    # Find JSON in the response
-                    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                    if json_match:
-                        plan = json.loads(json_match.group())
-                    else:
-                        # Fallback: create a detailed plan
-                        plan = {
-                            "objectives": [
-                                f"Research {query} comprehensively",
-                                f"Find latest developments and research in {query}",
-                                f"Identify key experts and authoritative sources on {query}"
-                            ],
-                            "search_queries": [
-                                f"{query} latest research papers 2024",
-                                f"{query} recent developments news",
-                                f"{query} expert analysis insights",
-                                f"{query} technical documentation guide"
-                            ],
-                            "sources": [
-                                "academic papers and research journals",
-                                "latest news and industry reports", 
-                                "expert opinions and analysis",
-                                "technical documentation and guides"
-                            ],
-                            "analysis_framework": [
-                                "background and fundamentals",
-                                "current state and latest developments",
-                                "key findings and breakthroughs",
-                                "implications and future outlook"
-                            ]
-                        }
-                    
-                    return plan
-                    
-                except json.JSONDecodeError:
-                    # Fallback plan if JSON parsing fails
-                    return {
+            # Plan generation with research-optimized settings
+            response_text = await self.ollama.generate(prompt, options=RESEARCH_PLAN_OPTIONS, workload="research")
+            # Try to parse JSON from response
+            try:
+                # Find JSON in the response
+                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+                if json_match:
+                    plan = json.loads(json_match.group())
+                else:
+                    # Fallback: create a detailed plan
+                    plan = {
                         "objectives": [
                             f"Research {query} comprehensively",
                             f"Find latest developments and research in {query}",
@@ -146,7 +98,39 @@ class ResearchAgent:
                             "implications and future outlook"
                         ]
                     }
-                    
+                
+                return plan
+                
+            except json.JSONDecodeError:
+                # Fallback plan if JSON parsing fails
+                return {
+                    "objectives": [
+                        f"Research {query} comprehensively",
+                        f"Find latest developments and research in {query}",
+                        f"Identify key experts and authoritative sources on {query}"
+                    ],
+                    "search_queries": [
+                        f"{query} latest research papers 2024",
+                        f"{query} recent developments news",
+                        f"{query} expert analysis insights",
+                        f"{query} technical documentation guide"
+                    ],
+                    "sources": [
+                        "academic papers and research journals",
+                        "latest news and industry reports", 
+                        "expert opinions and analysis",
+                        "technical documentation and guides"
+                    ],
+                    "analysis_framework": [
+                        "background and fundamentals",
+                        "current state and latest developments",
+                        "key findings and breakthroughs",
+                        "implications and future outlook"
+                    ]
+                }
+                
+        except LLMOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error generating research plan: {e}")
             raise Exception(f"Failed to generate research plan: {str(e)}")
@@ -168,36 +152,13 @@ class ResearchAgent:
                 content=content
             )
             
-            # Use Ollama for synthesis with large context window
-            ollama_url = "http://localhost:11434/api/generate"
-            payload = {
-                "model": MODEL_NAME,
-                "prompt": synthesis_prompt,
-                "stream": True,
-                "options": {
-                    "temperature": RESEARCH_SYNTHESIS_TEMPERATURE,
-                    "num_ctx": RESEARCH_CONTEXT_SIZE,  # 24K context for research synthesis
-                    "num_gpu": GPU_LAYERS
-                }
-            }
-            
-            async with self.ollama_session.post(ollama_url, json=payload) as response:
-                if response.status != 200:
-                    raise Exception(f"Ollama API error: {response.status}")
-                
-                full_response = ""
-                async for line in response.content:
-                    if line:
-                        try:
-                            data = json.loads(line.decode('utf-8'))
-                            if 'response' in data:
-                                full_response += data['response']
-                            if data.get('done', False):
-                                break
-                        except json.JSONDecodeError:
-                            continue
-                
-                return full_response
+            # Use Ollama for synthesis with large context window (24K for research synthesis)
+            parts = []
+            async for piece in self.ollama.stream(
+                synthesis_prompt, options=RESEARCH_SYNTHESIS_OPTIONS, workload="research"
+            ):
+                parts.append(piece)
+            return "".join(parts)
                 
         except Exception as e:
             logger.error(f"Error synthesizing research results: {e}")
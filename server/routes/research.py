@@ -1,30 +1,25 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 import json
 import logging
-import aiohttp
 from typing import Dict, Any, List
 
 from ..models import ResearchPlanRequest, ResearchPlanResponse, ResearchExecuteRequest, ResearchExecuteResponse, WebSearchResult
-from ..config import (
-    RESEARCH_MODE_ENABLED, RESEARCH_SYNTHESIS_PROMPT, RESEARCH_CONTEXT_SIZE, 
-    RESEARCH_SYNTHESIS_TEMPERATURE, GPU_LAYERS, MODEL_NAME
-)
+from ..config import RESEARCH_MODE_ENABLED, RESEARCH_SYNTHESIS_PROMPT, RESEARCH_SYNTHESIS_OPTIONS
 from ..research_agent import ResearchAgent
+from ..llm_scheduler import LLMOverloaded
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-async def get_research_agent():
-    """Create a ResearchAgent instance with aiohttp session"""
-    session = aiohttp.ClientSession()
-    return ResearchAgent(session)
+def get_research_agent(request: Request) -> ResearchAgent:
+    """The app's ResearchAgent, which uses the shared Ollama connection pool"""
+    return request.app.state.research_agent
 
-async def stream_research_response(query: str, plan: Dict[str, Any], search_results: List[Dict[str, Any]]):
+async def stream_research_response(research_agent: ResearchAgent, query: str, plan: Dict[str, Any],
+                                   search_results: List[Dict[str, Any]]):
     """Stream research synthesis response with optimized context window"""
     try:
-        research_agent = await get_research_agent()
-        
         # Convert search results back to WebSearchResult objects
         web_results = [WebSearchResult(**result) for result in search_results]
         
@@ -42,46 +37,23 @@ async def stream_research_response(query: str, plan: Dict[str, Any], search_resu
             content=content
         )
         
-        # Stream from Ollama with large context window for research synthesis
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": synthesis_prompt,
-            "stream": True,
-            "options": {
-                "temperature": RESEARCH_SYNTHESIS_TEMPERATURE,
-                "num_ctx": RESEARCH_CONTEXT_SIZE,  # 24K context for research synthesis
-                "num_gpu": GPU_LAYERS
-            }
-        }
-        
-        async with research_agent.ollama_session.post(ollama_url, json=payload) as response:
-            if response.status != 200:
-                yield f"Error: Ollama API error {response.status}"
-                return
-            
-            async for line in response.content:
-                if line:
-                    try:
-                        data = json.loads(line.decode('utf-8'))
-                        if 'response' in data:
-                            yield data['response']
-                        if data.get('done', False):
-                            break
-                    except json.JSONDecodeError:
-                        continue
+        # Stream from Ollama with large context window for research synthesis (24K)
+        async for piece in research_agent.ollama.stream(
+            synthesis_prompt, options=RESEARCH_SYNTHESIS_OPTIONS, workload="research"
+        ):
+            yield piece
                         
     except Exception as e:
         yield f"Error: {str(e)}"
 
 @router.post("/plan")
-async def create_research_plan(request: ResearchPlanRequest):
+async def create_research_plan(request: ResearchPlanRequest,
+                               research_agent: ResearchAgent = Depends(get_research_agent)):
     """Generate a research plan for the given query"""
     if not RESEARCH_MODE_ENABLED:
         return JSONResponse({"error": "Research mode is disabled"}, status_code=400)
     
     try:
-        research_agent = await get_research_agent()
         plan = await research_agent.generate_research_plan(request.query)
         
         # Debug logging
@@ -109,19 +81,20 @@ async def create_research_plan(request: ResearchPlanRequest):
             query=request.query,
             status="success"
         )
+    except LLMOverloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code, headers=e.headers())
     except Exception as e:
         logger.error(f"Error creating research plan: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @router.post("/execute")
-async def execute_research_plan(request: ResearchExecuteRequest):
+async def execute_research_plan(request: ResearchExecuteRequest,
+                                research_agent: ResearchAgent = Depends(get_research_agent)):
     """Execute a research plan and return results"""
     if not RESEARCH_MODE_ENABLED:
         return JSONResponse({"error": "Research mode is disabled"}, status_code=400)
     
     try:
-        research_agent = await get_research_agent()
-        
         # Use refined plan if provided, otherwise use original plan
         plan = request.refined_plan if request.refined_plan else request.plan
         
@@ -139,7 +112,7 @@ async def execute_research_plan(request: ResearchExecuteRequest):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @router.post("/stream")
-async def research_stream(request: Request):
+async def research_stream(request: Request, research_agent: ResearchAgent = Depends(get_research_agent)):
     """Stream research synthesis response"""
     if not RESEARCH_MODE_ENABLED:
         return JSONResponse({"error": "Research mode is disabled"}, status_code=400)
@@ -152,10 +125,17 @@ async def research_stream(request: Request):
     if not query or not plan:
         return JSONResponse({"error": "Query and plan are required"}, status_code=400)
     
+    # Shed load before the 200 is sent; the position is a hint for the client while it waits
+    try:
+        position = research_agent.ollama.scheduler.admit("research")
+    except LLMOverloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code, headers=e.headers())
+    
     try:
         return StreamingResponse(
-            stream_research_response(query, plan, search_results),
-            media_type="text/plain"
+            stream_research_response(research_agent, query, plan, search_results),
+            media_type="text/plain",
+            headers={"X-Queue-Position": str(position)}
         )
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500) 
\ No newline at end of file
@@ -1,35 +1,13 @@
 import os
 import csv
-import hashlib
-import pickle
-import numpy as np
 import re
 from urllib.parse import urlparse
-from typing import List
+from typing import List, Optional
 from bs4 import BeautifulSoup
 import logging
 
 logger = logging.getLogger(__name__)
 
-def compute_file_hash(files: List[str]) -> str:
-    """Compute hash for file list"""
-    return hashlib.md5("".join(sorted(files)).encode()).hexdigest()
-
-def load_cached_embeddings(file_hash: str, embed_cache_path: str):
-    """Load cached embeddings if available"""
-    cache_file = os.path.join(embed_cache_path, f"{file_hash}.pkl")
-    if os.path.exists(cache_file):
-        with open(cache_file, 'rb') as f:
-            return pickle.load(f)
-    return None
-
-def save_cached_embeddings(file_hash: str, documents: List, embeddings: np.ndarray, embed_cache_path: str):
-    """Save embeddings to cache"""
-    os.makedirs(embed_cache_path, exist_ok=True)
-    cache_file = os.path.join(embed_cache_path, f"{file_hash}.pkl")
-    with open(cache_file, 'wb') as f:
-        pickle.dump({'documents': documents, 'embeddings': embeddings}, f)
-
 def read_metadata_csv(metadata_path: str) -> dict:
     """Read metadata from CSV file"""
     with open(metadata_path, 'r', encoding='utf-8') as f:
@@ -52,10 +30,11 @@ def delete_file_and_metadata(file_name: str, documents_dir: str):
     if os.path.exists(metadata_path):
         os.remove(metadata_path)
 
-def remove_vectors_from_index(vector_store, file_name: str):
-    """Remove vectors for a specific file from the index"""
-    vector_store.delete([doc_id for doc_id, doc in vector_store.docstore._dict.items()
-                        if doc.metadata.get("file_name") == file_name.replace('.pdf', '')])
+def remove_vectors_from_index(vector_store, file_name: str) -> List[int]:
+    """Remove vectors for a specific file from the index; returns the removed chunk ids"""
+    chunk_ids = vector_store.chunks.ids_for_file(file_name.replace('.pdf', ''))
+    vector_store.delete(chunk_ids)
+    return chunk_ids
 
 def clean_web_content(html_content: str, max_length: int = 8000) -> str:
     """Clean and extract text content from HTML with configurable length limit"""
@@ -108,29 +87,62 @@ def extract_domain(url: str) -> str:
     except:
         return url 
 
-# Classification keywords for quick matching
+# Classification keywords for quick matching, as whole words ("hi" must not match "this" or "history").
+# Only unambiguous ones: everything else is left to the embedding classifier.
 GENERAL_KEYWORDS = ['hi', 'hello', 'hey', 'how are you', 'good morning', 'good afternoon', 'good evening', 'thanks', 'thank you', 'bye', 'goodbye']
-RAG_KEYWORDS = ['chapter', 'assignment', 'syllabus', 'exam', 'project', 'document', 'pdf', 'read', 'explain', 'summarize', 'what does', 'how to', 'requirements']
+RAG_KEYWORDS = ['chapter', 'assignment', 'syllabus', 'exam', 'project', 'document', 'pdf', 'summarize', 'requirements']
+
+def _keyword_pattern(keywords: List[str]) -> re.Pattern:
+    return re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b")
 
-async def classify_query_shared(question: str, student_context: dict, ollama_session) -> str:
+# Words that may come with a greeting or thanks without turning it into a question ("thanks a lot")
+SMALL_TALK_FILLER = ['there', 'again', 'so much', 'a lot', 'very much', 'ok', 'okay']
+
+# A query made up only of greetings, thanks and filler; "hi, can you explain normalization?" is not one
+SMALL_TALK_PATTERN = re.compile(r"(?:\W*" + _keyword_pattern(GENERAL_KEYWORDS + SMALL_TALK_FILLER).pattern + r")+\W*")
+RAG_PATTERN = _keyword_pattern(RAG_KEYWORDS)
+
+def keyword_classification(question: str) -> Optional[str]:
+    """"GENERAL" or "RAG" for queries the keyword lists settle, None otherwise"""
+    query_lower = question.lower().strip()
+    
+    # Course keywords win, so "hi, what's in the syllabus" still gets documents
+    if RAG_PATTERN.search(query_lower):
+        return "RAG"
+    # A greeting in front of a question leaves the question to the classifiers
+    if SMALL_TALK_PATTERN.fullmatch(query_lower):
+        return "GENERAL"
+    return None
+
+def local_classification(question: str, classifier=None, query_vector=None) -> Optional[str]:
+    """Keyword or embedding classification, or None when the query is close enough to need the LLM"""
+    label = keyword_classification(question)
+    if label:
+        if classifier:
+            classifier.decisions["keyword"] += 1
+        return label
+    if classifier is None or query_vector is None:
+        return None
+    label, _ = classifier.predict(query_vector)
+    if label:
+        classifier.decisions["embedding"] += 1
+    return label
+
+async def classify_query_shared(question: str, student_context: dict, ollama, classifier=None, query_vector=None) -> str:
     """
     Shared classification function used by both main.py and classification.py
-    Returns "GENERAL" or "RAG"
+    Returns "GENERAL" or "RAG"; Ollama is only asked when keywords and the embedding classifier are unsure
     """
     try:
-        # Quick keyword-based classification for common cases
-        query_lower = question.lower().strip()
-        
-        # Check for obvious general queries
-        if any(keyword in query_lower for keyword in GENERAL_KEYWORDS):
-            return "GENERAL"
-        
-        # Check for obvious RAG queries
-        if any(keyword in query_lower for keyword in RAG_KEYWORDS):
-            return "RAG"
+        # Keywords, then nearest exemplar centroid of the question embedding
+        quick = local_classification(question, classifier, query_vector)
+        if quick:
+            return quick
+        if classifier:
+            classifier.decisions["llm"] += 1
         
         # Use LLM for ambiguous cases
-        from .config import QUERY_CLASSIFICATION_PROMPT, MODEL_NAME
+        from .config import QUERY_CLASSIFICATION_PROMPT, CLASSIFICATION_OPTIONS
         
         prompt = QUERY_CLASSIFICATION_PROMPT.format(
             department=student_context.get('department', ''),
@@ -138,35 +150,19 @@ async def classify_query_shared(question: str, student_context: dict, ollama_ses
             query=question
         )
         
-        # Use the existing connection pool
-        ollama_url = "http://localhost:11434/api/generate"
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,
-                "num_predict": 5,
-                "top_k": 1,
-                "top_p": 0.1,
-                "num_ctx": 512
-            }
-        }
+        # Use the shared Ollama client
+        classification = (await ollama.generate(prompt, options=CLASSIFICATION_OPTIONS, workload="classification")).strip().upper()
         
-        async with ollama_session.post(ollama_url, json=payload) as response:
-            result = await response.json()
-            classification = result.get('response', '').strip().upper()
-            
-            if classification not in ["GENERAL", "RAG"]:
-                if "GENERAL" in classification:
-                    return "GENERAL"
-                elif "RAG" in classification:
-                    return "RAG"
-                else:
-                    return "RAG"  # Default to RAG for unclear cases
-            
-            return classification
+        if classification not in ["GENERAL", "RAG"]:
+            if "GENERAL" in classification:
+                return "GENERAL"
+            elif "RAG" in classification:
+                return "RAG"
+            else:
+                return "RAG"  # Default to RAG for unclear cases
+        
+        return classification
             
     except Exception as e:
-        # Default to RAG on error
+        # Default to RAG on error, including a shed classification call
         return "RAG" 
\ No newline at end of file
@@ -0,0 +1,618 @@
+import os
+import json
+import heapq
+import sqlite3
+import logging
+import threading
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from .compaction import (
+    PENDING_SUFFIX, TOMBSTONE_FILE_TEMPLATE, Segment, new_segment_file, plan_compaction
+)
+from .context_filter import ContextFilterIndex, EligibleTier, _as_list
+from .config import HYBRID_SEARCH, HYBRID_CANDIDATES, HYBRID_FUSION, HYBRID_DENSE_WEIGHT, RRF_K
+from .hybrid_search import fts_query, fuse
+from .index_engine import (
+    build_index, configure_index, describe_index, empty_index, index_ids, remove_ids,
+    search_parameters
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.sqlite"
+# Segment and tombstone files are written once and never overwritten: a file that is still
+# mapped (by another worker, or on Windows by an older snapshot of this one) cannot be replaced in place
+# Map codes straight from the page cache instead of copying them. Flat and HNSW codes are mapped
+# zero-copy (MMAP_IFC); IVF inverted lists go through OnDiskInvertedLists (MMAP), which fails
+# to load when MMAP_IFC is also set
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+IVF_MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+# Every IVF index type's fourcc (IwFl, IwSq, IwPQ, ...) starts with this
+IVF_FOURCC_PREFIX = b"Iw"
+
+class ChunkStore:
+    """Chunk text and metadata in SQLite, read lazily by chunk id, with an FTS5 index over the text"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    file_name TEXT
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(chunks)")]
+            if "file_name" not in columns:
+                # Stores created before the file -> chunk id index existed
+                conn.execute("ALTER TABLE chunks ADD COLUMN file_name TEXT")
+                conn.execute("UPDATE chunks SET file_name = json_extract(metadata, '$.file_name')")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file_name ON chunks (file_name)")
+            self._create_lexical_index(conn)
+            self._create_tag_index(conn)
+
+    def _create_lexical_index(self, conn: sqlite3.Connection):
+        """FTS5 inverted index over chunk text, kept in sync with the chunks table by triggers"""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                content, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE OF content ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO chunks_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        if not exists:
+            # Stores created before the lexical index: index the chunks already there
+            conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+    def _create_tag_index(self, conn: sqlite3.Connection):
+        """One row per chunk department/semester, so lexical search filters eligibility in SQL"""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunk_tags'").fetchone()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_tags (
+                chunk_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (chunk_id, kind, value)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunk_tags_delete AFTER DELETE ON chunks BEGIN
+                DELETE FROM chunk_tags WHERE chunk_id = old.id;
+            END
+        """)
+        if not exists:
+            # Stores created before the tag index: tag the chunks already there
+            rows = conn.execute("SELECT id, metadata FROM chunks").fetchall()
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunk_tags VALUES (?, ?, ?)",
+                [tag for chunk_id, metadata in rows for tag in _chunk_tags(chunk_id, json.loads(metadata))]
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, since retrieval runs on executor threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # INSERT OR REPLACE must fire the delete trigger so the lexical index drops the old row
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+        return conn
+
+    def get(self, ids: Iterable[int]) -> List[Optional[Document]]:
+        """Documents for the given chunk ids, in the same order (None for unknown ids)"""
+        ids = [int(chunk_id) for chunk_id in ids]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connection().execute(
+            f"SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        by_id = {
+            row[0]: Document(page_content=row[1], metadata=json.loads(row[2]), id=str(row[0]))
+            for row in rows
+        }
+        return [by_id.get(chunk_id) for chunk_id in ids]
+
+    def add(self, ids: List[int], texts: List[str], metadatas: List[dict]):
+        """Insert chunks"""
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, content, metadata, file_name) VALUES (?, ?, ?, ?)",
+                [(int(chunk_id), text, json.dumps(metadata), metadata.get("file_name"))
+                 for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunk_tags VALUES (?, ?, ?)",
+                [tag for chunk_id, metadata in zip(ids, metadatas) for tag in _chunk_tags(chunk_id, metadata)]
+            )
+
+    def update_metadata(self, ids: Iterable[int], metadata: dict):
+        """Merge metadata fields into the stored metadata of chunks, leaving text and the lexical index alone"""
+        ids = [int(chunk_id) for chunk_id in ids]
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE chunks SET metadata = json_patch(metadata, ?), file_name = ? "
+                "WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(metadata), metadata.get("file_name"), json.dumps(ids))
+            )
+            kinds = [kind for kind, key in TAG_KINDS.items() if key in metadata]
+            if kinds:
+                conn.executemany("DELETE FROM chunk_tags WHERE chunk_id = ? AND kind = ?",
+                                 [(chunk_id, kind) for chunk_id in ids for kind in kinds])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO chunk_tags VALUES (?, ?, ?)",
+                    [tag for chunk_id in ids for tag in _chunk_tags(chunk_id, metadata)]
+                )
+
+    def delete(self, ids: Iterable[int]):
+        """Delete chunks by id"""
+        conn = self._connection()
+        with conn:
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(int(chunk_id),) for chunk_id in ids])
+
+    def ids_for_file(self, file_name: str) -> List[int]:
+        """Chunk ids of one document, via the file_name index"""
+        rows = self._connection().execute("SELECT id FROM chunks WHERE file_name = ?", (file_name,))
+        return [row[0] for row in rows]
+
+    def file_names(self) -> List[str]:
+        """Distinct file names that have chunks"""
+        return [row[0] for row in self._connection().execute("SELECT DISTINCT file_name FROM chunks")]
+
+    def iter_metadata(self) -> Iterator[Tuple[int, dict]]:
+        """(chunk id, metadata) for every chunk, without loading chunk text"""
+        for chunk_id, metadata in self._connection().execute("SELECT id, metadata FROM chunks"):
+            yield chunk_id, json.loads(metadata)
+
+    def keyword_search(self, query: str, k: int, tags: Optional[dict] = None) -> List[Tuple[int, float]]:
+        """(chunk id, BM25 score, higher is better) of the k best lexical matches for a question.
+
+        tags ({"department": ..., "semester": ...}) restricts matches to chunks carrying all of
+        them; each match costs one chunk_tags lookup, whatever the corpus size.
+        """
+        match = fts_query(query)
+        if match is None or k <= 0:
+            return []
+        sql = "SELECT rowid, bm25(chunks_fts) FROM chunks_fts WHERE chunks_fts MATCH ?"
+        params: list = [match]
+        for kind, value in (tags or {}).items():
+            sql += (" AND EXISTS (SELECT 1 FROM chunk_tags"
+                    " WHERE chunk_id = chunks_fts.rowid AND kind = ? AND value = ?)")
+            params.extend([kind, value])
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(k)
+        # SQLite's bm25() is negative, lower meaning more relevant
+        return [(row[0], -row[1]) for row in self._connection().execute(sql, params)]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def retain(self, ids: Iterable[int]):
+        """Delete every chunk whose id is not in ids"""
+        conn = self._connection()
+        with conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS retained_ids (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM retained_ids")
+            conn.executemany("INSERT INTO retained_ids (id) VALUES (?)", [(int(chunk_id),) for chunk_id in ids])
+            conn.execute("DELETE FROM chunks WHERE id NOT IN (SELECT id FROM retained_ids)")
+            conn.execute("DELETE FROM retained_ids")
+
+    def max_id(self) -> int:
+        """Largest chunk id in use, or -1 for an empty store"""
+        row = self._connection().execute("SELECT MAX(id) FROM chunks").fetchone()
+        return row[0] if row[0] is not None else -1
+
+# chunk_tags kind -> the metadata field it is read from
+TAG_KINDS = {"department": "departments", "semester": "semesters"}
+
+def _chunk_tags(chunk_id: int, metadata: dict) -> List[Tuple[int, str, str]]:
+    """chunk_tags rows of a chunk, split the same way the context filter splits them"""
+    return [(int(chunk_id), kind, value) for kind, key in TAG_KINDS.items() for value in _as_list(metadata.get(key))]
+
+class VectorStore:
+    """FAISS index segments keyed by chunk id, plus a SQLite chunk store with a lexical index.
+
+    The index is a trained base segment plus small flat delta segments, each written once and
+    then memory-mapped read-only, so startup time does not depend on corpus size and several
+    uvicorn workers share one copy in the page cache. Deleted chunks are recorded as tombstones
+    and skipped at search time until compaction merges them away, so saving an update writes
+    only the new chunks and the deletions. A store that is serving queries is never modified:
+    updates go to a fork(), which collects new chunks in an in-memory delta and keeps its own
+    context filter, and save() writes them out under a new manifest version. The caller then
+    publishes the fork in place of the old store with a plain reference swap.
+    """
+
+    def __init__(self, path: str, embeddings, segments: List[Segment] = None, version: int = 0,
+                 chunks: ChunkStore = None, tombstones: Iterable[int] = (), tombstone_files: List[str] = None):
+        self.path = path
+        self.embeddings = embeddings
+        self.chunks = chunks or ChunkStore(os.path.join(path, CHUNKS_FILE))
+        self.segments: List[Segment] = list(segments or [])
+        self.version = version
+        # Deleted chunk ids that are still stored in a segment, and the files recording them
+        self.tombstones: Set[int] = set(tombstones)
+        self.tombstone_files: List[str] = list(tombstone_files or [])
+        self.context_filter = ContextFilterIndex()
+        self._next_id = self.chunks.max_id() + 1
+        # Chunks added since the last save; ids from _delta_start on live only in this index
+        self._delta = None
+        self._delta_start = self._next_id
+        self._new_tombstones: List[int] = []
+        # Set once a compaction has replaced segments, so save() folds the tombstones into one file
+        self._compacted = False
+        self._exclusion = None
+        # Chunk rows are deleted only once a snapshot without them has been published
+        self._deleted_ids: List[int] = []
+        # Metadata updates are written to the chunk rows only when this store is saved
+        self._pending_metadata: List[Tuple[List[int], dict]] = []
+
+    @classmethod
+    def load(cls, path: str, embeddings, read_only: bool = False) -> Optional["VectorStore"]:
+        """Open a saved knowledge base, or return None if there is none.
+
+        read_only is for workers that do not write the index: they neither migrate it nor
+        drop chunk rows the writer has added but not published yet.
+        """
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            if not read_only and os.path.exists(os.path.join(path, "index.pkl")):
+                return migrate_langchain_index(path, embeddings)
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        # Manifests written before segments existed name a single index file
+        segment_files = manifest.get("segments", [manifest["index_file"]] if "index_file" in manifest else [])
+        tombstone_files = manifest.get("tombstone_files", [])
+        tombstones = set()
+        for file_name in tombstone_files:
+            tombstones.update(int(chunk_id) for chunk_id in np.load(os.path.join(path, file_name)))
+        segments = [Segment(file_name, map_index(path, file_name)) for file_name in segment_files]
+        store = cls(path, embeddings, segments, manifest["version"], tombstones=tombstones,
+                    tombstone_files=tombstone_files)
+        if read_only and "next_id" in manifest:
+            # Rows from next_id on belong to an update the writer has not saved yet
+            store._next_id = store._delta_start = manifest["next_id"]
+        else:
+            # Never reuse the id of a tombstoned chunk whose row is already gone
+            store._next_id = store._delta_start = max(store._next_id, manifest.get("next_id", 0))
+        logger.info(f"Mapped index v{store.version} ({store.describe()}) with {store.ntotal} chunks")
+        if not read_only and store.chunks.count() != store.ntotal:
+            # Rows from a run that stopped between writing chunks and saving the index
+            store.chunks.retain(store.live_ids())
+            logger.info(f"Dropped chunk rows not in index v{store.version}")
+        store.context_filter = ContextFilterIndex.from_vectorstore(store)
+        return store
+
+    @classmethod
+    def create(cls, path: str, embeddings) -> "VectorStore":
+        """Start an empty knowledge base at path"""
+        os.makedirs(path, exist_ok=True)
+        return cls(path, embeddings)
+
+    def fork(self) -> "VectorStore":
+        """A store for applying updates while this one keeps serving queries unchanged"""
+        fork = VectorStore(self.path, self.embeddings, self.segments, self.version, self.chunks,
+                           self.tombstones, self.tombstone_files)
+        fork.context_filter = self.context_filter.copy()
+        fork._next_id = self._next_id
+        fork._delta = faiss.clone_index(self._delta) if self._delta is not None else None
+        fork._delta_start = self._delta_start
+        fork._new_tombstones = list(self._new_tombstones)
+        fork._compacted = self._compacted
+        fork._deleted_ids = list(self._deleted_ids)
+        fork._pending_metadata = list(self._pending_metadata)
+        return fork
+
+    def has_chunk(self, chunk_id: int) -> bool:
+        """Whether chunk_id is part of this version; the shared chunk rows also hold newer and deleted ones"""
+        return chunk_id < self._next_id and chunk_id not in self.tombstones
+
+    def _indexes(self) -> list:
+        """Every index a search fans out over: the saved segments and the unsaved delta"""
+        indexes = [segment.index for segment in self.segments]
+        if self._delta is not None:
+            indexes.append(self._delta)
+        return indexes
+
+    @property
+    def ntotal(self) -> int:
+        return sum(index.ntotal for index in self._indexes()) - len(self.tombstones)
+
+    def describe(self) -> str:
+        """Index type of the base segment and the number of delta segments"""
+        if not self.segments:
+            return "no segments"
+        base = describe_index(self.segments[0].index)
+        deltas = len(self.segments) - 1
+        return f"{base} + {deltas} delta segments" if deltas else base
+
+    def live_ids(self) -> np.ndarray:
+        """Every chunk id stored in a segment or the delta and not deleted"""
+        ids = [index_ids(index) for index in self._indexes()]
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        if self.tombstones:
+            ids = ids[~np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64))]
+        return ids
+
+    def _exclusion_selector(self):
+        """IDSelector skipping tombstoned chunks, or None when nothing is deleted"""
+        if not self.tombstones:
+            return None
+        exclusion = self._exclusion
+        if exclusion is None:
+            deleted = faiss.IDSelectorBatch(np.fromiter(self.tombstones, dtype=np.int64))
+            # IDSelectorNot does not own the selector it wraps, so keep both alive together
+            exclusion = self._exclusion = (faiss.IDSelectorNot(deleted), deleted)
+        return exclusion[0]
+
+    def search(self, query_vector, k: int, eligible: Optional[EligibleTier] = None) -> List[Tuple[int, float]]:
+        """(chunk id, L2 distance) of the k nearest chunks over all segments, optionally only eligible ones"""
+        indexes = [index for index in self._indexes() if index.ntotal]
+        if not indexes or k <= 0:
+            return []
+        if eligible is not None:
+            if len(eligible) == 0:
+                return []
+            # Eligible ids come from the context filter, which never holds deleted chunks
+            selector = eligible.selector()
+            k = min(k, len(eligible))
+        else:
+            selector = self._exclusion_selector()
+        query = np.asarray([query_vector], dtype=np.float32)
+        hits = []
+        for index in indexes:
+            distances, ids = index.search(query, k, params=search_parameters(index, selector))
+            hits.extend((int(chunk_id), float(distance)) for chunk_id, distance in zip(ids[0], distances[0])
+                        if chunk_id != -1)
+        return heapq.nsmallest(k, hits, key=lambda hit: hit[1])
+
+    def hybrid_search(self, query: str, query_vector, k: int, eligible: Optional[EligibleTier] = None
+                      ) -> List[Tuple[int, float]]:
+        """(chunk id, fused score) of the k best chunks by dense similarity and BM25 together"""
+        if not HYBRID_SEARCH:
+            return self.search(query_vector, k, eligible)
+        candidates = max(k, HYBRID_CANDIDATES)
+        dense = self.search(query_vector, candidates, eligible)
+        tags = eligible.tags if eligible is not None else None
+        # The chunk table is shared with the writer: skip rows added after this snapshot or deleted in it,
+        # and since tags are shared too, chunks this snapshot's context filter does not hold (yet or any more)
+        lexical = [(chunk_id, score) for chunk_id, score in self.chunks.keyword_search(query, candidates, tags)
+                   if self.has_chunk(chunk_id) and (eligible is None or chunk_id in eligible.ids)]
+        return fuse(dense, lexical, HYBRID_FUSION, HYBRID_DENSE_WEIGHT, RRF_K)[:k]
+
+    def get_documents(self, ids: Iterable[int]) -> List[Document]:
+        """Documents for chunk ids, skipping ids whose chunk no longer exists"""
+        return [doc for doc in self.chunks.get(ids) if doc is not None]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """Unfiltered similarity search for a text query"""
+        query_vector = self.embeddings.embed_query(query)
+        return self.get_documents([chunk_id for chunk_id, _ in self.hybrid_search(query, query_vector, k)])
+
+    def add_embeddings(self, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[dict]) -> List[int]:
+        """Add pre-computed embeddings with their chunk text and metadata; returns the new chunk ids"""
+        if not text_embeddings:
+            return []
+        texts = [text for text, _ in text_embeddings]
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        ids = list(range(self._next_id, self._next_id + len(texts)))
+        self._next_id += len(texts)
+
+        self.chunks.add(ids, texts, metadatas)
+        if self._delta is None:
+            self._delta = empty_index(vectors.shape[1])
+        self._delta.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+        for chunk_id, metadata in zip(ids, metadatas):
+            self.context_filter.add(chunk_id, metadata)
+        return ids
+
+    def update_file_metadata(self, file_name: str, metadata: dict) -> int:
+        """Re-tag one document's chunks in place, without re-embedding; returns the number of chunks.
+
+        Only this store's context filter changes now. The chunk rows and their tags are shared with
+        published snapshots and other workers, so save() rewrites them just before it switches the
+        manifest, which other workers reload their context filter from.
+        """
+        ids = self.chunks.ids_for_file(file_name)
+        if not ids:
+            return 0
+        self._pending_metadata.append((ids, metadata))
+        self.context_filter.discard(ids)
+        for chunk_id in ids:
+            self.context_filter.add(chunk_id, metadata)
+        return len(ids)
+
+    def delete(self, ids: Iterable[int]):
+        """Delete chunks by id; their rows stay readable by older snapshots until purge_deleted()
+
+        Unsaved chunks are removed from the delta outright; saved ones are tombstoned.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        unsaved = [chunk_id for chunk_id in ids if chunk_id >= self._delta_start]
+        saved = [chunk_id for chunk_id in ids if chunk_id < self._delta_start and chunk_id not in self.tombstones]
+        if unsaved and self._delta is not None:
+            self._delta = remove_ids(self._delta, unsaved)
+        if saved:
+            self.tombstones.update(saved)
+            self._new_tombstones.extend(saved)
+            self._exclusion = None
+        self.context_filter.discard(ids)
+        self._deleted_ids.extend(ids)
+
+    def purge_deleted(self):
+        """Delete the chunk rows of deleted chunks, once no published snapshot can return them"""
+        if self._deleted_ids:
+            self.chunks.delete(self._deleted_ids)
+            self._deleted_ids = []
+
+    def compaction_plan(self) -> Optional[Tuple[List[Segment], bool]]:
+        """Segments that should be merged now and whether as a full rebuild, see plan_compaction"""
+        return plan_compaction(self.segments, len(self.saved_tombstones()))
+
+    def saved_tombstones(self) -> Set[int]:
+        """Tombstones already written to disk; only these may be applied by a merge"""
+        return self.tombstones.difference(self._new_tombstones)
+
+    def replace_segments(self, merged: List[Segment], file_name: Optional[str], applied: Set[int]):
+        """Swap the output of merge_segments in for the segments it was built from.
+
+        Segments saved after the merge started are kept, after the merged one, and tombstones
+        recorded since then stay in force. The change is persisted by the next save().
+        """
+        replacement = []
+        if file_name is not None:
+            os.replace(os.path.join(self.path, file_name + PENDING_SUFFIX), os.path.join(self.path, file_name))
+            replacement.append(Segment(file_name, map_index(self.path, file_name)))
+        merged_files = {segment.file_name for segment in merged}
+        segments = []
+        for segment in self.segments:
+            if segment.file_name not in merged_files:
+                segments.append(segment)
+            elif replacement:
+                segments.append(replacement.pop())
+        self.segments = segments
+        self.tombstones -= applied
+        self._exclusion = None
+        self._compacted = True
+
+    def save(self):
+        """Write unsaved chunks as a delta segment and deletions as a tombstone file, then switch the manifest.
+
+        Earlier segments are left untouched, so an update costs time proportional to its size.
+        """
+        if self._delta is not None and self._delta.ntotal == 0:
+            self._delta = None
+        if self._delta is None and not self._new_tombstones and not self._compacted and not self._pending_metadata:
+            self._delta_start = self._next_id
+            return
+        os.makedirs(self.path, exist_ok=True)
+        version = self.version + 1
+
+        segments = self.segments
+        if self._delta is not None:
+            file_name = new_segment_file()
+            faiss.write_index(self._delta, os.path.join(self.path, file_name))
+            segments = segments + [Segment(file_name, map_index(self.path, file_name))]
+
+        tombstone_files = self.tombstone_files
+        if self._compacted:
+            # Fold what is left after a merge into one file
+            tombstone_files = [self._write_tombstones(version, self.tombstones)] if self.tombstones else []
+        elif self._new_tombstones:
+            tombstone_files = tombstone_files + [self._write_tombstones(version, self._new_tombstones)]
+
+        for ids, metadata in self._pending_metadata:
+            self.chunks.update_metadata(ids, metadata)
+
+        manifest_tmp = os.path.join(self.path, MANIFEST_FILE + ".tmp")
+        with open(manifest_tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": version,
+                "segments": [segment.file_name for segment in segments],
+                "segment_types": [describe_index(segment.index) for segment in segments],
+                "tombstone_files": tombstone_files,
+                "next_id": self._next_id,
+                "ntotal": sum(segment.ntotal for segment in segments) - len(self.tombstones)
+            }, f)
+        os.replace(manifest_tmp, os.path.join(self.path, MANIFEST_FILE))
+
+        self.segments = segments
+        self.tombstone_files = tombstone_files
+        self.version = version
+        self._delta = None
+        self._delta_start = self._next_id
+        self._new_tombstones = []
+        self._compacted = False
+        self._pending_metadata = []
+        logger.info(f"Saved vector index v{version} ({self.describe()}, {self.ntotal} chunks)")
+        self._remove_stale_files()
+
+    def _write_tombstones(self, version: int, ids: Iterable[int]) -> str:
+        file_name = TOMBSTONE_FILE_TEMPLATE.format(version=version)
+        np.save(os.path.join(self.path, file_name), np.fromiter(set(ids), dtype=np.int64))
+        return file_name
+
+    def _remove_stale_files(self):
+        """Delete segment and tombstone files the manifest no longer refers to"""
+        current = {segment.file_name for segment in self.segments} | set(self.tombstone_files)
+        for file_name in os.listdir(self.path):
+            # Merges in progress write under PENDING_SUFFIX, so they are never matched here
+            index_file = file_name.startswith(("segment-", "vectors-")) and file_name.endswith(".faiss")
+            tombstone_file = file_name.startswith("tombstones-") and file_name.endswith(".npy")
+            if (index_file or tombstone_file) and file_name not in current:
+                try:
+                    os.remove(os.path.join(self.path, file_name))
+                except OSError:
+                    # Still mapped somewhere (e.g. on Windows); a later save retries
+                    pass
+
+def saved_version(path: str) -> Optional[int]:
+    """Version of the index saved at path, or None if there is none yet"""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)["version"]
+    except FileNotFoundError:
+        return None
+
+def mmap_flags(file_path: str) -> int:
+    """Read flags that memory-map the index type stored in a segment file"""
+    with open(file_path, "rb") as f:
+        fourcc = f.read(4)
+    return IVF_MMAP_FLAGS if fourcc.startswith(IVF_FOURCC_PREFIX) else MMAP_FLAGS
+
+def map_index(path: str, file_name: str):
+    """Memory-map a saved segment read-only with the configured search parameters"""
+    file_path = os.path.join(path, file_name)
+    return configure_index(faiss.read_index(file_path, mmap_flags(file_path)))
+
+def migrate_langchain_index(path: str, embeddings) -> VectorStore:
+    """Convert a LangChain FAISS.save_local directory (index.faiss + pickled docstore) to the new format"""
+    from langchain_community.vectorstores import FAISS
+
+    logger.info(f"Migrating LangChain FAISS index at {path}")
+    legacy = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    positions = sorted(legacy.index_to_docstore_id)
+    try:
+        faiss.extract_index_ivf(legacy.index).make_direct_map()
+    except RuntimeError:
+        pass  # not an IVF index
+    vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+    docs = [legacy.docstore.search(legacy.index_to_docstore_id[position]) for position in positions]
+
+    store = VectorStore.create(path, embeddings)
+    store.chunks.add(positions, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+    # Saved as the base segment of the new layout
+    store._delta = build_index(vectors, describe_index(legacy.index), np.asarray(positions, dtype=np.int64))
+    store._next_id = len(positions)
+    store.save()
+    store.context_filter = ContextFilterIndex.from_vectorstore(store)
+    return store
@@ -0,0 +1,94 @@
+import functools
+
+import numpy as np
+import pytest
+
+from server import compaction, index_engine
+from server.compaction import merge_segments
+from server.vector_store import VectorStore
+
+DIM = 16
+
+def add_chunks(store: VectorStore, n: int, seed: int):
+    vectors = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    ids = store.add_embeddings([(f"chunk {seed}-{i}", vector) for i, vector in enumerate(vectors)],
+                               [{"file_name": f"file-{seed}.pdf"}] * n)
+    return ids, vectors
+
+def compact(store: VectorStore) -> int:
+    """Merge until nothing is left to merge, the way the compactor does; returns the number of merges"""
+    merges = 0
+    while (plan := store.compaction_plan()) is not None:
+        segments, full = plan
+        file_name, applied = merge_segments(store.path, segments, store.saved_tombstones(), full)
+        store.replace_segments(segments, file_name, applied)
+        store.save()
+        merges += 1
+    return merges
+
+@pytest.fixture
+def index_type(request, monkeypatch):
+    monkeypatch.setattr(compaction, "target_spec", functools.partial(index_engine.target_spec,
+                                                                     index_type=request.param))
+    return request.param
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_sq8"], indirect=True)
+def test_compaction_crosses_ivf_threshold(tmp_path, index_type):
+    store = VectorStore.create(str(tmp_path), None)
+    batches = []
+    for seed in range(8):
+        batches.append(add_chunks(store, 6000, seed))
+        store.save()
+        compact(store)
+
+    assert store.describe().startswith("IVF")
+    assert store.ntotal == 48000
+    loaded = VectorStore.load(str(tmp_path), None)
+    assert loaded.describe() == store.describe()
+    ids, vectors = batches[5]
+    assert loaded.search(vectors[7], 1)[0][0] == ids[7]
+
+def test_tombstones_hide_deleted_chunks_until_compaction(tmp_path):
+    store = VectorStore.create(str(tmp_path), None)
+    ids, vectors = add_chunks(store, 100, 0)
+    store.save()
+    store.delete(ids[:10])
+    store.save()
+
+    assert store.ntotal == 90
+    assert store.search(vectors[3], 1)[0][0] != ids[3]
+    loaded = VectorStore.load(str(tmp_path), None)
+    assert loaded.tombstones == set(ids[:10])
+    assert loaded.search(vectors[3], 1)[0][0] != ids[3]
+    assert loaded.search(vectors[50], 1)[0][0] == ids[50]
+
+    # 10% deleted is under TOMBSTONE_RATIO; deleting more triggers a rebuild that drops them
+    assert compact(store) == 0
+    store.delete(ids[10:30])
+    store.save()
+    assert compact(store) == 1
+    assert store.tombstones == set()
+    assert store.tombstone_files == []
+    assert store.segments[0].ntotal == 70
+    loaded = VectorStore.load(str(tmp_path), None)
+    assert loaded.ntotal == 70
+    assert loaded.search(vectors[50], 1)[0][0] == ids[50]
+
+def test_tombstones_recorded_during_a_merge_stay_in_force(tmp_path):
+    store = VectorStore.create(str(tmp_path), None)
+    ids, vectors = add_chunks(store, 100, 0)
+    store.save()
+    store.delete(ids[:30])
+    store.save()
+    segments, full = store.compaction_plan()
+    file_name, applied = merge_segments(store.path, segments, store.saved_tombstones(), full)
+    # Deleted after the merge read the segments
+    store.delete(ids[40:45])
+    store.replace_segments(segments, file_name, applied)
+    store.save()
+
+    assert store.tombstones == set(ids[40:45])
+    assert store.ntotal == 65
+    loaded = VectorStore.load(str(tmp_path), None)
+    assert loaded.ntotal == 65
+    assert loaded.search(vectors[42], 1)[0][0] != ids[42]
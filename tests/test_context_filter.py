@@ -0,0 +1,70 @@
+import numpy as np
+
+from server.context_filter import ContextFilterIndex
+from server.vector_store import VectorStore
+
+DIM = 8
+STUDENT = {"department": "CSE", "semester": "S3"}
+
+def test_tiers_are_cached_until_the_filter_changes():
+    context_filter = ContextFilterIndex()
+    context_filter.add(1, {"departments": "CSE, ECE", "semesters": "S3"})
+    context_filter.add(2, {"departments": "CSE", "semesters": "S5"})
+
+    tiers = context_filter.eligibility_tiers(STUDENT)
+    assert [set(tier.ids) for tier in tiers] == [{1}, {1, 2}, {1}]
+    assert context_filter.eligibility_tiers(STUDENT) is tiers
+    assert tiers[0].selector() is tiers[0].selector()
+
+    context_filter.add(3, {"departments": "CSE", "semesters": "S3"})
+    assert [set(tier.ids) for tier in context_filter.eligibility_tiers(STUDENT)] == [{1, 3}, {1, 2, 3}, {1, 3}]
+    context_filter.discard([1])
+    assert [set(tier.ids) for tier in context_filter.eligibility_tiers(STUDENT)] == [{3}, {2, 3}, {3}]
+
+def test_copy_does_not_share_cached_tiers():
+    context_filter = ContextFilterIndex()
+    context_filter.add(1, {"departments": "CSE", "semesters": "S3"})
+    tiers = context_filter.eligibility_tiers(STUDENT)
+    clone = context_filter.copy()
+    clone.add(2, {"departments": "CSE", "semesters": "S3"})
+
+    assert context_filter.eligibility_tiers(STUDENT) is tiers
+    assert set(clone.eligibility_tiers(STUDENT)[0].ids) == {1, 2}
+
+def test_search_fills_from_later_tiers_without_repeats(tmp_path):
+    store = VectorStore.create(str(tmp_path), None)
+    rng = np.random.default_rng(0)
+    metadatas = ([{"departments": "CSE", "semesters": "S3"}] * 2 + [{"departments": "CSE", "semesters": "S5"}] * 3
+                 + [{"departments": "ME", "semesters": "S3"}] * 3 + [{"departments": "ME", "semesters": "S1"}] * 4)
+    texts = [f"notes on topic {i}" for i in range(len(metadatas))]
+    ids = store.add_embeddings(list(zip(texts, rng.standard_normal((len(texts), DIM)).tolist())), metadatas)
+
+    docs = store.context_filter.search(store, "topic", rng.standard_normal(DIM), STUDENT, k=6)
+    found = [ids[texts.index(doc.page_content)] for doc in docs]
+
+    assert len(found) == len(set(found)) == 6
+    assert set(found[:2]) == set(ids[:2])
+    assert set(found[2:5]) == set(ids[2:5])
+    assert set(found[5:]) <= set(ids[5:8])
+
+def test_copy_shares_id_sets_until_one_side_changes_them():
+    context_filter = ContextFilterIndex()
+    context_filter.add(1, {"departments": "CSE, ECE", "semesters": "S3"})
+    context_filter.add(2, {"departments": "ME", "semesters": "S3"})
+    context_filter.add(5, {"departments": "EEE", "semesters": "S7"})
+    clone = context_filter.copy()
+    assert clone.by_department["CSE"] is context_filter.by_department["CSE"]
+
+    clone.add(3, {"departments": "CSE", "semesters": "S5"})
+    clone.discard([2])
+    clone.remove(1, {"departments": "ECE"})
+
+    assert context_filter.by_department == {"CSE": {1}, "ECE": {1}, "ME": {2}, "EEE": {5}}
+    assert context_filter.by_semester == {"S3": {1, 2}, "S7": {5}}
+    assert clone.by_department == {"CSE": {1, 3}, "ECE": set(), "ME": set(), "EEE": {5}}
+    assert clone.by_semester == {"S3": {1}, "S5": {3}, "S7": {5}}
+    # Only the sets the clone changed were copied
+    assert clone.by_department["EEE"] is context_filter.by_department["EEE"]
+    # The source copies a set it shared before changing it too
+    context_filter.add(4, {"departments": "EEE"})
+    assert clone.by_department["EEE"] == {5}
@@ -0,0 +1,45 @@
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.sentence_transformer.modules import Dense
+
+from server.embedding_backend import sentence_transformer
+from server.embedding_scheduler import EmbeddingScheduler
+
+class RecordingModel:
+    """Stands in for a SentenceTransformer: one token per word, records every encode() call"""
+    max_seq_length = 512
+
+    def __init__(self):
+        self.calls = []
+
+    def tokenizer(self, texts, **kwargs):
+        return {"input_ids": [text.split() for text in texts]}
+
+    def encode(self, texts, batch_size, show_progress_bar, **kwargs):
+        self.calls.append((list(texts), batch_size, kwargs))
+        return np.array([[float(len(text.split())), 1.0] for text in texts])
+
+def test_planned_batches_reach_encode_unsplit():
+    model = RecordingModel()
+    scheduler = EmbeddingScheduler(model, {"normalize_embeddings": True, "batch_size": 16},
+                                   token_budget=64, max_batch_size=128)
+    texts = [" ".join(["word"] * (1 + i % 4)) for i in range(60)] + ["word\nword " * 20]
+
+    vectors = scheduler.embed(texts)
+
+    planned = scheduler.plan_batches(scheduler.token_lengths(texts))
+    assert [len(batch) for batch, _, _ in model.calls] == [len(batch) for batch in planned]
+    assert max(len(batch) for batch in planned) > 16
+    assert all(batch_size == len(batch) for batch, batch_size, _ in model.calls)
+    assert all(kwargs == {"normalize_embeddings": True} for _, _, kwargs in model.calls)
+    # Newlines are replaced as embed_documents() would, and vectors come back in input order
+    assert "word word word" in model.calls[-1][0][0]
+    assert [vector[0] for vector in vectors] == [float(len(text.split())) for text in texts]
+
+def test_sentence_transformer_is_found_on_huggingface_embeddings():
+    model = SentenceTransformer(modules=[Dense(4, 4)])
+    embeddings = HuggingFaceEmbeddings.model_construct(encode_kwargs={})
+    embeddings._client = model
+
+    assert sentence_transformer(embeddings) is model
@@ -0,0 +1,61 @@
+import asyncio
+
+import numpy as np
+
+from server.index_follower import IndexFollower
+from server.index_lock import IndexLock
+from server.vector_store import VectorStore, saved_version
+
+def test_only_one_process_is_elected_writer(tmp_path):
+    first = IndexLock(str(tmp_path / "faiss_index"))
+    assert first.try_acquire() and first.held
+    second = IndexLock(str(tmp_path / "faiss_index"))
+    assert not second.try_acquire() and not second.held
+
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+def test_follower_reloads_new_versions_and_takes_over_from_an_exited_writer(tmp_path):
+    path = str(tmp_path)
+    writer_lock = IndexLock(path)
+    assert writer_lock.try_acquire()
+    writer = VectorStore.create(path, None)
+    vectors = np.random.default_rng(0).standard_normal((4, 8)).astype(np.float32)
+    writer.add_embeddings([("first", vectors[0].tolist())], [{"file_name": "a"}])
+    writer.save()
+
+    state = {"store": VectorStore.load(path, None, read_only=True), "elected": False}
+    loads = []
+
+    def reload(writable: bool):
+        loads.append(writable)
+        state["store"] = VectorStore.load(path, None, read_only=not writable)
+
+    def on_elected():
+        state["elected"] = True
+
+    async def run():
+        follower = IndexFollower(path, IndexLock(path), lambda: state["store"].version, reload, on_elected,
+                                 interval=0.01)
+        follower.start()
+        await asyncio.sleep(0.05)
+        assert loads == []
+
+        writer.add_embeddings([("second", vectors[1].tolist())], [{"file_name": "b"}])
+        writer.save()
+        for _ in range(100):
+            if loads:
+                break
+            await asyncio.sleep(0.01)
+        assert loads == [False]
+        assert state["store"].version == saved_version(path) == 2 and state["store"].ntotal == 2
+
+        writer_lock.release()
+        await asyncio.wait_for(follower._worker, 1)
+        assert loads == [False, True] and state["elected"]
+        assert follower.stats() == {"reloads": 1, "elected": True}
+        assert follower.lock.held
+        follower.lock.release()
+
+    asyncio.run(run())
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from server.llm_scheduler import LLMOverloaded, LLMScheduler
+
+PRIORITIES = ["classification", "chat", "research"]
+
+def scheduler(max_concurrent: int = 1, limits=None, queue_limits=None, max_wait=None) -> LLMScheduler:
+    return LLMScheduler(
+        max_concurrent, PRIORITIES,
+        limits or {"classification": 1, "chat": 1, "research": 1},
+        queue_limits or {"classification": 4, "chat": 4, "research": 4},
+        max_wait or {"classification": 5, "chat": 5, "research": 5},
+    )
+
+async def hold(llm: LLMScheduler, workload: str, order: list, release: asyncio.Event):
+    async with llm.slot(workload):
+        order.append(workload)
+        await release.wait()
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_full_queue_is_rejected_with_429():
+    async def run():
+        llm = scheduler(queue_limits={"classification": 1, "chat": 1, "research": 1})
+        release = asyncio.Event()
+        order = []
+        tasks = [asyncio.create_task(hold(llm, "chat", order, release)) for _ in range(2)]
+        await settle()
+        assert llm.stats()["workloads"]["chat"]["queued"] == 1
+
+        with pytest.raises(LLMOverloaded) as overloaded:
+            llm.admit("chat")
+        assert overloaded.value.status_code == 429
+        assert overloaded.value.headers()["Retry-After"] == "1"
+        # Other workloads have their own queues
+        assert llm.admit("research") == 1
+        release.set()
+        await asyncio.gather(*tasks)
+        assert llm.stats()["workloads"]["chat"]["rejected"] == 1
+
+    asyncio.run(run())
+
+def test_long_expected_wait_is_rejected_with_503():
+    llm = scheduler(max_wait={"classification": 5, "chat": 5, "research": 5})
+    llm._hold_time["chat"] = 10.0
+    llm._start("chat")
+
+    with pytest.raises(LLMOverloaded) as overloaded:
+        llm.admit("chat")
+    assert overloaded.value.status_code == 503
+    assert overloaded.value.retry_after == 10
+    # Nothing running for research, so it is admitted straight away
+    assert llm.expected_wait("research") == 0.0
+
+def test_freed_slot_goes_to_highest_priority_waiter():
+    async def run():
+        llm = scheduler()
+        first, rest = asyncio.Event(), asyncio.Event()
+        order = []
+        running = asyncio.create_task(hold(llm, "research", order, first))
+        await settle()
+        waiting = [asyncio.create_task(hold(llm, workload, order, rest))
+                   for workload in ["research", "chat", "classification"]]
+        await settle()
+        assert llm.running == 1 and order == ["research"]
+        assert llm.position("chat") == 2
+
+        first.set()
+        rest.set()
+        await asyncio.gather(running, *waiting)
+        assert order == ["research", "classification", "chat", "research"]
+        assert llm.running == 0
+
+    asyncio.run(run())
+
+def test_cancelled_and_timed_out_waiters_leave_the_queue():
+    async def run():
+        llm = scheduler(max_wait={"classification": 5, "chat": 0.05, "research": 5})
+        release = asyncio.Event()
+        order = []
+        running = asyncio.create_task(hold(llm, "research", order, release))
+        await settle()
+        cancelled = asyncio.create_task(hold(llm, "research", order, release))
+        await settle()
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert llm.stats()["workloads"]["research"]["queued"] == 0
+
+        with pytest.raises(LLMOverloaded) as overloaded:
+            await hold(llm, "chat", order, release)
+        assert overloaded.value.status_code == 503
+        assert llm.stats()["workloads"]["chat"]["queued"] == 0
+
+        release.set()
+        await running
+        assert llm.running == 0
+        async with llm.slot("chat"):
+            assert llm.running == 1
+
+    asyncio.run(run())
+
+def test_limit_blocked_higher_priority_waiter_does_not_hold_up_others():
+    async def run():
+        llm = scheduler(max_concurrent=4, limits={"classification": 1, "chat": 2, "research": 1})
+        release, chat_release = asyncio.Event(), asyncio.Event()
+        order = []
+        classifying = [asyncio.create_task(hold(llm, "classification", order, release)) for _ in range(2)]
+        await settle()
+        assert llm.running == 1 and llm.stats()["workloads"]["classification"]["queued"] == 1
+
+        # Classification is at its limit, so its queued call cannot use the 3 free slots
+        chat = asyncio.create_task(hold(llm, "chat", order, chat_release))
+        await settle()
+        assert order == ["classification", "chat"]
+        assert llm.running == 2
+
+        # Freed slots still go to the queued classification call first
+        release.set()
+        await asyncio.gather(*classifying)
+        assert order == ["classification", "chat", "classification"]
+        chat_release.set()
+        await chat
+        assert llm.running == 0
+
+    asyncio.run(run())
@@ -0,0 +1,243 @@
+import socket
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from server import ollama_pool
+from server.ollama_client import NDJSONDecoder, OllamaClient, OllamaError, OllamaStreamCut
+from server.ollama_pool import OllamaPool
+
+def unused_url() -> str:
+    """URL of a port nothing listens on, so connections to it are refused"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+def ollama_app(handler) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/api/generate", handler)
+    return app
+
+async def stream_lines(request: web.Request, lines) -> web.StreamResponse:
+    """Send NDJSON in awkward pieces: split mid-line and several lines at once"""
+    response = web.StreamResponse()
+    await response.prepare(request)
+    data = b"".join(lines)
+    for start in range(0, len(data), 7):
+        await response.write(data[start:start + 7])
+        await asyncio.sleep(0)
+    await response.write_eof()
+    return response
+
+async def answer(request: web.Request) -> web.Response:
+    return web.json_response({"response": "hello", "done": True})
+
+async def run_with_server(handler, test, urls=(), breaker_failures: int = 3, breaker_cooldown: float = 30):
+    """Run test(client, pool, server_backend) against a mock Ollama server plus extra backend urls"""
+    async with TestServer(ollama_app(handler)) as server:
+        server_url = str(server.make_url("")).rstrip("/")
+        pool = OllamaPool([*urls, server_url], 10, 1, breaker_failures, breaker_cooldown)
+        async with aiohttp.ClientSession() as session:
+            client = OllamaClient(session, pool, "test-model")
+            return await test(client, pool, pool.backends[-1])
+
+def test_connection_refused_fails_over_to_next_backend(monkeypatch):
+    # Tie-break towards the first, unreachable backend
+    monkeypatch.setattr(ollama_pool.random, "random", lambda: 0.0)
+
+    async def test(client, pool, live):
+        assert await client.generate("hi") == "hello"
+        return pool.backends[0], live
+
+    dead, live = asyncio.run(run_with_server(answer, test, urls=[unused_url()]))
+
+    assert (dead.errors, dead.failures, dead.outstanding) == (1, 1, 0)
+    assert (live.requests, live.errors, live.outstanding) == (1, 0, 0)
+
+def test_breaker_opens_then_trial_call_closes_it():
+    failures = {"left": 2}
+
+    async def flaky(request: web.Request) -> web.Response:
+        if failures["left"]:
+            failures["left"] -= 1
+            return web.Response(status=500, text="model crashed")
+        return await answer(request)
+
+    async def test(client, pool, backend):
+        for _ in range(2):
+            with pytest.raises(OllamaError, match="500"):
+                await client.generate("hi")
+        assert backend.to_dict()["circuit"] == "open"
+        with pytest.raises(OllamaError, match="No available Ollama backend"):
+            await client.generate("hi")
+
+        await asyncio.sleep(0.1)
+        assert await client.generate("hi") == "hello"
+        assert backend.to_dict()["circuit"] == "closed"
+        assert (backend.failures, backend.trial, backend.outstanding) == (0, False, 0)
+
+    asyncio.run(run_with_server(flaky, test, breaker_failures=2, breaker_cooldown=0.05))
+
+def test_cancelled_trial_call_releases_backend():
+    started = asyncio.Event()
+
+    async def hang(request: web.Request) -> web.Response:
+        started.set()
+        await asyncio.sleep(30)
+        return await answer(request)
+
+    async def test(client, pool, backend):
+        # Half-open: the cooldown is over, so the next call is the trial
+        backend.failures = 3
+        backend.open_until = 1.0
+        call = asyncio.create_task(client.generate("hi"))
+        await started.wait()
+        assert backend.trial and backend.outstanding == 1
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+        # A cancelled call says nothing about the backend: still open, but up for another trial
+        assert (backend.trial, backend.outstanding, backend.errors) == (False, 0, 0)
+        assert backend.to_dict()["circuit"] == "open"
+        assert pool.acquire("test-model") is backend
+
+    asyncio.run(run_with_server(hang, test))
+
+def test_cancelled_trial_stream_releases_backend_without_verdict():
+    first_piece = asyncio.Event()
+
+    async def hang_mid_stream(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(b'{"response": "Hel"}\n')
+        await asyncio.sleep(30)
+        return response
+
+    async def test(client, pool, backend):
+        backend.failures = 3
+        backend.open_until = 1.0
+
+        async def read():
+            async for _ in client.stream("hi"):
+                first_piece.set()
+
+        call = asyncio.create_task(read())
+        await first_piece.wait()
+        assert backend.trial and backend.outstanding == 1
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+        # Part of an answer is no proof the backend recovered, nor is the disconnect a failure
+        assert (backend.trial, backend.outstanding, backend.errors, backend.failures) == (False, 0, 0, 3)
+        assert backend.to_dict()["circuit"] == "open"
+
+    asyncio.run(run_with_server(hang_mid_stream, test))
+
+def test_generate_cancelled_while_reading_body_is_not_a_failure():
+    headers_sent = asyncio.Event()
+
+    async def hang_in_body(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(b'{"response": "he')
+        headers_sent.set()
+        await asyncio.sleep(30)
+        return response
+
+    async def test(client, pool, backend):
+        call = asyncio.create_task(client.generate("hi"))
+        await headers_sent.wait()
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert (backend.outstanding, backend.errors, backend.failures) == (0, 0, 0)
+
+    asyncio.run(run_with_server(hang_in_body, test))
+
+def test_read_timeout_after_sending_counts_as_failure():
+    async def slow(request: web.Request) -> web.Response:
+        await asyncio.sleep(5)
+        return await answer(request)
+
+    async def test(client, pool, backend):
+        with pytest.raises(aiohttp.ServerTimeoutError):
+            async for _ in client.stream("hi", read_timeout=0.1):
+                pass
+        assert (backend.outstanding, backend.errors, backend.failures) == (0, 1, 1)
+
+    asyncio.run(run_with_server(slow, test))
+
+def test_ndjson_decoder_joins_lines_split_across_chunks():
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b'{"response": "he') == []
+    assert decoder.feed(b'llo"}\n{"response": " wor') == [{"response": "hello"}]
+    assert decoder.feed(b'ld"}\n\n{"done": true}\n') == [{"response": " world"}, {"done": True}]
+    assert decoder.flush() == []
+
+def test_ndjson_decoder_skips_bad_lines_and_flushes_the_last_one():
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b'not json\n{"response": "a"}\r\n{"done": true}') == [{"response": "a"}]
+    assert decoder.flush() == [{"done": True}]
+    assert decoder.flush() == []
+
+def test_stream_yields_pieces_and_releases_backend():
+    async def generate(request: web.Request) -> web.StreamResponse:
+        return await stream_lines(request, [b'{"response": "Hel"}\n', b'{"response": "lo, "}\n',
+                                            b'{"response": "world"}\n', b'{"response": "", "done": true}'])
+
+    async def test(client, pool, backend):
+        pieces = [piece async for piece in client.stream("hi")]
+        assert pieces == ["Hel", "lo, ", "world"]
+        assert (backend.outstanding, backend.errors) == (0, 0)
+
+    asyncio.run(run_with_server(generate, test))
+
+def test_stream_cut_before_done_is_an_error():
+    async def generate(request: web.Request) -> web.StreamResponse:
+        return await stream_lines(request, [b'{"response": "Hel"}\n', b'{"response": "lo"}\n'])
+
+    async def test(client, pool, backend):
+        pieces = []
+        with pytest.raises(OllamaStreamCut):
+            async for piece in client.stream("hi"):
+                pieces.append(piece)
+        assert pieces == ["Hel", "lo"]
+        assert (backend.outstanding, backend.errors) == (0, 1)
+
+    asyncio.run(run_with_server(generate, test))
+
+def test_backend_is_ejected_only_after_consecutive_probe_failures():
+    tags = {"status": 500}
+
+    async def list_models(request: web.Request) -> web.Response:
+        if tags["status"] != 200:
+            return web.Response(status=tags["status"])
+        return web.json_response({"models": [{"name": "test-model"}]})
+
+    async def run():
+        app = ollama_app(answer)
+        app.router.add_get("/api/tags", list_models)
+        async with TestServer(app) as server:
+            pool = OllamaPool([str(server.make_url("")).rstrip("/")], 10, 1, 3, 30, probe_failures=3)
+            backend = pool.backends[0]
+            async with aiohttp.ClientSession() as session:
+                for _ in range(2):
+                    await pool._probe(session, backend)
+                assert backend.healthy and pool.acquire("test-model") is backend
+                pool.release(backend)
+
+                await pool._probe(session, backend)
+                assert not backend.healthy and pool.acquire("test-model") is None
+
+                tags["status"] = 200
+                await pool._probe(session, backend)
+                assert backend.healthy and backend.probe_failures == 0
+                assert backend.models == {"test-model:latest"}
+
+    asyncio.run(run())
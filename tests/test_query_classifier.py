@@ -0,0 +1,31 @@
+import pytest
+
+from server.query_classifier import QueryClassifier
+from server.utils import keyword_classification, local_classification
+
+EXEMPLARS = {"GENERAL": ["hello", "who are you"], "RAG": ["explain normalization", "module 3 of os"]}
+VECTORS = {"hello": [1.0, 0.0], "who are you": [0.9, 0.1], "explain normalization": [0.0, 1.0], "module 3 of os": [0.1, 0.9]}
+
+def classifier(min_margin) -> QueryClassifier:
+    return QueryClassifier(EXEMPLARS, lambda texts: [VECTORS[text] for text in texts], min_margin)
+
+@pytest.mark.parametrize("query", ["hi", "Hello there!", "thanks a lot :)", "hi, how are you?", "ok thanks, bye"])
+def test_greetings_and_thanks_alone_are_general(query):
+    assert keyword_classification(query) == "GENERAL"
+
+@pytest.mark.parametrize("query", ["hi, can you explain normalization in DBMS?", "thanks! what about module 3 of OS",
+                                   "what is this history of computing"])
+def test_greeting_in_front_of_a_question_is_left_to_the_classifiers(query):
+    assert keyword_classification(query) is None
+    assert local_classification(query, classifier(0.1), [0.1, 1.0]) == "RAG"
+
+def test_course_keywords_win_over_greetings():
+    assert keyword_classification("hi, what is in the syllabus?") == "RAG"
+
+def test_unset_margin_leaves_every_query_to_the_llm():
+    unset = classifier(None)
+    label, margin = unset.predict([0.0, 1.0])
+    assert label is None and margin > 0.5
+    assert local_classification("explain normalization", unset, [0.0, 1.0]) is None
+    assert unset.stats()["min_margin"] is None
+    assert classifier(0.5).predict([0.0, 1.0])[0] == "RAG"
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+
+import faiss
+import numpy as np
+import pytest
+
+from server.index_engine import build_index, describe_index, target_spec
+from server.vector_store import ChunkStore, VectorStore, map_index
+
+DIM = 16
+# Enough vectors for target_spec to pick IVF (512 lists) over Flat
+TRAINING_SIZE = 20000
+
+def random_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "ivf_sq8", "ivf_pq"])
+def test_segment_round_trips_through_mmap(tmp_path, index_type):
+    vectors = random_vectors(TRAINING_SIZE)
+    ids = np.arange(1000, 1000 + TRAINING_SIZE, dtype=np.int64)
+    spec = target_spec(TRAINING_SIZE, DIM, index_type)
+    assert spec.startswith("IVF") == index_type.startswith("ivf")
+    index = build_index(vectors, spec, ids)
+    faiss.write_index(index, os.path.join(tmp_path, "segment-test.faiss"))
+
+    mapped = map_index(str(tmp_path), "segment-test.faiss")
+
+    assert describe_index(mapped) == describe_index(index) == spec
+    assert mapped.ntotal == TRAINING_SIZE
+    queries = vectors[:5]
+    expected = index.search(queries, 3)[1]
+    assert np.array_equal(mapped.search(queries, 3)[1], expected)
+
+def test_store_reloads_saved_segments(tmp_path):
+    store = VectorStore.create(str(tmp_path), None)
+    vectors = random_vectors(10)
+    ids = store.add_embeddings([(f"chunk {i}", vector.tolist()) for i, vector in enumerate(vectors)],
+                               [{"file_name": "a.pdf"}] * 10)
+    store.save()
+
+    loaded = VectorStore.load(str(tmp_path), None)
+
+    assert loaded.ntotal == 10
+    assert loaded.search(vectors[3], 1)[0][0] == ids[3]
+
+def test_keyword_search_filters_by_tags(tmp_path):
+    chunks = ChunkStore(os.path.join(tmp_path, "chunks.sqlite"))
+    chunks.add([0, 1, 2], ["graph algorithms", "graph theory notes", "graph drawing"],
+               [{"departments": "CSE, ECE", "semesters": "S3"}, {"departments": "CSE", "semesters": "S5"},
+                {"departments": "ME", "semesters": "S3"}])
+
+    def matches(tags):
+        return {chunk_id for chunk_id, _ in chunks.keyword_search("graph", 10, tags)}
+
+    assert matches(None) == {0, 1, 2}
+    assert matches({"department": "CSE"}) == {0, 1}
+    assert matches({"department": "ECE", "semester": "S3"}) == {0}
+    assert matches({"semester": "S3"}) == {0, 2}
+
+    chunks.update_metadata([2], {"departments": "CSE"})
+    assert matches({"department": "CSE", "semester": "S3"}) == {0, 2}
+    chunks.delete([0])
+    assert matches({"department": "CSE"}) == {1, 2}
+
+def test_chunk_tags_are_built_for_existing_stores(tmp_path):
+    db_path = os.path.join(tmp_path, "chunks.sqlite")
+    ChunkStore(db_path).add([0, 1], ["graph algorithms", "graph drawing"],
+                            [{"departments": "CSE", "semesters": "S3"}, {"departments": "ME", "semesters": "S3"}])
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DROP TABLE chunk_tags")
+
+    chunks = ChunkStore(db_path)
+
+    assert [chunk_id for chunk_id, _ in chunks.keyword_search("graph", 10, {"department": "ME"})] == [1]
+
+def test_retag_reaches_chunk_rows_only_when_saved(tmp_path):
+    published = VectorStore.create(str(tmp_path), None)
+    vectors = random_vectors(4)
+    published.add_embeddings([(f"graph notes {i}", vector.tolist()) for i, vector in enumerate(vectors)],
+                             [{"file_name": "a", "departments": "CSE", "semesters": "S3"}] * 4)
+    published.save()
+    student = {"department": "CSE", "semester": "S3"}
+
+    def eligible_hits(store):
+        eligible = store.context_filter.eligibility_tiers(student)[0]
+        return len(store.hybrid_search("graph", vectors[0], 4, eligible))
+
+    fork = published.fork()
+    assert fork.update_file_metadata("a", {"departments": "ME"}) == 4
+    # The published snapshot keeps serving its old tags
+    assert eligible_hits(published) == 4
+    assert published.get_documents([0])[0].metadata["departments"] == "CSE"
+    assert [chunk_id for chunk_id, _ in published.chunks.keyword_search("graph", 4, {"department": "CSE"})]
+    assert eligible_hits(fork) == 0
+
+    fork.save()
+    assert fork.version == published.version + 1
+    assert fork.get_documents([0])[0].metadata["departments"] == "ME"
+    assert not fork.chunks.keyword_search("graph", 4, {"department": "CSE"})
+    assert len(fork.chunks.keyword_search("graph", 4, {"department": "ME"})) == 4
+
+def test_read_only_load_keeps_the_writers_unpublished_rows(tmp_path):
+    writer = VectorStore.create(str(tmp_path), None)
+    vectors = random_vectors(6)
+    saved = writer.add_embeddings([(f"graph notes {i}", vector.tolist()) for i, vector in enumerate(vectors[:4])],
+                                  [{"departments": "CSE", "semesters": "S3"}] * 4)
+    writer.save()
+    writer.delete(saved[:1])
+    writer.save()
+    # Rows of chunks added after the save and of the deleted chunk, as the writer leaves them mid-update
+    unsaved = writer.add_embeddings([(f"graph notes {i}", vector.tolist()) for i, vector in enumerate(vectors[4:], 4)],
+                                    [{"departments": "CSE", "semesters": "S3"}] * 2)
+
+    reader = VectorStore.load(str(tmp_path), None, read_only=True)
+
+    assert writer.chunks.count() == 6
+    eligible = reader.context_filter.eligibility_tiers({"department": "CSE", "semester": "S3"})[0]
+    assert set(eligible.ids) == set(saved[1:])
+    assert {chunk_id for chunk_id, _ in reader.hybrid_search("graph", vectors[0], 6)} == set(saved[1:])
+    assert not reader.has_chunk(unsaved[0]) and not reader.has_chunk(saved[0])
+
+    VectorStore.load(str(tmp_path), None)
+    assert writer.chunks.count() == 3